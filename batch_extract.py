@@ -0,0 +1,244 @@
+import os
+import json
+import time
+import logging
+import argparse
+
+import extract_data_topic_chunks as extractor
+from chunking import get_chunker, split_file
+from manifest import hash_text
+from topic_parser import parse_extracted_content
+
+BATCH_DIRECTORY = os.getenv("BATCH_DIRECTORY", ".llm_batches")  # Batch input files and the state of submitted batches
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "60"))  # Seconds between status checks
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_MAX_REQUESTS = int(os.getenv("BATCH_MAX_REQUESTS", "50000"))  # Requests per batch file, the usual provider limit
+BATCH_ENDPOINT = "/v1/chat/completions"
+
+FINISHED_STATUSES = {"completed", "failed", "expired", "cancelled"}
+
+
+def custom_id_for(filepath, chunk_index, chunk_hash, prompt_hash):
+    """Stable id of one chunk request: the same chunk and prompt always get the same id."""
+    return hash_text(os.path.abspath(filepath), str(chunk_index), chunk_hash, prompt_hash)[:32]
+
+
+class BatchClient:
+    """Files and batches endpoints of an OpenAI-compatible API, sharing the completions client's session."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def upload(self, path):
+        with open(path, 'rb') as file:
+            # The session's JSON content type is dropped so requests sets the multipart boundary
+            response = self.client.session.post(
+                f"{self.client.base_url}/files", data={"purpose": "batch"},
+                files={"file": (os.path.basename(path), file, "application/jsonl")},
+                headers={"Content-Type": None}, timeout=600,
+            )
+        response.raise_for_status()
+        return response.json()["id"]
+
+    def create(self, input_file_id):
+        response = self.client.post("/batches", {
+            "input_file_id": input_file_id,
+            "endpoint": BATCH_ENDPOINT,
+            "completion_window": BATCH_COMPLETION_WINDOW,
+        })
+        response.raise_for_status()
+        return response.json()
+
+    def get(self, batch_id):
+        response = self.client.session.get(f"{self.client.base_url}/batches/{batch_id}", timeout=60)
+        response.raise_for_status()
+        return response.json()
+
+    def iter_results(self, file_id):
+        """Yield the result lines of an output or error file without loading it whole."""
+        response = self.client.session.get(f"{self.client.base_url}/files/{file_id}/content", stream=True, timeout=600)
+        response.raise_for_status()
+        try:
+            for line in response.iter_lines():
+                if line:
+                    yield json.loads(line)
+        finally:
+            response.close()
+
+
+class BatchState:
+    """Submitted batches and the chunk behind every custom id, kept on disk so a later run can collect them."""
+
+    def __init__(self, directory=BATCH_DIRECTORY):
+        self.directory = directory
+        self.path = os.path.join(directory, "state.json")
+        os.makedirs(directory, exist_ok=True)
+        if os.path.exists(self.path):
+            with open(self.path, 'r', encoding='utf-8') as file:
+                self.batches = json.load(file)
+        else:
+            self.batches = []
+
+    def save(self):
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self.batches, file)
+        os.replace(temp_path, self.path)
+
+    def submitted_ids(self):
+        return {custom_id for batch in self.batches for custom_id in batch["requests"]}
+
+
+def pending_requests(directory, chunker, prompt_hash, document_version, submitted_ids):
+    """Yield (custom_id, request line, chunk reference) for every chunk that still needs a completion."""
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".txt"):
+            continue
+        filepath = os.path.join(directory, filename)
+        if extractor.manifest.is_current("extract", filepath, document_version):
+            continue
+        for chunk_index, (chunk, _, _) in enumerate(split_file(chunker, filepath)):
+            chunk_hash = hash_text(chunk)
+            if extractor.manifest.get_chunk_topics(filepath, chunk_index, chunk_hash, prompt_hash) is not None:
+                continue
+            custom_id = custom_id_for(filepath, chunk_index, chunk_hash, prompt_hash)
+            if custom_id in submitted_ids:
+                continue
+            payload = extractor.build_payload(chunk)
+            cached_response = extractor.response_cache.get(payload)
+            if cached_response is not None:
+                topics = parse_extracted_content(cached_response["choices"][0]["message"]["content"])
+                extractor.manifest.record_chunk(filepath, chunk_index, chunk_hash, prompt_hash, topics)
+                continue
+            line = {"custom_id": custom_id, "method": "POST", "url": BATCH_ENDPOINT, "body": payload}
+            yield custom_id, line, [filepath, chunk_index, chunk_hash]
+
+
+def submit_batches(batch_client, state, requests):
+    """Write pending requests to JSONL batch files of up to BATCH_MAX_REQUESTS lines and submit each."""
+    submitted = 0
+    batch_file, batch_requests = None, {}
+
+    def submit():
+        batch_file.close()
+        file_id = batch_client.upload(batch_file.name)
+        batch = batch_client.create(file_id)
+        state.batches.append({"id": batch["id"], "input_file": batch_file.name, "requests": batch_requests})
+        state.save()
+        logging.info(f"Submitted batch {batch['id']} with {len(batch_requests)} requests.")
+
+    for custom_id, line, chunk_reference in requests:
+        if batch_file is None:
+            batch_file = open(os.path.join(state.directory, f"batch-{time.strftime('%Y%m%d-%H%M%S')}-{len(state.batches)}.jsonl"), 'w', encoding='utf-8')
+            batch_requests = {}
+        batch_file.write(json.dumps(line, ensure_ascii=False) + "\n")
+        batch_requests[custom_id] = chunk_reference
+        submitted += 1
+        if len(batch_requests) >= BATCH_MAX_REQUESTS:
+            submit()
+            batch_file = None
+    if batch_file is not None:
+        submit()
+    return submitted
+
+
+def collect_batch(batch_client, batch, prompt_hash):
+    """Parse a finished batch's completions and record each chunk's topics in the manifest."""
+    status = batch_client.get(batch["id"])
+    if status["status"] not in FINISHED_STATUSES:
+        return False
+    if status["status"] != "completed":
+        logging.error(f"Batch {batch['id']} ended with status '{status['status']}'; its chunks will be resubmitted.")
+
+    recorded = failed = prompt_tokens = completion_tokens = 0
+    for file_id in (status.get("output_file_id"), status.get("error_file_id")):
+        if not file_id:
+            continue
+        for result in batch_client.iter_results(file_id):
+            chunk_reference = batch["requests"].get(result.get("custom_id"))
+            response = result.get("response") or {}
+            if chunk_reference is None or response.get("status_code") != 200:
+                failed += 1
+                continue
+            body = response["body"]
+            filepath, chunk_index, chunk_hash = chunk_reference
+            topics = parse_extracted_content(body["choices"][0]["message"]["content"])
+            extractor.manifest.record_chunk(filepath, chunk_index, chunk_hash, prompt_hash, topics)
+            usage = body.get("usage", {})
+            prompt_tokens += usage.get("prompt_tokens", 0)
+            completion_tokens += usage.get("completion_tokens", 0)
+            recorded += 1
+
+    logging.info(f"Batch {batch['id']}: {recorded} chunks recorded, {failed} failed, "
+                 f"{prompt_tokens} tokens sent, {completion_tokens} tokens received.")
+    return True
+
+
+def save_finished_documents(directory, output_directory, chunker, prompt_hash, document_version):
+    """Write every document whose chunks all have topics; documents with missing chunks wait for the next run."""
+    for filename in sorted(os.listdir(directory)):
+        if not filename.endswith(".txt"):
+            continue
+        filepath = os.path.join(directory, filename)
+        fingerprint = extractor.manifest.fingerprint("extract", filepath)
+        if extractor.manifest.is_current("extract", filepath, document_version, fingerprint):
+            continue
+        missing = sum(
+            extractor.manifest.get_chunk_topics(filepath, chunk_index, hash_text(chunk), prompt_hash) is None
+            for chunk_index, (chunk, _, _) in enumerate(split_file(chunker, filepath))
+        )
+        if missing:
+            logging.warning(f"{missing} chunks of {filename} have no batch result yet; it will be saved on a later run.")
+            continue
+        # Every chunk resumes from the manifest, so this merges and saves without any API request
+        all_topics, chunk_ranges, _ = extractor.extract_file_topics(filepath, chunker, prompt_hash, max_concurrent_requests=1)
+        extractor.save_file_topics(filepath, all_topics, output_directory, document_version, chunk_ranges, fingerprint=fingerprint)
+
+
+def run_batch(directory, output_directory, chunk_strategy=extractor.CHUNK_STRATEGY, wait=True, poll_interval=BATCH_POLL_INTERVAL):
+    """Collect earlier batches, submit the remaining chunks as new ones, and save finished documents.
+
+    With wait=False the run exits after submitting; running it again later
+    collects the results.
+    """
+    chunker = get_chunker(chunk_strategy, **extractor.CHUNKER_OPTIONS.get(chunk_strategy, {}))
+    prompt_hash, document_version = extractor.extraction_versions(chunk_strategy)
+    batch_client = BatchClient(extractor.completions_client)
+    state = BatchState()
+    os.makedirs(output_directory, exist_ok=True)
+
+    def collect_finished():
+        for batch in list(state.batches):
+            if collect_batch(batch_client, batch, prompt_hash):
+                state.batches.remove(batch)
+                state.save()
+
+    collect_finished()
+    requests = pending_requests(directory, chunker, prompt_hash, document_version, state.submitted_ids())
+    submitted = submit_batches(batch_client, state, requests)
+    logging.info(f"{submitted} chunk requests submitted; {len(state.batches)} batches in flight.")
+
+    while wait and state.batches:
+        time.sleep(poll_interval)
+        collect_finished()
+
+    save_finished_documents(directory, output_directory, chunker, prompt_hash, document_version)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract topics for every pending chunk through the provider's batch API.")
+    parser.add_argument("--input", default="input_data", help="Directory of partitioned .txt files")
+    parser.add_argument("--output", default="extracted_topics", help="Directory for extracted topic files")
+    parser.add_argument("--chunk-strategy", default=extractor.CHUNK_STRATEGY, choices=list(extractor.CHUNKER_OPTIONS))
+    parser.add_argument("--no-wait", action="store_true", help="Submit and exit; a later run collects the results")
+    parser.add_argument("--poll-interval", type=float, default=BATCH_POLL_INTERVAL)
+    args = parser.parse_args()
+
+    logging.info(f"Starting batch extraction of text files in directory: {args.input}")
+    try:
+        run_batch(args.input, args.output, args.chunk_strategy, wait=not args.no_wait, poll_interval=args.poll_interval)
+    except Exception as e:
+        logging.error(f"Processing interrupted due to error: {e}")
+    finally:
+        extractor.log_token_usage()
+        logging.info("Processing complete.")
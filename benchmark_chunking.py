@@ -0,0 +1,58 @@
+import os
+import time
+import argparse
+
+from chunking import get_chunker, count_tokens
+from extract_data_topic_chunks import CHUNKER_OPTIONS, prompt_template
+
+
+def benchmark_strategy(strategy, files):
+    """Chunk every file with one strategy and total up what the requests would cost."""
+    chunker = get_chunker(strategy, **CHUNKER_OPTIONS[strategy])
+    system_tokens = count_tokens(prompt_template.system)
+
+    requests_count = 0
+    chunk_tokens = 0
+    prompt_tokens = 0
+    start = time.perf_counter()
+    for filepath in files:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            for chunk in chunker.split(file):
+                requests_count += 1
+                chunk_tokens += count_tokens(chunk)
+                prompt_tokens += sum(count_tokens(message["content"]) for message in prompt_template.messages(chunk))
+    elapsed = time.perf_counter() - start
+
+    return {
+        "strategy": strategy,
+        "requests": requests_count,
+        "chunk_tokens": chunk_tokens,
+        "system_prompt_tokens": system_tokens * requests_count,
+        "prompt_tokens": prompt_tokens,
+        "seconds": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare request count and prompt tokens across chunking strategies.")
+    parser.add_argument("corpus", nargs="?", default="output_text_files", help="Directory of partitioned .txt files")
+    parser.add_argument("--strategies", nargs="+", default=list(CHUNKER_OPTIONS), help="Strategies to compare")
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.corpus, filename)
+        for filename in os.listdir(args.corpus)
+        if filename.endswith(".txt")
+    )
+    print(f"Corpus: {args.corpus} ({len(files)} files)")
+    print(f"{'strategy':<12} {'requests':>10} {'chunk tokens':>14} {'prompt overhead':>16} {'prompt tokens':>14} {'seconds':>9}")
+    for strategy in args.strategies:
+        result = benchmark_strategy(strategy, files)
+        print(
+            f"{result['strategy']:<12} {result['requests']:>10} {result['chunk_tokens']:>14} "
+            f"{result['system_prompt_tokens']:>16} {result['prompt_tokens']:>14} {result['seconds']:>9.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import os
+import time
+import argparse
+import tracemalloc
+from collections import Counter
+
+from unstructured.partition.html import partition_html
+
+from html_extract import iter_html_paragraphs
+
+
+def partition_html_paragraphs(html_file):
+    return [str(element) for element in partition_html(filename=html_file)]
+
+
+def stream_html_paragraphs(html_file):
+    with open(html_file, 'r', encoding='utf-8', errors='replace') as file:
+        return list(iter_html_paragraphs(file))
+
+
+EXTRACTORS = {
+    "partition_html": partition_html_paragraphs,
+    "stream": stream_html_paragraphs,
+}
+
+
+def measure(extract, html_file):
+    """Run one extractor on one file and return its paragraphs, seconds and peak traced memory (including the paragraphs)."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    paragraphs = extract(html_file)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return paragraphs, elapsed, peak
+
+
+def word_overlap(reference, candidate):
+    """Precision and recall of candidate's words against reference's, counting repeats."""
+    reference_words = Counter(" ".join(reference).lower().split())
+    candidate_words = Counter(" ".join(candidate).lower().split())
+    shared = sum((reference_words & candidate_words).values())
+    precision = shared / sum(candidate_words.values()) if candidate_words else 1.0
+    recall = shared / sum(reference_words.values()) if reference_words else 1.0
+    return precision, recall
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the streaming HTML extractor with partition_html on throughput, memory and text fidelity.")
+    parser.add_argument("corpus", help="Directory of .html/.htm files")
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.corpus, filename)
+        for filename in os.listdir(args.corpus)
+        if filename.lower().endswith((".html", ".htm"))
+    )
+    total_bytes = sum(os.path.getsize(filepath) for filepath in files)
+    print(f"Corpus: {args.corpus} ({len(files)} files, {total_bytes / 1e6:.1f} MB)")
+
+    totals = {name: {"seconds": 0.0, "peak": 0, "paragraphs": 0} for name in EXTRACTORS}
+    precisions, recalls = [], []
+    print(f"{'file':<40} {'extractor':<15} {'paragraphs':>10} {'seconds':>9} {'peak MB':>9}")
+    for filepath in files:
+        outputs = {}
+        for name, extract in EXTRACTORS.items():
+            paragraphs, elapsed, peak = measure(extract, filepath)
+            outputs[name] = paragraphs
+            totals[name]["seconds"] += elapsed
+            totals[name]["peak"] = max(totals[name]["peak"], peak)
+            totals[name]["paragraphs"] += len(paragraphs)
+            print(f"{os.path.basename(filepath)[:40]:<40} {name:<15} {len(paragraphs):>10} {elapsed:>9.2f} {peak / 1e6:>9.1f}")
+        precision, recall = word_overlap(outputs["partition_html"], outputs["stream"])
+        precisions.append(precision)
+        recalls.append(recall)
+
+    print(f"\n{'extractor':<15} {'paragraphs':>10} {'seconds':>9} {'MB/s':>8} {'max peak MB':>12}")
+    for name, total in totals.items():
+        throughput = total_bytes / 1e6 / total["seconds"] if total["seconds"] else 0.0
+        print(f"{name:<15} {total['paragraphs']:>10} {total['seconds']:>9.2f} {throughput:>8.1f} {total['peak'] / 1e6:>12.1f}")
+    if files:
+        print(f"\nStream text vs partition_html: word precision {sum(precisions) / len(files):.3f}, "
+              f"word recall {sum(recalls) / len(files):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+import time
+import random
+import argparse
+
+from topic_parser import parse_extracted_content, TopicStreamParser
+
+WORDS = "cannabis medicinal product quality requirement schedule clause section therapeutic goods order".split()
+
+
+def parse_extracted_content_legacy(content):
+    """The original parser, which grows each topic with repeated string concatenation."""
+    topics = {}
+    current_topic = None
+    lines = content.splitlines()
+
+    for line in lines:
+        line = line.strip()
+        if line.startswith("Topic_"):
+            current_topic = line
+            topics[current_topic] = ""
+        elif current_topic:
+            topics[current_topic] += line + "\n"
+
+    return topics
+
+
+def make_completion(size_bytes, topics, seed=0):
+    """Build a synthetic "Topic_" completion of roughly size_bytes spread over the given number of topics."""
+    rng = random.Random(seed)
+    lines = []
+    topic_size = size_bytes // topics
+    for i in range(topics):
+        lines.append(f"Topic_Section_{i}")
+        written = 0
+        while written < topic_size:
+            line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 16)))
+            lines.append(line)
+            written += len(line) + 1
+    return "\n".join(lines)
+
+
+def parse_streamed(content, fragment_size=64):
+    """Feed the completion in small fragments, as a streaming response would arrive."""
+    parser = TopicStreamParser()
+    topics = {}
+    for start in range(0, len(content), fragment_size):
+        topics.update(parser.feed(content[start:start + fragment_size]))
+    topics.update(parser.close())
+    return topics
+
+
+def time_parser(parse, content, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = parse(content)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the legacy and linear-time topic parsers on synthetic completions.")
+    parser.add_argument("--sizes-mb", type=float, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--topics", type=int, default=4, help="Topics per completion; fewer topics means longer bodies")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'size MB':>8} {'legacy s':>10} {'linear s':>10} {'streamed s':>11} {'speedup':>8}")
+    for size_mb in args.sizes_mb:
+        content = make_completion(int(size_mb * 1024 * 1024), args.topics)
+        legacy_seconds, expected = time_parser(parse_extracted_content_legacy, content, args.repeats)
+        linear_seconds, linear = time_parser(parse_extracted_content, content, args.repeats)
+        streamed_seconds, streamed = time_parser(parse_streamed, content, args.repeats)
+        assert linear == expected and streamed == expected, "Parsers disagree"
+        print(f"{size_mb:>8.1f} {legacy_seconds:>10.3f} {linear_seconds:>10.3f} {streamed_seconds:>11.3f} {legacy_seconds / linear_seconds:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
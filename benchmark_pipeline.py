@@ -0,0 +1,122 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import resource
+import tempfile
+import importlib
+import subprocess
+
+from mock_llm_server import MockCompletionsServer, add_server_arguments
+
+EXTRACTORS = ("extract_data_topic_chunks", "extract_data_topic")
+WORDS = "cannabis medicinal product quality requirement schedule clause section therapeutic goods order labelling storage".split()
+
+
+def make_corpus(directory, documents, document_kb, seed=0):
+    """Write `documents` synthetic partitioned text files of about document_kb KB each."""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    for i in range(documents):
+        paragraphs = []
+        size = 0
+        while size < document_kb * 1024:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) + "."
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        with open(os.path.join(directory, f"doc_{i:05d}.txt"), 'w', encoding='utf-8') as file:
+            file.write("\n\n".join(paragraphs))
+
+
+def run_one(module_name, corpus, output_directory):
+    """Run one extractor's process_text_files in this process and print its measurements as JSON."""
+    extractor = importlib.import_module(module_name)
+    documents = len([filename for filename in os.listdir(corpus) if filename.endswith(".txt")])
+
+    started = time.perf_counter()
+    extractor.process_text_files(corpus, output_directory)
+    elapsed = time.perf_counter() - started
+
+    totals = extractor.metrics.snapshot()
+    latency = extractor.metrics.summary()["latency"]
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_rss *= 1024  # Linux reports kilobytes, macOS bytes
+    print(json.dumps({
+        "extractor": module_name,
+        "documents": documents,
+        "requests": totals["requests"],
+        "failed": totals["failed"],
+        "retries": totals["retries"],
+        "seconds": elapsed,
+        "p50": latency[0.5],
+        "p95": latency[0.95],
+        "p99": latency[0.99],
+        "peak_rss": peak_rss,
+    }))
+
+
+def measure(module_name, corpus, workdir, base_url):
+    """Run one extractor over one corpus in a fresh process, so peak RSS and module state are its own."""
+    environment = dict(
+        os.environ,
+        OPENAI_BASE_URL=base_url,
+        OPENAI_API_KEY="benchmark",
+        DEFAULT_MODEL=os.getenv("DEFAULT_MODEL", "mock-model"),
+        # A throwaway cache and manifest, so every run does the full amount of work
+        LLM_CACHE_PATH=os.path.join(workdir, "responses.sqlite3"),
+        LLM_CACHE_BYPASS="1",
+        MANIFEST_PATH=os.path.join(workdir, "manifest.sqlite3"),
+        METRICS_SINK="",
+        LLM_QUIET="1",
+    )
+    output = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), "--run-one", module_name, corpus, os.path.join(workdir, "topics")],
+        env=environment, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True, check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark both extractors end to end against a local mock completions server.")
+    parser.add_argument("--documents", type=int, nargs="+", default=[5, 20, 80], help="Corpus sizes to run, in documents")
+    parser.add_argument("--document-kb", type=int, default=20, help="Approximate size of each synthetic document")
+    parser.add_argument("--extractors", nargs="+", default=list(EXTRACTORS), choices=EXTRACTORS)
+    parser.add_argument("--run-one", nargs=3, metavar=("MODULE", "CORPUS", "OUTPUT"), help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    if args.run_one:
+        run_one(*args.run_one)
+        return
+
+    server = MockCompletionsServer(latency=args.latency, jitter=args.jitter,
+                                   tokens_per_second=args.tokens_per_second, error_rate=args.error_rate).start()
+    print(f"Mock server at {server.base_url}: latency {args.latency}s + up to {args.jitter}s, "
+          f"{args.tokens_per_second or 'unlimited'} tokens/s, {args.error_rate:.0%} errors")
+    print(f"{'extractor':<26} {'docs':>5} {'requests':>8} {'seconds':>8} {'docs/s':>7} {'requests/s':>10} "
+          f"{'p50 s':>6} {'p95 s':>6} {'p99 s':>6} {'peak MB':>8} {'retries':>7}")
+    try:
+        with tempfile.TemporaryDirectory(prefix="benchmark-") as root:
+            for documents in args.documents:
+                for module_name in args.extractors:
+                    workdir = os.path.join(root, f"{module_name}-{documents}")
+                    corpus = os.path.join(workdir, "corpus")
+                    make_corpus(corpus, documents, args.document_kb)
+                    result = measure(module_name, corpus, workdir, server.base_url)
+                    seconds = result["seconds"] or float("inf")
+                    print(
+                        f"{module_name:<26} {result['documents']:>5} {result['requests']:>8} {result['seconds']:>8.2f} "
+                        f"{result['documents'] / seconds:>7.2f} {result['requests'] / seconds:>10.2f} "
+                        f"{result['p50']:>6.2f} {result['p95']:>6.2f} {result['p99']:>6.2f} "
+                        f"{result['peak_rss'] / 1e6:>8.1f} {result['retries']:>7}"
+                    )
+    finally:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+import os
+import argparse
+
+from chunking import get_chunker, count_tokens
+from extract_data_topic_chunks import CHUNKER_OPTIONS, CHUNK_STRATEGY
+from prompts import PACK_CHUNK_CHARS, TEMPLATES, can_pack, overhead_ratio, pack, prompt_tokens
+
+
+def build_requests(files, chunker, template, pack_chunk_chars):
+    """The (messages, texts) of every request one run would send; pack_chunk_chars of 0 sends every chunk alone."""
+    requests = []
+    short = []
+    for filepath in files:
+        with open(filepath, 'r', encoding='utf-8') as file:
+            for chunk in chunker.split(file):
+                if pack_chunk_chars and can_pack(chunk, pack_chunk_chars):
+                    short.append((None, chunk))
+                else:
+                    requests.append((template.messages(chunk), [chunk]))
+    for group in pack(short):
+        texts = [text for _, text in group]
+        messages = template.packed_messages(texts) if len(texts) > 1 else template.messages(texts[0])
+        requests.append((messages, texts))
+    return requests
+
+
+def benchmark_layout(label, files, chunker, template, pack_chunk_chars):
+    requests = build_requests(files, chunker, template, pack_chunk_chars)
+    total = sum(prompt_tokens(messages) for messages, _ in requests)
+    # The system message is the same on every request, so a prefix cache serves all but the first
+    prefix = sum(count_tokens(messages[0]["content"]) for messages, _ in requests)
+    return {
+        "layout": label,
+        "requests": len(requests),
+        "prompt_tokens": total,
+        "cacheable_prefix": prefix / total if total else 0.0,
+        "overhead": overhead_ratio(requests),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Report prompt overhead per request layout: the original prompt, the slim template, and packing.")
+    parser.add_argument("corpus", nargs="?", default="output_text_files", help="Directory of partitioned .txt files")
+    parser.add_argument("--strategy", default=CHUNK_STRATEGY, choices=list(CHUNKER_OPTIONS))
+    parser.add_argument("--pack-chunk-chars", type=int, default=PACK_CHUNK_CHARS or 1000, help="Chunks shorter than this share a request in the packed layout")
+    args = parser.parse_args()
+
+    files = sorted(
+        os.path.join(args.corpus, filename)
+        for filename in os.listdir(args.corpus)
+        if filename.endswith(".txt")
+    )
+    chunker = get_chunker(args.strategy, **CHUNKER_OPTIONS[args.strategy])
+    layouts = [
+        ("topics-v1 (before)", TEMPLATES["topics-v1"], 0),
+        ("topics-v2", TEMPLATES["topics-v2"], 0),
+        (f"topics-v2 packed <{args.pack_chunk_chars}", TEMPLATES["topics-v2"], args.pack_chunk_chars),
+    ]
+    print(f"Corpus: {args.corpus} ({len(files)} files, '{args.strategy}' chunks)")
+    print(f"{'layout':<26} {'requests':>9} {'prompt tokens':>14} {'overhead':>9} {'cacheable prefix':>17}")
+    for label, template, pack_chunk_chars in layouts:
+        result = benchmark_layout(label, files, chunker, template, pack_chunk_chars)
+        print(
+            f"{result['layout']:<26} {result['requests']:>9} {result['prompt_tokens']:>14} "
+            f"{result['overhead']:>9.1%} {result['cacheable_prefix']:>17.1%}"
+        )
+
+
+if __name__ == "__main__":
+    main()
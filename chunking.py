@@ -0,0 +1,321 @@
+import io
+import os
+import re
+import mmap
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+CHARS_PER_TOKEN = 4  # Fallback estimate when tiktoken is not installed
+TOKENIZER_ENCODING = "cl100k_base"
+PARAGRAPH_SEPARATOR = "\n\n"  # preprocess_files.save_to_file writes one element per paragraph
+READ_BLOCK_SIZE = 64 * 1024
+
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?;:])\s+")
+
+_encoding = None
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when available, otherwise estimate from the character count."""
+    global _encoding
+    if tiktoken is None:
+        return -(-len(text) // CHARS_PER_TOKEN)
+    if _encoding is None:
+        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+    return len(_encoding.encode(text, disallowed_special=()))
+
+
+def read_up_to(file, size):
+    """Read up to size characters, returning fewer only at end of file."""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = file.read(remaining)
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return "".join(parts)
+
+
+def iter_chunks(file, chunk_size, overlap_size):
+    """Yield overlapping chunks from an open text file, reading incrementally.
+
+    Only the current chunk is held in memory. The chunks are identical to
+    slicing the whole file with a stride of chunk_size - overlap_size.
+    """
+    if chunk_size <= 0 or not 0 <= overlap_size < chunk_size:
+        raise ValueError(f"Invalid chunking parameters: chunk_size={chunk_size}, overlap_size={overlap_size}")
+
+    buffer = read_up_to(file, chunk_size)
+    while buffer:
+        yield buffer
+
+        if len(buffer) < chunk_size:
+            return
+
+        # Carry the overlap forward and top the buffer back up to a full chunk
+        overlap = buffer[chunk_size - overlap_size:]
+        more = read_up_to(file, chunk_size - overlap_size)
+        if not more:
+            return
+        buffer = overlap + more
+
+
+def chunk_text(text, chunk_size, overlap_size):
+    """Splits the text into chunks with optional overlap."""
+    return list(iter_chunks(io.StringIO(text), chunk_size, overlap_size))
+
+
+class MappedText:
+    """Read-only memory map of a UTF-8 text file, decoded one slice at a time.
+
+    The file's bytes stay in the page cache, shared between processes,
+    instead of being copied into a str per worker. Offsets are byte offsets
+    into the file. Unlike text-mode open(), newlines are not translated;
+    partitioned files are written with "\n" only.
+    """
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        if os.fstat(self._file.fileno()).st_size:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._view = memoryview(self._map)
+        else:
+            # Empty files cannot be mapped
+            self._map = None
+            self._view = memoryview(b"")
+
+    def __len__(self):
+        return len(self._view)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, sub, start=0):
+        return self._map.find(sub, start) if self._map is not None else -1
+
+    def char_boundary(self, offset):
+        """First offset at or after offset that starts a UTF-8 character."""
+        while offset < len(self._view) and self._view[offset] & 0xC0 == 0x80:
+            offset += 1
+        return offset
+
+    def decode(self, start, end):
+        # Slicing a memoryview does not copy; the only copy made is the decoded str
+        return str(self._view[start:end], 'utf-8')
+
+    def close(self):
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+        self._file.close()
+
+
+def iter_mapped_chunks(text, chunk_size, overlap_size):
+    """Yield (chunk, byte_start, byte_end) from a MappedText, with the same chunks as iter_chunks.
+
+    Byte ranges are sized by characters, so each window is extended only by
+    the characters still missing and never ends inside a multibyte
+    character. Only the chunk itself is decoded.
+    """
+    if chunk_size <= 0 or not 0 <= overlap_size < chunk_size:
+        raise ValueError(f"Invalid chunking parameters: chunk_size={chunk_size}, overlap_size={overlap_size}")
+
+    size = len(text)
+    stride = chunk_size - overlap_size
+    start = 0
+    while start < size:
+        end = text.char_boundary(min(size, start + chunk_size))
+        chunk = text.decode(start, end)
+        # Multibyte characters make a chunk_size-byte window hold fewer than chunk_size characters
+        while len(chunk) < chunk_size and end < size:
+            more = text.char_boundary(min(size, end + chunk_size - len(chunk)))
+            chunk += text.decode(end, more)
+            end = more
+        yield chunk, start, end
+
+        if len(chunk) < chunk_size or end >= size:
+            return
+        # The next chunk starts where this one's overlap does
+        start = end - (overlap_size if len(chunk) == end - start else len(chunk[stride:].encode('utf-8')))
+
+
+def iter_mapped_paragraphs(text, separator=PARAGRAPH_SEPARATOR):
+    """Yield (paragraph, byte_start, byte_end) for the non-empty paragraphs of a MappedText."""
+    # "\n" never occurs inside a multibyte UTF-8 sequence, so searching the bytes splits like str.split
+    needle = separator.encode('utf-8')
+    start = 0
+    while True:
+        index = text.find(needle, start)
+        end = len(text) if index < 0 else index
+        paragraph = text.decode(start, end)
+        if paragraph.strip():
+            yield paragraph, start, end
+        if index < 0:
+            return
+        start = index + len(needle)
+
+
+def iter_paragraphs(file, separator=PARAGRAPH_SEPARATOR):
+    """Yield non-empty paragraphs from an open text file, reading it in blocks."""
+    remainder = ""
+    while True:
+        block = file.read(READ_BLOCK_SIZE)
+        if not block:
+            break
+        parts = (remainder + block).split(separator)
+        remainder = parts.pop()
+        for part in parts:
+            if part.strip():
+                yield part
+    if remainder.strip():
+        yield remainder
+
+
+def split_oversized(text, max_tokens):
+    """Split a paragraph that exceeds max_tokens at sentence boundaries, then by characters."""
+    pieces = []
+    for sentence in SENTENCE_BOUNDARY.split(text):
+        if count_tokens(sentence) <= max_tokens:
+            pieces.append(sentence)
+            continue
+        # A single sentence over budget (e.g. a flattened table) is cut at the estimated character width
+        width = max_tokens * CHARS_PER_TOKEN
+        while count_tokens(sentence[:width]) > max_tokens and width > 1:
+            width = width * 3 // 4
+        pieces.extend(sentence[i:i + width] for i in range(0, len(sentence), width))
+    return pieces
+
+
+class CharacterChunker:
+    """Fixed-width character chunks with overlap; the original chunking behaviour."""
+
+    name = "characters"
+
+    def __init__(self, chunk_size, overlap_size):
+        self.chunk_size = chunk_size
+        self.overlap_size = overlap_size
+
+    def split(self, file):
+        return iter_chunks(file, self.chunk_size, self.overlap_size)
+
+    def split_mapped(self, text):
+        return iter_mapped_chunks(text, self.chunk_size, self.overlap_size)
+
+
+class TokenBudgetChunker:
+    """Pack whole paragraphs into chunks of up to max_tokens.
+
+    Paragraphs are never cut unless a single one exceeds the budget, in
+    which case it is split at sentence boundaries. Because the model echoes
+    the chunk back verbatim, max_tokens should stay under the endpoint's
+    completion limit rather than its context window.
+    """
+
+    name = "tokens"
+
+    def __init__(self, max_tokens, overlap_tokens=0, separator=PARAGRAPH_SEPARATOR):
+        if max_tokens <= 0 or not 0 <= overlap_tokens < max_tokens:
+            raise ValueError(f"Invalid chunking parameters: max_tokens={max_tokens}, overlap_tokens={overlap_tokens}")
+        # Charged per unit so the joined chunk stays within budget
+        separator_tokens = count_tokens(separator)
+        if max_tokens <= separator_tokens:
+            raise ValueError(f"Invalid chunking parameters: max_tokens={max_tokens} leaves no room for text after the {separator_tokens}-token separator")
+        self.max_tokens = max_tokens
+        self.overlap_tokens = overlap_tokens
+        self.separator = separator
+        self.separator_tokens = separator_tokens
+
+    def _units(self, paragraphs):
+        """(text, tokens, byte_start, byte_end) per paragraph, or per piece of an oversized one."""
+        budget = self.max_tokens - self.separator_tokens
+        for paragraph, start, end in paragraphs:
+            tokens = count_tokens(paragraph)
+            if tokens <= budget:
+                yield paragraph, tokens + self.separator_tokens, start, end
+                continue
+            position, offset = 0, start
+            for piece in split_oversized(paragraph, budget):
+                piece_start = piece_end = None
+                if start is not None:
+                    # Pieces are substrings of the paragraph, in order
+                    found = paragraph.find(piece, position)
+                    offset += len(paragraph[position:found].encode('utf-8'))
+                    piece_start, piece_end = offset, offset + len(piece.encode('utf-8'))
+                    position, offset = found + len(piece), piece_end
+                yield piece, count_tokens(piece) + self.separator_tokens, piece_start, piece_end
+
+    def _overlap(self, units):
+        """Trailing units of the previous chunk that fit in overlap_tokens."""
+        carried = []
+        total = 0
+        for unit in reversed(units):
+            if total + unit[1] > self.overlap_tokens:
+                break
+            carried.insert(0, unit)
+            total += unit[1]
+        return carried, total
+
+    def _join(self, units):
+        return self.separator.join(unit[0] for unit in units), units[0][2], units[-1][3]
+
+    def _pack(self, units_iter):
+        """Yield (chunk, byte_start, byte_end); the offsets are None when the units have none."""
+        units = []
+        total = 0
+        fresh = False  # Whether the buffer holds anything beyond the carried overlap
+        for unit in units_iter:
+            tokens = unit[1]
+            if units and fresh and total + tokens > self.max_tokens:
+                yield self._join(units)
+                units, total = self._overlap(units)
+                fresh = False
+            # Drop carried overlap that would push the next unit over budget
+            while units and total + tokens > self.max_tokens:
+                total -= units.pop(0)[1]
+            units.append(unit)
+            total += tokens
+            fresh = True
+        if fresh:
+            yield self._join(units)
+
+    def split(self, file):
+        paragraphs = ((paragraph, None, None) for paragraph in iter_paragraphs(file, self.separator))
+        return (chunk for chunk, _, _ in self._pack(self._units(paragraphs)))
+
+    def split_mapped(self, text):
+        return self._pack(self._units(iter_mapped_paragraphs(text, self.separator)))
+
+
+CHUNKERS = {
+    CharacterChunker.name: CharacterChunker,
+    TokenBudgetChunker.name: TokenBudgetChunker,
+}
+
+
+def get_chunker(strategy, **options):
+    """Build the chunking strategy registered under strategy."""
+    try:
+        chunker_class = CHUNKERS[strategy]
+    except KeyError:
+        raise ValueError(f"Unknown chunking strategy '{strategy}'. Choose from: {', '.join(CHUNKERS)}")
+    return chunker_class(**options)
+
+
+def read_mapped_text(filepath):
+    """Whole file as one str, decoded straight from a memory map without an intermediate bytes copy."""
+    with MappedText(filepath) as text:
+        return text.decode(0, len(text))
+
+
+def split_file(chunker, filepath):
+    """Yield (chunk, byte_start, byte_end) for a text file, reading it through a memory map."""
+    with MappedText(filepath) as text:
+        yield from chunker.split_mapped(text)
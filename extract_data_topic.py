@@ -1,21 +1,23 @@
 import os
-import requests
-import json
 import logging
-import shutil
-import os
 from dotenv import load_dotenv
 
+# The cache, client and metrics modules read their settings on import
+load_dotenv()
+
+from response_cache import ResponseCache
+from llm_client import CompletionsClient, send_completion
+from chunking import read_mapped_text
+from manifest import Manifest, hash_text
+from topic_parser import parse_extracted_content
+from topic_writer import get_writer
+from metrics import LLM_QUIET, RequestMetrics, request_context
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-total_tokens_sent = 0
-total_tokens_received = 0
-
 MAX_FILENAME_LENGTH = 255
 
-load_dotenv()
-
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY") 
@@ -26,22 +28,13 @@ headers = {
     "Authorization": f"Bearer {OPENAI_API_KEY}"
 }
 
-def create_messages(system_url, user_url, input_data):
-    """Create messages for API request."""
-    system_content = system_url
-    user_file_content = user_url
-
-    system_message = {"role": "system", "content": system_content}
-    user_message = {"role": "user", "content": user_file_content + "\n" + input_data}
-    return [system_message, user_message]
-
-def extract_information_from_text(text):
-
-    global total_tokens_sent, total_tokens_received
+response_cache = ResponseCache()
+completions_client = CompletionsClient(OPENAI_BASE_URL, headers)
+manifest = Manifest()
+# Per-request latency, tokens and retries; also holds the run's token totals
+metrics = RequestMetrics()
 
-    logging.info("Preparing the request payload.")
-
-    prompt_3= """ <|eot_id|><|start_header_id|>system<|end_header_id|>
+SYSTEM_PROMPT = """ <|eot_id|><|start_header_id|>system<|end_header_id|>
     # Objective:
     You are an AI language model tasked with extracting topics and their related text from a given document. 
 
@@ -70,46 +63,42 @@ def extract_information_from_text(text):
     <|eot_id|><|start_header_id|>user<|end_header_id|>
     """
 
+def create_messages(system_url, user_url, input_data):
+    """Create messages for API request."""
+    system_content = system_url
+    user_file_content = user_url
+
+    system_message = {"role": "system", "content": system_content}
+    user_message = {"role": "user", "content": user_file_content + "\n" + input_data}
+    return [system_message, user_message]
+
+def extract_information_from_text(text, on_text=None):
+    """Send text to the API and return the completion. on_text receives the completion text as it arrives."""
+
+    logging.info("Preparing the request payload.")
+
     prompt_4 = """The following document contains legal information regarding medical cannabis in Australia. Remove all unneccessary information that may have been extracted in the scraping process. Keep the information as it is. There should be no information lost from the document. Start a new topic with "Topic_"."""  
     user_url = ""
     
-    messages = create_messages(prompt_3, user_url, text)
-
-    response = requests.post(
-        f"{OPENAI_BASE_URL}/chat/completions",
-        json={
-            "model": DEFAULT_MODEL,
-            "messages": messages,
-            "temperature": 0.0,
-            "top_p": 1,
-            "frequency_penalty": 0.1,
-            "presence_penalty": 0.1,
-        },
-        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-        timeout=150
-    )
-
-    logging.info("Sending request to the API.")
-    response.raise_for_status()
-    print(response.json()["choices"][0]["message"]["content"])
-
-    if response.status_code == 200:
-        logging.info("API request successful.")
-        logging.info(f"API Response: {response.json()}")  # Log the full response
-
-        token_usage = response.json().get("usage", {})
-        total_tokens_sent += token_usage.get("prompt_tokens", 0)
-        total_tokens_received += token_usage.get("completion_tokens", 0)
-
-        return response.json()
-    else:
-        logging.error(f"Error: {response.status_code}")
-        logging.error(response.text)
-        return None
+    messages = create_messages(SYSTEM_PROMPT, user_url, text)
+
+    payload = {
+        "model": DEFAULT_MODEL,
+        "messages": messages,
+        "temperature": 0.0,
+        "top_p": 1,
+        "frequency_penalty": 0.1,
+        "presence_penalty": 0.1,
+    }
+
+    return send_completion(completions_client, payload, response_cache, metrics, on_text, quiet=LLM_QUIET)
 
-# Function to save extracted information into topic-based text files
 def save_topics_to_files(topics, output_directory, original_filename):
+    """Save topics to text files and return the paths written."""
     logging.info(f"Saving extracted topics to files in directory: {output_directory}")
+    # Names already taken, by this run or another document's outputs, get a _N suffix instead of being overwritten
+    writer = get_writer(output_directory)
+    saved_files = []
     
     # Join all the content together to check the total length
     total_content = ""
@@ -121,94 +110,92 @@ def save_topics_to_files(topics, output_directory, original_filename):
 
     if len(total_content) < 1800:
         # If total content is less than 1800 characters, save it all in one file
-        filename = f"Topic_{original_filename}_{first_topic}.txt"
+        filename = writer.unique_filename(f"Topic_{original_filename}_{first_topic}.txt")
         
         # Check if the filename exceeds the maximum length
         if len(filename) > MAX_FILENAME_LENGTH:
             logging.warning(f"Filename '{filename}' exceeds the maximum length of {MAX_FILENAME_LENGTH} characters. Skipping file creation.")
-            return
+            return saved_files
         
-        filepath = os.path.join(output_directory, filename)
-        with open(filepath, 'w', encoding='utf-8') as file:
-            file.write(total_content)
+        filepath = writer.write_text(filename, total_content)
         logging.info(f"Saved {filepath}")
+        saved_files.append(filepath)
     else:
         # If total content is 1800 characters or more, save each topic in a separate file
         for topic, content in topics.items():
-            filename = f"{topic.replace(' ', '_').replace(':', '').replace('/', '_')}.txt"
+            filename = writer.unique_filename(f"{topic.replace(' ', '_').replace(':', '').replace('/', '_')}.txt")
             
             if len(filename) > MAX_FILENAME_LENGTH:
                 logging.warning(f"Filename '{filename}' exceeds the maximum length of {MAX_FILENAME_LENGTH} characters. Skipping file creation.")
                 continue
             
-            filepath = os.path.join(output_directory, filename)
-            with open(filepath, 'w', encoding='utf-8') as file:
-                file.write(f"{topic}\n\n{content}")
+            filepath = writer.write_text(filename, f"{topic}\n\n{content}")
             logging.info(f"Saved {filepath}")
+            saved_files.append(filepath)
+
+    return saved_files
 
 # Main function to process all text files in a directory
 def process_text_files(directory, output_directory):
     logging.info(f"Ensuring output directory exists: {output_directory}")
     os.makedirs(output_directory, exist_ok=True)
 
-    done_directory = os.path.join(directory, "done")
-    os.makedirs(done_directory, exist_ok=True)
+    document_version = hash_text(SYSTEM_PROMPT, DEFAULT_MODEL or "")
 
     for filename in os.listdir(directory):
         if filename.endswith(".txt"):
             filepath = os.path.join(directory, filename)
+            # Taken before the file is read and recorded with its topics, so a mid-run edit is picked up next time
+            fingerprint = manifest.fingerprint("extract", filepath)
+            if manifest.is_current("extract", filepath, document_version, fingerprint):
+                logging.info(f"Skipping unchanged file: {filename}")
+                continue
+
             logging.info(f"Processing file: {filename}")
-            with open(filepath, 'r', encoding='utf-8') as file:
-                text = file.read()
-                logging.info(f"Extracting information from {filename} using the API.")
+            # The whole document goes into one request, so it is decoded once, straight from a memory map
+            text = read_mapped_text(filepath)
+            logging.info(f"Extracting information from {filename} using the API.")
 
-                # Extract topics and related text using the API
+            # Extract topics and related text using the API
+            with request_context(document=filename):
                 result = extract_information_from_text(text)
-                
-                if result:
-                    # Assuming the model returns a structured JSON with topics and content
-                    content = result.get("choices", [])[0].get("message", {}).get("content", "")
-                    if content:
-                        logging.info(f"Parsing extracted content from {filename}.")
-                        topics = parse_extracted_content(content)  # Parse the content into a dictionary
-                        save_topics_to_files(topics, output_directory, filename.replace('.txt', ''))
-                    else:
-                        logging.warning(f"No topics found in {filename}.")
-                else:
-                    logging.error(f"Failed to extract information from {filename}.")
-
-            shutil.move(filepath, os.path.join(done_directory, filename))
-            logging.info(f"Moved processed file '{filename}' to 'done' folder.")
-
-def parse_extracted_content(content):
-    logging.info("Parsing extracted content into topics.")
-    topics = {}
-    current_topic = None
-    lines = content.splitlines()
-
-    for line in lines:
-        line = line.strip()
-        if line.startswith("Topic_"):
-            current_topic = line
-            topics[current_topic] = ""
-        elif current_topic:
-            topics[current_topic] += line + "\n"
-
-    return topics
+
+            if not result:
+                # Left unrecorded so the next run retries it
+                logging.error(f"Failed to extract information from {filename}.")
+                continue
+
+            # Outputs from a previous version of this document are replaced, not duplicated.
+            # A file another document also lists is left alone.
+            writer = get_writer(output_directory)
+            for stale_file in manifest.get_own_outputs("extract", filepath):
+                writer.remove(stale_file)
+
+            saved_files = []
+            # Assuming the model returns a structured JSON with topics and content
+            content = result.get("choices", [])[0].get("message", {}).get("content", "")
+            if content:
+                logging.info(f"Parsing extracted content from {filename}.")
+                topics = parse_extracted_content(content)  # Parse the content into a dictionary
+                saved_files = save_topics_to_files(topics, output_directory, filename.replace('.txt', ''))
+            else:
+                logging.warning(f"No topics found in {filename}.")
+            manifest.record_document("extract", filepath, document_version, saved_files, fingerprint)
 
 def log_token_usage():
-    logging.info(f"Total tokens sent: {total_tokens_sent}")
-    logging.info(f"Total tokens received: {total_tokens_received}")
-    logging.info(f"Total tokens used: {total_tokens_sent + total_tokens_received}")
-
-directory = "input_data"  
-output_directory = "extracted_topics"   
-
-logging.info(f"Starting processing of text files in directory: {directory}")
-try:
-    process_text_files(directory, output_directory)
-except Exception as e:
-    logging.error(f"Processing interrupted due to error: {e}")
-finally:
-    log_token_usage()
-    logging.info("Processing complete.")
+    metrics.log_summary()
+    metrics.close()
+    response_cache.log_stats()
+
+if __name__ == "__main__":
+    directory = "input_data"  
+    output_directory = "extracted_topics"   
+
+    logging.info(f"Starting processing of text files in directory: {directory}")
+    try:
+        process_text_files(directory, output_directory)
+    except Exception as e:
+        logging.error(f"Processing interrupted due to error: {e}")
+    finally:
+        log_token_usage()
+        logging.info("Processing complete.")
@@ -1,146 +1,180 @@
 import os
-import requests
 import json
 import logging
-import shutil
-import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
+# Before the local imports, which read their settings from the environment when imported
+load_dotenv()
+
+from response_cache import ResponseCache
+import llm_client
+from llm_client import CompletionsClient
+from chunking import get_chunker, split_file
+from manifest import Manifest, hash_text
+from topic_parser import TopicStreamParser, parse_extracted_content
+from topic_merge import TopicMerger
+from topic_writer import get_writer
+from metrics import LLM_QUIET, RequestMetrics, request_context
+from scheduler import SCHEDULER_POLICY, SCHEDULER_PRIORITIES, ChunkScheduler, Document, parse_priorities, priority_for
+from prompts import PACK_CHUNK_CHARS, can_pack, get_template, pack, split_packed_completion
+
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-total_tokens_sent = 0
-total_tokens_received = 0
-
 MAX_FILENAME_LENGTH = 255
 CHUNK_SIZE = 2000  # Define the chunk size
 OVERLAP_SIZE = 200  # Define the overlap size
+CHUNK_STRATEGY = os.getenv("CHUNK_STRATEGY", "characters")  # "characters" or "tokens"
+CHUNK_TOKEN_BUDGET = int(os.getenv("CHUNK_TOKEN_BUDGET", "3000"))  # Target tokens per chunk for the "tokens" strategy
 
-load_dotenv()
+TOPIC_OUTPUT_FORMAT = os.getenv("TOPIC_OUTPUT_FORMAT", "files")  # "files", or one "jsonl"/"parquet" file per document
+
+CHUNKER_OPTIONS = {
+    "characters": {"chunk_size": CHUNK_SIZE, "overlap_size": OVERLAP_SIZE},
+    "tokens": {"max_tokens": CHUNK_TOKEN_BUDGET},
+}
 
 OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")
 DEFAULT_MODEL = os.getenv("DEFAULT_MODEL")
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")  
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", "4"))  # Maximum in-flight API requests
 
 headers = {
     "Content-Type": "application/json",
     "Authorization": f"Bearer {OPENAI_API_KEY}"
 }
 
-def create_messages(system_url, user_url, input_data):
-    """Create messages for API request."""
-    system_content = system_url
-    user_file_content = user_url
-
-    system_message = {"role": "system", "content": system_content}
-    user_message = {"role": "user", "content": user_file_content + "\n" + input_data}
-    return [system_message, user_message]
-
-def get_unique_filename(directory, base_filename):
-    """Generate a unique filename by appending a counter if the file already exists."""
-    counter = 1
-    filename = base_filename
-    filepath = os.path.join(directory, filename)
-    
-    # Increment the counter until a unique filename is found
-    while os.path.exists(filepath):
-        filename = f"{os.path.splitext(base_filename)[0]}_{counter}{os.path.splitext(base_filename)[1]}"
-        filepath = os.path.join(directory, filename)
-        counter += 1
-    
-    return filename
-
-def extract_information_from_text(text):
-    global total_tokens_sent, total_tokens_received
-
+response_cache = ResponseCache()
+completions_client = CompletionsClient(OPENAI_BASE_URL, headers)
+manifest = Manifest()
+# Per-request latency, tokens and retries; also holds the run's token totals
+metrics = RequestMetrics()
+
+# Versioned prompt with the fixed instructions first, so endpoints with prefix caching can reuse them
+prompt_template = get_template()
+
+def build_payload(text, messages=None):
+    """The /chat/completions request body that extracts the topics of text."""
+    return {
+        "model": DEFAULT_MODEL,
+        "messages": messages or prompt_template.messages(text),
+        "temperature": 0.0,
+        "top_p": 1,
+        "frequency_penalty": 0.1,
+        "presence_penalty": 0.1,
+    }
+
+def extract_information_from_text(text, on_text=None):
+    """Send text to the API and return the completion. on_text receives the completion text as it arrives."""
     logging.info("Preparing the request payload.")
+    return send_completion(build_payload(text), on_text)
 
-    prompt_3 = """ system
-    # Objective:
-    You are an AI language model tasked with extracting topics and their related text from a given document. 
-
-    Your task is to identify distinct topics based on the content of the document. For each identified topic, extract **all** relevant information exactly as it appears in the document, without summarizing or altering the text. Each piece of information should be placed under the appropriate topic header.
-
-    # Output Format:
-    The output should be structured in the following format:
-
-    Topic_[Name of Topic_1]
-    [All information related to this topic, including any subtopics or examples, exactly as they appear in the document.]
-
-    If there are multiple topics, the output should continue with:
-
-    Topic_[Name of Another Topic_2]
-    [All information related to this second topic, exactly as it appears in the document.]
-
-    Ensure that:
-    1. **No information is summarized or omitted** during extraction.
-    2. Each topic is distinct and clearly separated.
-    3. Subtopics or examples are grouped under the relevant main topic.
-    4. The information is copied verbatim from the document, retaining the original wording, structure, and details.
-    5. Every topic starts with "Topic_"
-
-    Output only the extracted topics and their full content. Do not include any code, explanations, or implementation details. Please ensure the output is clear, well-organized, and strictly follows the specified format.
-
-    user
-    """
-
-    user_url = ""
-    
-    messages = create_messages(prompt_3, user_url, text)
-
-    response = requests.post(
-        f"{OPENAI_BASE_URL}/chat/completions",
-        json={
-            "model": DEFAULT_MODEL,
-            "messages": messages,
-            "temperature": 0.0,
-            "top_p": 1,
-            "frequency_penalty": 0.1,
-            "presence_penalty": 0.1,
-        },
-        headers={"Authorization": f"Bearer {OPENAI_API_KEY}"},
-        timeout=150
-    )
-
-    logging.info("Sending request to the API.")
-    response.raise_for_status()
-    print(response.json()["choices"][0]["message"]["content"])
-
-    if response.status_code == 200:
-        logging.info("API request successful.")
-        logging.info(f"API Response: {response.json()}")  # Log the full response
+def send_completion(payload, on_text=None):
+    """Return the completion for payload from the cache or the API, recording its metrics."""
+    return llm_client.send_completion(completions_client, payload, response_cache, metrics, on_text, quiet=LLM_QUIET)
 
-        token_usage = response.json().get("usage", {})
-        total_tokens_sent += token_usage.get("prompt_tokens", 0)
-        total_tokens_received += token_usage.get("completion_tokens", 0)
-
-        return response.json()
-    else:
-        logging.error(f"Error: {response.status_code}")
-        logging.error(response.text)
+def extract_chunk_topics(chunk):
+    """Extract and parse the topics of one chunk. Returns None if the request failed."""
+    # Topics are parsed as the completion arrives, which matters when streaming
+    parser = TopicStreamParser()
+    topics = {}
+    result = extract_information_from_text(chunk, on_text=lambda text: topics.update(parser.feed(text)))
+    if not result:
         return None
+    topics.update(parser.close())
+    return topics
 
-def chunk_text(text, chunk_size, overlap_size):
-    """Splits the text into chunks with optional overlap."""
-    chunks = []
-    start = 0
-    text_length = len(text)
-
-    while start < text_length:
-        end = start + chunk_size
-        chunk = text[start:end]
-        chunks.append(chunk)
-
-        if end >= text_length:
-            break
-
-        # Move the start back by the overlap size
-        start = end - overlap_size
-
-    return chunks
+def extract_packed_topics(texts):
+    """Extract the topics of several short texts in one request. Parts the completion does not mark clearly are None."""
+    logging.info(f"Sending {len(texts)} short chunks in one packed request.")
+    result = send_completion(build_payload(None, prompt_template.packed_messages(texts)))
+    if not result:
+        return [None] * len(texts)
+    parts = split_packed_completion(result["choices"][0]["message"]["content"], len(texts))
+    return [parse_extracted_content(part) if part is not None else None for part in parts]
+
+def extract_packed_chunks(items, prompt_hash):
+    """Topics of several short chunks, given as (filepath, chunk_index, chunk), extracted in one packed request.
+
+    Chunks finished by an earlier run come from the manifest. The result
+    holds None for chunks the completion left out, and for a lone chunk
+    that is not worth packing, so the caller sends those on their own.
+    """
+    results = [None] * len(items)
+    missing = []
+    for i, (filepath, chunk_index, chunk) in enumerate(items):
+        chunk_hash = hash_text(chunk)
+        results[i] = manifest.get_chunk_topics(filepath, chunk_index, chunk_hash, prompt_hash)
+        if results[i] is None:
+            missing.append((i, filepath, chunk_index, chunk_hash, chunk))
+    if len(missing) < 2:
+        return results
+
+    documents = sorted({os.path.basename(filepath) for _, filepath, _, _, _ in missing})
+    with request_context(document=", ".join(documents), chunk="packed"):
+        packed_topics = extract_packed_topics([chunk for _, _, _, _, chunk in missing])
+    for (i, filepath, chunk_index, chunk_hash, _), topics in zip(missing, packed_topics):
+        if topics is not None:
+            manifest.record_chunk(filepath, chunk_index, chunk_hash, prompt_hash, topics)
+            results[i] = topics
+    return results
+
+def extract_small_chunks(filepaths, chunker, prompt_hash, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, pack_chunk_chars=PACK_CHUNK_CHARS):
+    """Extract the short chunks of several files, such as small documents and final chunks, in packed requests.
+
+    Topics are recorded per chunk in the manifest, so extract_file_topics
+    resumes them without a request of its own. Chunks a packed completion
+    leaves out are simply sent on their own later.
+    """
+    def short_chunks():
+        for filepath in filepaths:
+            for chunk_index, (chunk, _, _) in enumerate(split_file(chunker, filepath)):
+                if not can_pack(chunk, pack_chunk_chars):
+                    continue
+                if manifest.get_chunk_topics(filepath, chunk_index, hash_text(chunk), prompt_hash) is None:
+                    yield (filepath, chunk_index, chunk), chunk
+
+    def extract_group(group):
+        return extract_packed_chunks([item for item, _ in group], prompt_hash)
+
+    groups = (group for group in pack(short_chunks()) if len(group) > 1)
+    packed = missing = 0
+    # Packed requests share the pool size of the per-chunk requests
+    for results in extract_chunks(groups, max_concurrent_requests, extract_group):
+        missing += results.count(None)
+        packed += len(results) - results.count(None)
+    if packed or missing:
+        logging.info(f"Extracted {packed} short chunks in packed requests; {missing} were left out and will be sent on their own.")
+
+def extract_chunks(chunks, max_concurrent_requests, extract=extract_information_from_text):
+    """Apply extract to chunks with up to max_concurrent_requests in flight, yielding results in chunk order."""
+    if max_concurrent_requests <= 1:
+        for chunk in chunks:
+            yield extract(chunk)
+        return
+
+    with ThreadPoolExecutor(max_workers=max_concurrent_requests) as executor:
+        # Chunks are pulled lazily, so at most max_concurrent_requests are read ahead of the oldest result
+        pending = deque()
+        try:
+            for chunk in chunks:
+                pending.append(executor.submit(extract, chunk))
+                if len(pending) >= max_concurrent_requests:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            # Don't send the remaining chunks if the caller stopped early or a request failed
+            for future in pending:
+                future.cancel()
 
 def save_topics_to_files(topics, output_directory, original_filename):
+    """Save topics to text files and return the paths written."""
     logging.info(f"Saving extracted topics to files in directory: {output_directory}")
+    writer = get_writer(output_directory)
+    saved_files = []
     
     # Join all the content together to check the total length
     total_content = ""
@@ -155,104 +189,181 @@ def save_topics_to_files(topics, output_directory, original_filename):
         base_filename = f"Topic_{original_filename}_{first_topic}.txt"
         
         # Ensure unique filename
-        filename = get_unique_filename(output_directory, base_filename)
+        filename = writer.unique_filename(base_filename)
         
         # Check if the filename exceeds the maximum length
         if len(filename) > MAX_FILENAME_LENGTH:
             logging.warning(f"Filename '{filename}' exceeds the maximum length of {MAX_FILENAME_LENGTH} characters. Skipping file creation.")
-            return
+            return saved_files
         
-        filepath = os.path.join(output_directory, filename)
-        with open(filepath, 'w', encoding='utf-8') as file:
-            file.write(total_content)
+        filepath = writer.write_text(filename, total_content)
         logging.info(f"Saved {filepath}")
+        saved_files.append(filepath)
     else:
         # If total content is 1800 characters or more, save each topic in a separate file
         for topic, content in topics.items():
             base_filename = f"{topic.replace(' ', '_').replace(':', '').replace('/', '_')}.txt"
             
             # Ensure unique filename
-            filename = get_unique_filename(output_directory, base_filename)
+            filename = writer.unique_filename(base_filename)
             
             # Check if the filename exceeds the maximum length
             if len(filename) > MAX_FILENAME_LENGTH:
                 logging.warning(f"Filename '{filename}' exceeds the maximum length of {MAX_FILENAME_LENGTH} characters. Skipping file creation.")
                 continue
             
-            filepath = os.path.join(output_directory, filename)
-            with open(filepath, 'w', encoding='utf-8') as file:
-                file.write(f"{topic}\n\n{content}")
+            filepath = writer.write_text(filename, f"{topic}\n\n{content}")
             logging.info(f"Saved {filepath}")
+            saved_files.append(filepath)
+
+    return saved_files
+
+def extraction_versions(chunk_strategy):
+    """Hashes identifying the prompt (per chunk) and the prompt plus chunking setup (per document)."""
+    # Hashed as before so topics-v1 keeps the manifests written by earlier versions
+    prompt_hash = hash_text(prompt_template.system, DEFAULT_MODEL or "")
+    document_version = hash_text(prompt_hash, chunk_strategy, json.dumps(CHUNKER_OPTIONS.get(chunk_strategy, {}), sort_keys=True))
+    return prompt_hash, document_version
+
+def extract_or_resume(filepath, chunk_index, chunk, prompt_hash):
+    """Topics of one chunk, reused from the manifest if an earlier, interrupted run finished it."""
+    chunk_hash = hash_text(chunk)
+    topics = manifest.get_chunk_topics(filepath, chunk_index, chunk_hash, prompt_hash)
+    if topics is None:
+        with request_context(document=os.path.basename(filepath), chunk=chunk_index):
+            topics = extract_chunk_topics(chunk)
+        if topics is not None:
+            manifest.record_chunk(filepath, chunk_index, chunk_hash, prompt_hash, topics)
+    return topics
 
-def process_text_files(directory, output_directory):
-    logging.info(f"Ensuring output directory exists: {output_directory}")
-    os.makedirs(output_directory, exist_ok=True)
-
-    done_directory = os.path.join(directory, "done")
-    os.makedirs(done_directory, exist_ok=True)
+def extract_file_topics(filepath, chunker, prompt_hash, max_concurrent_requests=MAX_CONCURRENT_REQUESTS):
+    """Chunk one text file and extract its topics. Returns (all_topics, chunk_ranges, failed_chunks).
 
+    chunk_ranges maps each topic to [first chunk, last chunk, first byte, last byte] of the source it came from.
+    """
+    filename = os.path.basename(filepath)
+
+    def extract_indexed_chunk(indexed_chunk):
+        chunk_index, (chunk, byte_start, byte_end) = indexed_chunk
+        return extract_or_resume(filepath, chunk_index, chunk, prompt_hash), (byte_start, byte_end)
+
+    logging.info(f"Chunking text from {filename} using the '{chunker.name}' strategy.")
+
+    # The file is memory-mapped and only the chunks in flight are decoded
+    chunks = split_file(chunker, filepath)
+
+    logging.info(f"Extracting chunks from {filename} with up to {max_concurrent_requests} concurrent requests.")
+
+    # Repeated headers are appended to rather than overwritten, and overlap-window text is dropped
+    merger = TopicMerger()
+    failed_chunks = 0
+    try:
+        # Results come back in chunk order, so topics merge exactly as in a serial run
+        for i, (topics, byte_range) in enumerate(extract_chunks(enumerate(chunks), max_concurrent_requests, extract_indexed_chunk)):
+            logging.info(f"Processing chunk {i+1} for file: {filename}")
+
+            if topics is None:
+                logging.error(f"Failed to extract information from chunk {i+1}.")
+                failed_chunks += 1
+            elif topics:
+                merger.add_chunk(topics, i, byte_range)  # Combine all topics from chunks
+            else:
+                logging.warning(f"No topics found in chunk {i+1}.")
+    finally:
+        # Unmaps the file even if a request raised
+        chunks.close()
+
+    logging.info(f"Deduplicated {merger.bytes_deduplicated} bytes of overlapping text in {filename}.")
+    return merger.topics, merger.chunk_ranges, failed_chunks
+
+def save_file_topics(filepath, all_topics, output_directory, document_version, chunk_ranges=None, output_format=TOPIC_OUTPUT_FORMAT,
+                     fingerprint=None):
+    """Replace a document's previous outputs with its topics and record it in the manifest.
+
+    fingerprint is the manifest fingerprint taken when the document was found to need extracting.
+    """
+    writer = get_writer(output_directory)
+    # Outputs from a previous version of this document are replaced, not duplicated
+    for stale_file in manifest.get_own_outputs("extract", filepath):
+        writer.remove(stale_file)
+
+    saved_files = []
+    if all_topics:
+        original_filename = os.path.basename(filepath).replace('.txt', '')
+        if output_format == "files":
+            saved_files = save_topics_to_files(all_topics, output_directory, original_filename)
+        else:
+            saved_files = [writer.write_document(original_filename, all_topics, chunk_ranges, output_format)]
+    manifest.record_document("extract", filepath, document_version, saved_files, fingerprint)
+    return saved_files
+
+def pending_files(directory, document_version):
+    """The .txt files in directory whose topics are missing or out of date, mapped to their manifest fingerprint.
+
+    The fingerprint is taken before the file is read and recorded with its
+    topics, so a file that changes during the run is extracted again next time.
+    """
+    filepaths = {}
     for filename in os.listdir(directory):
         if filename.endswith(".txt"):
             filepath = os.path.join(directory, filename)
-            logging.info(f"Processing file: {filename}")
-            with open(filepath, 'r', encoding='utf-8') as file:
-                text = file.read()
-                logging.info(f"Chunking text from {filename}.")
-                
-                chunks = chunk_text(text, CHUNK_SIZE, OVERLAP_SIZE)
-
-                all_topics = {}
-                for i, chunk in enumerate(chunks):
-                    logging.info(f"Processing chunk {i+1}/{len(chunks)} for file: {filename}")
-                    # Extract topics and related text using the API
-                    result = extract_information_from_text(chunk)
-                    
-                    if result:
-                        content = result.get("choices", [])[0].get("message", {}).get("content", "")
-                        if content:
-                            logging.info(f"Parsing extracted content from chunk {i+1}/{len(chunks)}.")
-                            topics = parse_extracted_content(content)
-                            all_topics.update(topics)  # Combine all topics from chunks
-                        else:
-                            logging.warning(f"No topics found in chunk {i+1}/{len(chunks)}.")
-                    else:
-                        logging.error(f"Failed to extract information from chunk {i+1}/{len(chunks)}.")
-                
-                if all_topics:
-                    save_topics_to_files(all_topics, output_directory, filename.replace('.txt', ''))
-
-            shutil.move(filepath, os.path.join(done_directory, filename))
-            logging.info(f"Moved processed file '{filename}' to 'done' folder.")
-
-def parse_extracted_content(content):
-    logging.info("Parsing extracted content into topics.")
-    topics = {}
-    current_topic = None
-    lines = content.splitlines()
+            fingerprint = manifest.fingerprint("extract", filepath)
+            if manifest.is_current("extract", filepath, document_version, fingerprint):
+                logging.info(f"Skipping unchanged file: {filename}")
+                continue
+            filepaths[filepath] = fingerprint
+    return filepaths
 
-    for line in lines:
-        line = line.strip()
-        if line.startswith("Topic_"):
-            current_topic = line
-            topics[current_topic] = ""
-        elif current_topic:
-            topics[current_topic] += line + "\n"
+def process_text_files(directory, output_directory, max_concurrent_requests=MAX_CONCURRENT_REQUESTS, chunk_strategy=CHUNK_STRATEGY,
+                       policy=SCHEDULER_POLICY, priorities=SCHEDULER_PRIORITIES):
+    """Extract every pending document, interleaving their chunks by policy and saving each one as soon as it finishes."""
+    chunker = get_chunker(chunk_strategy, **CHUNKER_OPTIONS.get(chunk_strategy, {}))
+    prompt_hash, document_version = extraction_versions(chunk_strategy)
 
-    return topics
+    logging.info(f"Ensuring output directory exists: {output_directory}")
+    os.makedirs(output_directory, exist_ok=True)
+
+    fingerprints = pending_files(directory, document_version)
+    filepaths = sorted(fingerprints)
+
+    priority_rules = parse_priorities(priorities)
+    documents = [Document(filepath, order, priority_for(os.path.basename(filepath), priority_rules)) for order, filepath in enumerate(filepaths)]
+    logging.info(f"Scheduling {len(documents)} files with the '{policy}' policy and up to {max_concurrent_requests} concurrent requests.")
+
+    def save_document(document):
+        logging.info(f"Deduplicated {document.merger.bytes_deduplicated} bytes of overlapping text in {document.filename}.")
+        if document.failed_chunks:
+            # Nothing is written until every chunk succeeds; the next run retries only the failed chunks
+            logging.warning(f"{document.failed_chunks} chunks of {document.filename} failed; the file will be resumed on the next run.")
+            return
+        save_file_topics(document.filepath, document.merger.topics, output_directory, document_version, document.merger.chunk_ranges,
+                         fingerprint=fingerprints[document.filepath])
+
+    scheduler = ChunkScheduler(policy, max_concurrent_requests)
+    scheduler.run(
+        documents,
+        split=lambda filepath: split_file(chunker, filepath),
+        extract=lambda document, chunk_index, chunk: extract_or_resume(document.filepath, chunk_index, chunk, prompt_hash),
+        on_complete=save_document,
+        # Short chunks are packed across documents and sent through the same pool
+        can_pack=(lambda chunk: can_pack(chunk, PACK_CHUNK_CHARS)) if PACK_CHUNK_CHARS else None,
+        extract_packed=lambda items: extract_packed_chunks([(document.filepath, chunk_index, chunk) for document, chunk_index, chunk in items], prompt_hash),
+    )
 
 def log_token_usage():
-    logging.info(f"Total tokens sent: {total_tokens_sent}")
-    logging.info(f"Total tokens received: {total_tokens_received}")
-    logging.info(f"Total tokens used: {total_tokens_sent + total_tokens_received}")
-
-directory = "input_data"  
-output_directory = "extracted_topics"   
-
-logging.info(f"Starting processing of text files in directory: {directory}")
-try:
-    process_text_files(directory, output_directory)
-except Exception as e:
-    logging.error(f"Processing interrupted due to error: {e}")
-finally:
-    log_token_usage()
-    logging.info("Processing complete.")
+    metrics.log_summary()
+    metrics.close()
+    response_cache.log_stats()
+
+if __name__ == "__main__":
+    directory = "input_data"  
+    output_directory = "extracted_topics"   
+
+    logging.info(f"Starting processing of text files in directory: {directory}")
+    try:
+        process_text_files(directory, output_directory)
+    except Exception as e:
+        logging.error(f"Processing interrupted due to error: {e}")
+    finally:
+        log_token_usage()
+        logging.info("Processing complete.")
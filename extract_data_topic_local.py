@@ -0,0 +1,101 @@
+import os
+import re
+import json
+import time
+import logging
+import argparse
+
+import extract_data_topic_chunks as extractor
+import segmentation
+from chunking import read_mapped_text
+from manifest import hash_text
+
+SEGMENT_TITLER = os.getenv("SEGMENT_TITLER", "local")  # "local", or "llm" to title the local segments with one request per document
+TITLE_PREVIEW_CHARS = 400  # Characters of each segment shown to the model for titling
+
+TITLE_PROMPT = """You are given numbered excerpts. Each excerpt is the beginning of one consecutive section of a document.
+Write a short, descriptive title for every section.
+
+Output exactly one line per section, in the input order, in the format:
+<number>: Topic_<Title>
+
+Output nothing else."""
+
+TITLE_LINE = re.compile(r"^\s*(\d+)\s*[:.)\-]\s*(Topic_.+?)\s*$")
+
+
+def title_segments_with_llm(segments, fallback_titles):
+    """Title segments with one request that carries only a short preview of each."""
+    previews = "\n\n".join(f"{i + 1}: {' '.join(segment[:TITLE_PREVIEW_CHARS].split())}" for i, segment in enumerate(segments))
+    payload = {
+        "model": extractor.DEFAULT_MODEL,
+        "messages": [
+            {"role": "system", "content": TITLE_PROMPT},
+            {"role": "user", "content": previews},
+        ],
+        "temperature": 0.0,
+        "top_p": 1,
+    }
+    try:
+        result = extractor.send_completion(payload)
+    except Exception as e:
+        logging.error(f"Titling request raised an exception: {e}")
+        result = None
+    if not result:
+        logging.warning("Titling request failed; keeping the local titles.")
+        return fallback_titles
+
+    titles = list(fallback_titles)
+    for line in result["choices"][0]["message"]["content"].splitlines():
+        match = TITLE_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= len(titles):
+            titles[int(match.group(1)) - 1] = match.group(2)
+    return titles
+
+
+def process_text_files(directory, output_directory, embedder_name=segmentation.SEGMENT_EMBEDDER, titler=SEGMENT_TITLER):
+    embedder = segmentation.get_embedder(embedder_name)
+    settings = [segmentation.SEGMENT_WINDOW, segmentation.MIN_SEGMENT_UNITS, segmentation.MAX_SEGMENT_CHARS, segmentation.MAX_FEATURES]
+    document_version = hash_text("segmentation", embedder.name, json.dumps(settings), titler,
+                                 hash_text(TITLE_PROMPT, extractor.DEFAULT_MODEL or "") if titler == "llm" else "")
+
+    logging.info(f"Ensuring output directory exists: {output_directory}")
+    os.makedirs(output_directory, exist_ok=True)
+
+    for filename in os.listdir(directory):
+        if not filename.endswith(".txt"):
+            continue
+        filepath = os.path.join(directory, filename)
+        fingerprint = extractor.manifest.fingerprint("extract", filepath)
+        if extractor.manifest.is_current("extract", filepath, document_version, fingerprint):
+            logging.info(f"Skipping unchanged file: {filename}")
+            continue
+
+        started = time.perf_counter()
+        text = read_mapped_text(filepath)
+        segments, segment_units = segmentation.segment_document(text, embedder)
+        titles = segmentation.local_titles(segment_units)
+        if titler == "llm" and segments:
+            titles = title_segments_with_llm(segments, titles)
+        topics = segmentation.build_topics(segments, titles)
+        logging.info(f"Segmented {filename} into {len(topics)} topics in {time.perf_counter() - started:.2f}s.")
+
+        extractor.save_file_topics(filepath, topics, output_directory, document_version, fingerprint=fingerprint)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Split partitioned text into topics locally, without sending the document to the API.")
+    parser.add_argument("--input", default="output_text_files", help="Directory of partitioned .txt files")
+    parser.add_argument("--output", default="extracted_topics", help="Directory for extracted topic files")
+    parser.add_argument("--embedder", default=segmentation.SEGMENT_EMBEDDER, help="'tfidf' or a sentence-transformers model name")
+    parser.add_argument("--titler", default=SEGMENT_TITLER, choices=["local", "llm"])
+    args = parser.parse_args()
+
+    logging.info(f"Starting local segmentation of text files in directory: {args.input}")
+    try:
+        process_text_files(args.input, args.output, args.embedder, args.titler)
+    except Exception as e:
+        logging.error(f"Processing interrupted due to error: {e}")
+    finally:
+        extractor.log_token_usage()
+        logging.info("Processing complete.")
@@ -0,0 +1,114 @@
+from html.parser import HTMLParser
+
+READ_BLOCK_SIZE = 64 * 1024
+
+# Content inside these tags is never text a reader of the page would see as the document
+SKIP_TAGS = {
+    "script", "style", "noscript", "template", "head", "nav", "aside",
+    "select", "iframe", "svg", "canvas", "object",
+}
+# Page chrome when they frame the page, but part of the document inside one of CONTENT_TAGS
+CHROME_TAGS = {"header", "footer"}
+CONTENT_TAGS = {"article", "main"}
+# Opening or closing one of these ends the current paragraph
+BLOCK_TAGS = {
+    "address", "article", "blockquote", "body", "br", "caption", "dd", "div", "dl", "dt", "figcaption",
+    "figure", "h1", "h2", "h3", "h4", "h5", "h6", "hr", "li", "main", "ol", "p", "pre", "section",
+    "table", "tbody", "thead", "tfoot", "tr", "ul",
+}
+CELL_TAGS = {"td", "th"}
+VOID_TAGS = {"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta", "source", "track", "wbr"}
+
+
+class HTMLTextExtractor(HTMLParser):
+    """Incremental HTML-to-paragraphs converter.
+
+    Only the paragraph being built is kept in memory; no tree is
+    constructed, so memory stays flat however large the page is. Table
+    rows become one paragraph with their cells separated by spaces.
+    """
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self._skip_depth = 0
+        self._content_depth = 0
+        self._chrome = []  # Whether each open header/footer is skipped
+        self._parts = []
+        self._paragraphs = []
+
+    def _flush(self):
+        text = " ".join("".join(self._parts).split())
+        self._parts = []
+        if text:
+            self._paragraphs.append(text)
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "body":
+            # The body closes any skipped region left open in an unterminated <head>
+            self._skip_depth = 0
+        if tag in CONTENT_TAGS:
+            self._content_depth += 1
+        if tag in CHROME_TAGS:
+            skipped = not self._content_depth
+            self._chrome.append(skipped)
+            self._skip_depth += skipped
+            if not skipped:
+                self._flush()
+        elif tag in SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag in BLOCK_TAGS:
+            self._flush()
+        elif tag in CELL_TAGS:
+            self._parts.append(" ")
+
+    def handle_startendtag(self, tag, attrs):
+        # Self-closing tags (<br/>) never open a skipped region
+        if tag in BLOCK_TAGS:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in CONTENT_TAGS:
+            self._content_depth = max(0, self._content_depth - 1)
+        if tag in CHROME_TAGS:
+            if self._chrome and self._chrome.pop():
+                self._skip_depth = max(0, self._skip_depth - 1)
+            else:
+                self._flush()
+        elif tag in SKIP_TAGS:
+            # Stray closing tags in scraped pages must not push the depth below zero
+            self._skip_depth = max(0, self._skip_depth - 1)
+        elif tag in BLOCK_TAGS and tag not in VOID_TAGS:
+            self._flush()
+
+    def handle_data(self, data):
+        if not self._skip_depth:
+            self._parts.append(data)
+
+    def pop_paragraphs(self):
+        """Return the paragraphs completed since the last call."""
+        paragraphs, self._paragraphs = self._paragraphs, []
+        return paragraphs
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def iter_html_paragraphs(file, block_size=READ_BLOCK_SIZE):
+    """Yield the visible text of an open HTML file paragraph by paragraph as it is read."""
+    parser = HTMLTextExtractor()
+    for block in iter(lambda: file.read(block_size), ""):
+        parser.feed(block)
+        yield from parser.pop_paragraphs()
+    parser.close()
+    yield from parser.pop_paragraphs()
+
+
+def extract_html_file(html_file, output_path, separator="\n\n"):
+    """Write the paragraphs of html_file to output_path as they are parsed and return how many there were."""
+    count = 0
+    with open(html_file, 'r', encoding='utf-8', errors='replace') as source, open(output_path, 'w') as f:
+        for paragraph in iter_html_paragraphs(source):
+            f.write(paragraph + separator)
+            count += 1
+    return count
@@ -0,0 +1,356 @@
+import os
+import json
+import time
+import random
+import logging
+import threading
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+LLM_REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "0"))  # 0 disables the limit
+LLM_TOKENS_PER_MINUTE = float(os.getenv("LLM_TOKENS_PER_MINUTE", "0"))  # 0 disables the limit
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "5"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "16"))
+LLM_STREAM = os.getenv("LLM_STREAM", "0").lower() in ("1", "true", "yes")
+LLM_STREAM_IDLE_TIMEOUT = float(os.getenv("LLM_STREAM_IDLE_TIMEOUT", "30"))  # Max seconds between streamed bytes
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "10"))
+
+RETRY_STATUS_CODES = {408, 409, 429, 500, 502, 503, 504}
+BACKOFF_BASE = 1.0  # Seconds before the first retry
+BACKOFF_MAX = 60.0  # Upper bound on a single backoff delay
+CHARS_PER_TOKEN = 4  # Rough estimate used to charge the token bucket before the real usage is known
+
+CONTINUE_PROMPT = "Continue the output exactly where it stopped. Do not repeat any text that was already written."
+STREAM_ERRORS = (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError)
+
+
+def estimate_tokens(payload):
+    """Approximate the prompt tokens of a chat payload from its message lengths."""
+    chars = sum(len(message.get("content", "")) for message in payload.get("messages", []))
+    return max(1, chars // CHARS_PER_TOKEN)
+
+
+def parse_retry_after(value):
+    """Return the Retry-After header as seconds, accepting either delta-seconds or an HTTP date."""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def iter_sse_events(lines):
+    """Decode the JSON events of a server-sent event stream, stopping at the [DONE] sentinel."""
+    data = []
+    for line in lines:
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        line = line.rstrip("\r\n")
+        if line.startswith("data:"):
+            data.append(line[5:].removeprefix(" "))
+            continue
+        if line or not data:
+            # Comments, other fields and blank keep-alive lines carry no payload
+            continue
+        payload = "\n".join(data)
+        data = []
+        if payload == "[DONE]":
+            return
+        yield json.loads(payload)
+    if data and "\n".join(data) != "[DONE]":
+        yield json.loads("\n".join(data))
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at rate_per_minute."""
+
+    def __init__(self, rate_per_minute):
+        self.capacity = rate_per_minute
+        self.tokens = rate_per_minute
+        self.refill_per_second = rate_per_minute / 60.0
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.refill_per_second)
+        self.updated = now
+
+    def acquire(self, amount):
+        """Block until amount tokens are available, then take them."""
+        # A single request larger than the bucket would otherwise wait forever
+        amount = min(amount, self.capacity)
+        while True:
+            with self.lock:
+                self._refill()
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return
+                wait = (amount - self.tokens) / self.refill_per_second
+            time.sleep(wait)
+
+    def adjust(self, amount):
+        """Credit (negative amount) or debit tokens once the real cost is known."""
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self):
+        with self.lock:
+            self._refill()
+            self.tokens = min(self.tokens, 0.0)
+
+
+class RateLimiter:
+    """Requests/minute and tokens/minute budgets that every worker thread draws from."""
+
+    def __init__(self, requests_per_minute=LLM_REQUESTS_PER_MINUTE, tokens_per_minute=LLM_TOKENS_PER_MINUTE):
+        self.request_bucket = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.token_bucket = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, estimated_tokens):
+        with self.lock:
+            pause = self.paused_until - time.monotonic()
+        if pause > 0:
+            time.sleep(pause)
+        if self.request_bucket:
+            self.request_bucket.acquire(1)
+        if self.token_bucket:
+            self.token_bucket.acquire(estimated_tokens)
+
+    def record_usage(self, estimated_tokens, actual_tokens):
+        """Correct the token budget with the usage the server reported."""
+        if self.token_bucket:
+            self.token_bucket.adjust(actual_tokens - estimated_tokens)
+
+    def pause(self, seconds):
+        """Hold back all callers after the server signalled it is overloaded."""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        if self.request_bucket:
+            self.request_bucket.drain()
+
+
+class CompletionsClient:
+    """Pooled, rate-limited client for an OpenAI-compatible /chat/completions endpoint."""
+
+    def __init__(self, base_url, headers, rate_limiter=None, max_retries=LLM_MAX_RETRIES, pool_size=LLM_POOL_SIZE):
+        self.base_url = base_url.rstrip("/") if base_url else base_url
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.max_retries = max_retries
+        self.retries = 0
+        self._retries_lock = threading.Lock()
+        self._local = threading.local()  # Retries of the call in progress on each thread
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def _count_retry(self):
+        with self._retries_lock:
+            self.retries += 1
+        self._local.retries = getattr(self._local, "retries", 0) + 1
+
+    def request_retries(self):
+        """Retries and resumes of the last chat_completion or stream_chat_completion on this thread."""
+        return getattr(self._local, "retries", 0)
+
+    def _backoff(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, BACKOFF_MAX)
+        # Full jitter keeps concurrent workers from retrying in lockstep
+        return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+    def post(self, path, payload, timeout=150, **kwargs):
+        """POST payload with retries on transient failures and return the final response."""
+        url = f"{self.base_url}{path}"
+        estimated_tokens = estimate_tokens(payload)
+
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire(estimated_tokens)
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"Request failed ({e}). Retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+                self._count_retry()
+                time.sleep(delay)
+                continue
+
+            if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                if response.ok and not kwargs.get("stream"):
+                    usage = response.json().get("usage", {})
+                    actual_tokens = usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+                    self.rate_limiter.record_usage(estimated_tokens, actual_tokens)
+                return response
+
+            retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            delay = self._backoff(attempt, retry_after)
+            if response.status_code == 429:
+                self.rate_limiter.pause(delay)
+            logging.warning(f"Server returned {response.status_code}. Retrying in {delay:.1f}s (attempt {attempt + 1}/{self.max_retries}).")
+            self._count_retry()
+            response.close()
+            time.sleep(delay)
+
+    def chat_completion(self, payload, timeout=150):
+        self._local.retries = 0
+        return self.post("/chat/completions", payload, timeout=timeout)
+
+    def stream_chat_completion(self, payload, idle_timeout=LLM_STREAM_IDLE_TIMEOUT, on_text=None, max_resumes=LLM_MAX_RETRIES):
+        """Stream a completion and return it in the same shape as a non-streaming response.
+
+        The read timeout applies between received bytes, so long completions
+        are not cut off as long as tokens keep arriving. Text is passed to
+        on_text one complete line at a time. If the stream drops, the lines
+        already received are kept and a follow-up request asks the model to
+        continue from there, so only the remainder is generated again. Usage
+        from every attempt's final event is summed.
+        """
+        self._local.retries = 0
+        committed = []
+        usage_total = {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+        finish_reason = None
+        request = dict(payload, stream=True, stream_options={"include_usage": True})
+
+        def commit(text):
+            if text:
+                committed.append(text)
+                if on_text:
+                    on_text(text)
+
+        for attempt in range(max_resumes + 1):
+            sent = request  # Reassigned below if the stream drops; usage is billed against what was sent
+            response = self.post("/chat/completions", sent, timeout=(LLM_CONNECT_TIMEOUT, idle_timeout), stream=True)
+            pending = ""
+            usage = None
+            try:
+                # Inside the try, so an error response is closed too
+                response.raise_for_status()
+                for event in iter_sse_events(response.iter_lines()):
+                    usage = event.get("usage") or usage
+                    for choice in event.get("choices", []):
+                        finish_reason = choice.get("finish_reason") or finish_reason
+                        pending += choice.get("delta", {}).get("content") or ""
+                        # Only whole lines are committed, so a resumed stream starts on a line boundary
+                        cut = pending.rfind("\n") + 1
+                        if cut:
+                            commit(pending[:cut])
+                            pending = pending[cut:]
+                commit(pending)
+                break
+            except STREAM_ERRORS as e:
+                if attempt == max_resumes:
+                    raise
+                self._count_retry()
+                received = "".join(committed)
+                logging.warning(f"Stream interrupted after {len(received)} characters ({e}). Requesting the remainder.")
+                messages = payload["messages"]
+                if received:
+                    messages = messages + [
+                        {"role": "assistant", "content": received},
+                        {"role": "user", "content": CONTINUE_PROMPT},
+                    ]
+                request = dict(payload, messages=messages, stream=True, stream_options={"include_usage": True})
+            finally:
+                response.close()
+                # Interrupted attempts are billed too, so their usage counts when the server sent it
+                if usage:
+                    for key in usage_total:
+                        usage_total[key] += usage.get(key, 0)
+                    self.rate_limiter.record_usage(estimate_tokens(sent), usage.get("total_tokens", 0))
+
+        if not usage:
+            logging.warning("Stream ended without a usage event; token counts for this request are incomplete.")
+
+        return {
+            "object": "chat.completion",
+            "model": payload.get("model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(committed)},
+                "finish_reason": finish_reason,
+            }],
+            "usage": usage_total,
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def send_completion(client, payload, cache, metrics, on_text=None, stream=LLM_STREAM, quiet=False):
+    """Return the completion for payload from cache or through client, recording its metrics.
+
+    on_text receives the completion text as it arrives, or all at once for a
+    cached or non-streamed response. Returns None if the request still failed
+    after the client's retries (an error status or a lost connection), so one
+    bad document does not stop a run.
+    """
+    request_bytes = len(json.dumps(payload, ensure_ascii=False).encode('utf-8'))
+    started = time.perf_counter()
+
+    cached_response = cache.get(payload)
+    if cached_response is not None:
+        logging.info("Using cached API response.")
+        content = cached_response["choices"][0]["message"]["content"]
+        if on_text:
+            on_text(content)
+        metrics.record(time.perf_counter() - started, request_bytes=request_bytes, response_bytes=len(content.encode('utf-8')), cached=True)
+        return cached_response
+
+    logging.info("Sending request to the API.")
+    try:
+        if stream:
+            # Reads server-sent events with an idle timeout; a dropped stream is resumed rather than restarted
+            result = client.stream_chat_completion(payload, on_text=on_text)
+            response_bytes = len(result["choices"][0]["message"]["content"].encode('utf-8'))
+        else:
+            # Retries 429/5xx responses with backoff, so only persistent failures reach raise_for_status
+            response = client.chat_completion(payload, timeout=150)
+            response.raise_for_status()
+            if response.status_code != 200:
+                logging.error(f"Error: {response.status_code}")
+                logging.error(response.text)
+                metrics.record(time.perf_counter() - started, retries=client.request_retries(), request_bytes=request_bytes, failed=True)
+                return None
+            response_bytes = len(response.content)
+            result = response.json()
+            if on_text:
+                on_text(result["choices"][0]["message"]["content"])
+    except requests.RequestException as e:
+        logging.error(f"Request failed: {e}")
+        metrics.record(time.perf_counter() - started, retries=client.request_retries(), request_bytes=request_bytes, failed=True)
+        return None
+    except Exception:
+        metrics.record(time.perf_counter() - started, retries=client.request_retries(), request_bytes=request_bytes, failed=True)
+        raise
+
+    token_usage = result.get("usage", {})
+    metrics.record(
+        time.perf_counter() - started,
+        prompt_tokens=token_usage.get("prompt_tokens", 0),
+        completion_tokens=token_usage.get("completion_tokens", 0),
+        retries=client.request_retries(),
+        request_bytes=request_bytes,
+        response_bytes=response_bytes,
+    )
+
+    logging.info("API request successful.")
+    if not quiet:
+        print(result["choices"][0]["message"]["content"])
+        logging.info(f"API Response: {result}")  # Log the full response
+
+    cache.put(payload, result)
+    return result
@@ -0,0 +1,176 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from importlib import metadata
+
+MANIFEST_PATH = os.getenv("MANIFEST_PATH", "ingest_manifest.sqlite3")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+def hash_text(*parts):
+    """SHA-256 over one or more strings, used for chunk and prompt hashes."""
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def partitioner_version():
+    """Version string of the installed unstructured package, so upgrades invalidate partitions."""
+    try:
+        return f"unstructured=={metadata.version('unstructured')}"
+    except metadata.PackageNotFoundError:
+        return "unstructured==unknown"
+
+
+class Manifest:
+    """SQLite index of processed documents and chunks, so reruns only touch new or changed inputs.
+
+    Each stage ("partition", "extract") records, per input file, its content
+    hash, size, mtime, the version of whatever produced the output
+    (partitioner version or prompt hash) and the output files. Completed
+    chunks are recorded with their parsed topics, so an interrupted
+    extraction resumes from the first unfinished chunk.
+    """
+
+    def __init__(self, path=MANIFEST_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        """The database, opened on first use so that creating a manifest touches no files. Call with self._lock held."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS documents (
+                    stage TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    mtime REAL NOT NULL,
+                    version TEXT NOT NULL,
+                    outputs TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (stage, path)
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    path TEXT NOT NULL,
+                    chunk_index INTEGER NOT NULL,
+                    chunk_hash TEXT NOT NULL,
+                    prompt_hash TEXT NOT NULL,
+                    topics TEXT NOT NULL,
+                    completed_at REAL NOT NULL,
+                    PRIMARY KEY (path, chunk_index)
+                );
+                """
+            )
+            self._conn.commit()
+        return self._conn
+
+    def fingerprint(self, stage, path):
+        """Return (content_hash, size, mtime), reusing the stored hash when size and mtime are unchanged."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT content_hash, size, mtime FROM documents WHERE stage = ? AND path = ?", (stage, path)
+            ).fetchone()
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime:
+            return row[0], stat.st_size, stat.st_mtime
+        return hash_file(path), stat.st_size, stat.st_mtime
+
+    def is_current(self, stage, path, version, fingerprint=None):
+        """True if path was already processed by this stage with the same content and version.
+
+        fingerprint, from self.fingerprint, saves hashing the file a second time.
+        """
+        path = os.path.abspath(path)
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT content_hash, version, outputs FROM documents WHERE stage = ? AND path = ?", (stage, path)
+            ).fetchone()
+        if row is None or row[1] != version:
+            return False
+        if not all(os.path.exists(output) for output in json.loads(row[2])):
+            return False
+        return (fingerprint or self.fingerprint(stage, path))[0] == row[0]
+
+    def get_outputs(self, stage, path):
+        """Output files recorded the last time path went through this stage."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT outputs FROM documents WHERE stage = ? AND path = ?", (stage, os.path.abspath(path))
+            ).fetchone()
+        return json.loads(row[0]) if row else []
+
+    def get_own_outputs(self, stage, path):
+        """Outputs recorded for path that no other document of this stage also lists, so they are safe to delete."""
+        path = os.path.abspath(path)
+        with self._lock:
+            rows = self._connection().execute(
+                "SELECT path, outputs FROM documents WHERE stage = ?", (stage,)
+            ).fetchall()
+        outputs = []
+        shared = set()
+        for row_path, row_outputs in rows:
+            if row_path == path:
+                outputs = json.loads(row_outputs)
+            else:
+                shared.update(json.loads(row_outputs))
+        return [output for output in outputs if output not in shared]
+
+    def record_document(self, stage, path, version, outputs, fingerprint=None):
+        """Record path as processed by this stage.
+
+        Pass the fingerprint taken before path was read, so a file changed
+        while it was processed is not marked current.
+        """
+        path = os.path.abspath(path)
+        content_hash, size, mtime = fingerprint or self.fingerprint(stage, path)
+        outputs = [os.path.abspath(output) for output in outputs]
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (stage, path, content_hash, size, mtime, version, json.dumps(outputs), time.time()),
+            )
+            self._conn.commit()
+
+    def get_chunk_topics(self, path, chunk_index, chunk_hash, prompt_hash):
+        """Topics stored for a finished chunk, or None if it has to be extracted again."""
+        with self._lock:
+            row = self._connection().execute(
+                "SELECT topics FROM chunks WHERE path = ? AND chunk_index = ? AND chunk_hash = ? AND prompt_hash = ?",
+                (os.path.abspath(path), chunk_index, chunk_hash, prompt_hash),
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def record_chunk(self, path, chunk_index, chunk_hash, prompt_hash, topics):
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?, ?, ?, ?)",
+                (os.path.abspath(path), chunk_index, chunk_hash, prompt_hash, json.dumps(topics), time.time()),
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,211 @@
+import os
+import re
+import logging
+import argparse
+from collections import Counter
+
+import extract_data_topic_chunks as extractor
+from chunking import get_chunker
+from manifest import hash_text
+from metrics import request_context
+from prompts import PACK_CHUNK_CHARS
+from topic_merge import NUMBERS, normalize_title
+
+MAP_REDUCE_REDUCER = os.getenv("MAP_REDUCE_REDUCER", "local")  # "local" or "llm"
+LOCAL_GROUP_SIMILARITY = 0.5  # Jaccard over distinctive words needed to fold two titles into one topic
+MIN_SHARED_WORDS = 2  # Distinctive words two titles must share, so a one-word title never absorbs others
+GENERIC_WORD_SHARE = 0.2  # Words in more than this share of a document's titles are not distinctive
+MAX_POSTINGS = 50  # Group titles compared per word
+
+STOP_WORDS = {"a", "an", "and", "for", "in", "of", "on", "or", "the", "to", "with"}
+
+REDUCE_PROMPT = """You are given a numbered list of section titles extracted, in order, from consecutive parts of one document.
+Group titles that describe the same topic and give each group a single consolidated title.
+
+Output exactly one line per input title, in the input order, in the format:
+<number>: Topic_<Consolidated Title>
+
+Use exactly the same consolidated title for every title in a group. Keep titles that do not belong with any other unchanged. Output nothing else."""
+
+REDUCE_LINE = re.compile(r"^\s*(\d+)\s*[:.)\-]\s*(Topic_.+?)\s*$")
+
+
+def usage_counters():
+    totals = extractor.metrics.snapshot()
+    return totals["requests"] - totals["cached"], totals["prompt_tokens"], totals["completion_tokens"]
+
+
+def add_usage(totals, before, after):
+    for i, (start, end) in enumerate(zip(before, after)):
+        totals[i] += end - start
+
+
+def reduce_titles_locally(titles):
+    """Map each title to the first title of its group, grouping titles with mostly shared distinctive words.
+
+    Words found in many of the document's titles (its subject, "requirements")
+    say nothing about which section a title names and are ignored. Two titles
+    group when their word sets are equal, or when they share at least
+    MIN_SHARED_WORDS of the remaining words with a Jaccard of at least
+    LOCAL_GROUP_SIMILARITY. A title joins a group only by matching the
+    group's first title, so groups never chain through a short hub title.
+    Candidates come from an inverted index over the group-founding titles,
+    so the cost grows with the number of titles rather than its square.
+    """
+    words = [frozenset(word for word in normalize_title(title).split() if word not in STOP_WORDS) for title in titles]
+    numbers = [NUMBERS.findall(normalize_title(title)) for title in titles]
+    document_frequency = Counter(word for title_words in set(words) for word in title_words)
+    generic_limit = max(2, GENERIC_WORD_SHARE * len(set(words)))
+    distinctive = [frozenset(word for word in title_words if document_frequency[word] <= generic_limit) for title_words in words]
+
+    group = list(range(len(titles)))
+    postings = {}  # word -> titles that founded a group
+    for i, title_words in enumerate(words):
+        candidates = set()
+        for word in title_words:
+            candidates.update(postings.get(word, ())[:MAX_POSTINGS])
+        best, best_similarity = None, LOCAL_GROUP_SIMILARITY
+        for j in sorted(candidates):
+            if numbers[i] != numbers[j]:
+                continue
+            if title_words == words[j]:
+                best = j
+                break
+            shared = len(distinctive[i] & distinctive[j])
+            if shared < MIN_SHARED_WORDS:
+                continue
+            similarity = shared / len(distinctive[i] | distinctive[j])
+            if similarity >= best_similarity:
+                best, best_similarity = j, similarity
+        if best is None:
+            for word in title_words:
+                postings.setdefault(word, []).append(i)
+        else:
+            group[i] = best
+
+    return {title: titles[group[i]] for i, title in enumerate(titles)}
+
+
+def reduce_titles_with_llm(titles):
+    """Ask the model for a consolidated topic per title, sending only the titles."""
+    numbered_titles = "\n".join(f"{i + 1}: {title}" for i, title in enumerate(titles))
+    payload = {
+        "model": extractor.DEFAULT_MODEL,
+        "messages": [
+            {"role": "system", "content": REDUCE_PROMPT},
+            {"role": "user", "content": numbered_titles},
+        ],
+        "temperature": 0.0,
+        "top_p": 1,
+    }
+    try:
+        result = extractor.send_completion(payload)
+    except Exception as e:
+        logging.error(f"Reduce request raised an exception: {e}")
+        result = None
+    if not result:
+        logging.warning("Reduce request failed; grouping topic titles locally instead.")
+        return reduce_titles_locally(titles)
+
+    mapping = {}
+    for line in result["choices"][0]["message"]["content"].splitlines():
+        match = REDUCE_LINE.match(line)
+        if match and 1 <= int(match.group(1)) <= len(titles):
+            mapping[titles[int(match.group(1)) - 1]] = match.group(2)
+    if len(mapping) < len(titles):
+        logging.warning(f"Reduce response covered {len(mapping)} of {len(titles)} titles; the rest keep their own topic.")
+    return {title: mapping.get(title, title) for title in titles}
+
+
+REDUCERS = {
+    "local": reduce_titles_locally,
+    "llm": reduce_titles_with_llm,
+}
+
+
+def _combine(choose, *values):
+    """choose() over the values that are known; None if none is."""
+    known = [value for value in values if value is not None]
+    return choose(known) if known else None
+
+
+def consolidate_topics(topics, chunk_ranges, mapping):
+    """Gather each section under its consolidated title, keeping document order."""
+    parts = {}
+    ranges = {}
+    for title, content in topics.items():
+        target = mapping.get(title, title)
+        parts.setdefault(target, []).append(content)
+        # Older two-element ranges have no byte offsets
+        span = (list(chunk_ranges.get(title, ())) + [None] * 4)[:4]
+        if target not in ranges:
+            ranges[target] = span
+        else:
+            first_chunk, last_chunk, first_byte, last_byte = ranges[target]
+            ranges[target] = [
+                _combine(min, first_chunk, span[0]),
+                _combine(max, last_chunk, span[1]),
+                _combine(min, first_byte, span[2]),
+                _combine(max, last_byte, span[3]),
+            ]
+    return {title: "".join(contents) for title, contents in parts.items()}, ranges
+
+
+def process_text_files(directory, output_directory, reducer=MAP_REDUCE_REDUCER,
+                       max_concurrent_requests=extractor.MAX_CONCURRENT_REQUESTS, chunk_strategy=extractor.CHUNK_STRATEGY):
+    """Map: extract topics per chunk in parallel. Reduce: fold them into a consolidated topic list per document."""
+    reduce_titles = REDUCERS[reducer]
+    chunker = get_chunker(chunk_strategy, **extractor.CHUNKER_OPTIONS.get(chunk_strategy, {}))
+    prompt_hash, document_version = extractor.extraction_versions(chunk_strategy)
+    document_version = hash_text(document_version, "map-reduce", reducer, REDUCE_PROMPT if reducer == "llm" else "")
+
+    os.makedirs(output_directory, exist_ok=True)
+    map_totals = [0, 0, 0]
+    reduce_totals = [0, 0, 0]
+
+    filepaths = extractor.pending_files(directory, document_version)
+    if PACK_CHUNK_CHARS:
+        before = usage_counters()
+        extractor.extract_small_chunks(filepaths, chunker, prompt_hash, max_concurrent_requests)
+        add_usage(map_totals, before, usage_counters())
+
+    for filepath in filepaths:
+        filename = os.path.basename(filepath)
+        logging.info(f"Map pass over {filename}.")
+        before = usage_counters()
+        topics, chunk_ranges, failed_chunks = extractor.extract_file_topics(filepath, chunker, prompt_hash, max_concurrent_requests)
+        add_usage(map_totals, before, usage_counters())
+        if failed_chunks:
+            logging.warning(f"{failed_chunks} chunks of {filename} failed; the file will be resumed on the next run.")
+            continue
+
+        logging.info(f"Reduce pass over {len(topics)} topic titles from {filename} using the '{reducer}' reducer.")
+        before = usage_counters()
+        with request_context(document=filename, chunk="reduce"):
+            mapping = reduce_titles(list(topics)) if topics else {}
+        add_usage(reduce_totals, before, usage_counters())
+
+        consolidated, consolidated_ranges = consolidate_topics(topics, chunk_ranges, mapping)
+        logging.info(f"Consolidated {len(topics)} topics into {len(consolidated)} for {filename}.")
+        extractor.save_file_topics(filepath, consolidated, output_directory, document_version, consolidated_ranges, fingerprint=filepaths[filepath])
+
+    for name, totals in (("Map", map_totals), ("Reduce", reduce_totals)):
+        logging.info(f"{name} pass: {totals[0]} requests, {totals[1]} tokens sent, {totals[2]} tokens received")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract topics per chunk, then consolidate them per document.")
+    parser.add_argument("--input", default="input_data", help="Directory of partitioned .txt files")
+    parser.add_argument("--output", default="extracted_topics", help="Directory for extracted topic files")
+    parser.add_argument("--reducer", default=MAP_REDUCE_REDUCER, choices=list(REDUCERS))
+    parser.add_argument("--max-concurrent-requests", type=int, default=extractor.MAX_CONCURRENT_REQUESTS)
+    args = parser.parse_args()
+
+    logging.info(f"Starting map-reduce processing of text files in directory: {args.input}")
+    try:
+        process_text_files(args.input, args.output, args.reducer, args.max_concurrent_requests)
+    except Exception as e:
+        logging.error(f"Processing interrupted due to error: {e}")
+    finally:
+        extractor.log_token_usage()
+        logging.info("Processing complete.")
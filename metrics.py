@@ -0,0 +1,222 @@
+import os
+import json
+import math
+import time
+import logging
+import tempfile
+import threading
+from contextlib import contextmanager
+
+METRICS_SINK = os.getenv("METRICS_SINK", "")  # "", "jsonl" or "prometheus"
+METRICS_PATH = os.getenv("METRICS_PATH", "")  # Defaults to metrics/requests.jsonl or metrics/llm.prom
+METRICS_WRITE_INTERVAL = float(os.getenv("METRICS_WRITE_INTERVAL", "15"))  # Seconds between Prometheus textfile rewrites
+LLM_QUIET = os.getenv("LLM_QUIET", "0").lower() in ("1", "true", "yes")  # Skip printing and logging full completions
+
+QUANTILES = (0.5, 0.95, 0.99)
+SLOWEST_DOCUMENTS = 5
+
+_context = threading.local()
+
+
+@contextmanager
+def request_context(**fields):
+    """Attach fields such as document and chunk to every request recorded on this thread inside the block."""
+    previous = getattr(_context, "fields", {})
+    _context.fields = {**previous, **fields}
+    try:
+        yield
+    finally:
+        _context.fields = previous
+
+
+def percentile(sorted_values, quantile):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(quantile * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class JsonlSink:
+    """Appends one JSON line per request."""
+
+    def __init__(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._lock = threading.Lock()
+
+    def write(self, record, metrics):
+        line = json.dumps(record, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+
+    def close(self, metrics):
+        with self._lock:
+            self._file.close()
+
+
+class PrometheusSink:
+    """Keeps a node_exporter textfile up to date with run totals and latency quantiles.
+
+    The file is rewritten atomically at most every METRICS_WRITE_INTERVAL
+    seconds and once more on close, so scrapes never see a partial file.
+    """
+
+    def __init__(self, path, interval=METRICS_WRITE_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self._written = 0.0
+        self._lock = threading.Lock()
+        self._directory = os.path.dirname(path) or "."
+        os.makedirs(self._directory, exist_ok=True)
+
+    def write(self, record, metrics):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._written < self.interval:
+                return
+            self._written = now
+        self._write_file(metrics)
+
+    def _write_file(self, metrics):
+        totals = metrics.snapshot()
+        summary = metrics.summary()
+        lines = []
+        for name, help_text, value in (
+            ("llm_requests_total", "Completions requested, including cache hits", totals["requests"]),
+            ("llm_cached_requests_total", "Completions served from the response cache", totals["cached"]),
+            ("llm_failed_requests_total", "Completions that raised or returned an error", totals["failed"]),
+            ("llm_prompt_tokens_total", "Prompt tokens reported by the server", totals["prompt_tokens"]),
+            ("llm_completion_tokens_total", "Completion tokens reported by the server", totals["completion_tokens"]),
+            ("llm_retries_total", "Retried or resumed HTTP requests", totals["retries"]),
+            ("llm_request_bytes_total", "Bytes of request payloads sent", totals["request_bytes"]),
+            ("llm_response_bytes_total", "Bytes of completion responses received", totals["response_bytes"]),
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter", f"{name} {value}"]
+        lines += ["# HELP llm_request_latency_seconds Latency of uncached completions", "# TYPE llm_request_latency_seconds summary"]
+        for quantile in QUANTILES:
+            lines.append(f'llm_request_latency_seconds{{quantile="{quantile}"}} {summary["latency"][quantile]:.6f}')
+        lines.append(f"llm_request_latency_seconds_sum {totals['latency_seconds']:.6f}")
+        lines.append(f"llm_request_latency_seconds_count {totals['requests'] - totals['cached']}")
+
+        descriptor, temp_path = tempfile.mkstemp(dir=self._directory, prefix=".tmp-")
+        try:
+            with os.fdopen(descriptor, 'w') as file:
+                file.write("\n".join(lines) + "\n")
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, self.path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def close(self, metrics):
+        self._write_file(metrics)
+
+
+def make_sink(kind=METRICS_SINK, path=METRICS_PATH):
+    if not kind:
+        return None
+    if kind == "jsonl":
+        return JsonlSink(path or os.path.join("metrics", "requests.jsonl"))
+    if kind == "prometheus":
+        return PrometheusSink(path or os.path.join("metrics", "llm.prom"))
+    raise ValueError(f"Unknown metrics sink '{kind}'. Choose from: jsonl, prometheus")
+
+
+class RequestMetrics:
+    """Thread-safe per-request telemetry for completion calls.
+
+    Every request is recorded with its latency, token usage, retries,
+    payload sizes and the document/chunk set by request_context, then
+    passed to the configured sink. Run totals replace the old module-level
+    token counters, and summary() gives p50/p95/p99 over the run.
+    """
+
+    def __init__(self, sink=None):
+        self.sink = sink if sink is not None else make_sink()
+        self._lock = threading.Lock()
+        self._totals = {
+            "requests": 0, "cached": 0, "failed": 0, "prompt_tokens": 0, "completion_tokens": 0,
+            "retries": 0, "request_bytes": 0, "response_bytes": 0, "latency_seconds": 0.0,
+        }
+        self._latencies = []
+        self._prompt_tokens = []
+        self._completion_tokens = []
+        self._document_seconds = {}
+
+    def record(self, latency, prompt_tokens=0, completion_tokens=0, retries=0, request_bytes=0, response_bytes=0,
+               cached=False, failed=False, **fields):
+        record = {
+            "timestamp": time.time(),
+            **getattr(_context, "fields", {}),
+            **fields,
+            "latency": round(latency, 6),
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": retries,
+            "request_bytes": request_bytes,
+            "response_bytes": response_bytes,
+            "cached": cached,
+            "failed": failed,
+        }
+        with self._lock:
+            totals = self._totals
+            totals["requests"] += 1
+            totals["cached"] += cached
+            totals["failed"] += failed
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["retries"] += retries
+            totals["request_bytes"] += request_bytes
+            totals["response_bytes"] += response_bytes
+            if not cached:
+                # Cache hits take microseconds and would hide the endpoint's latency
+                totals["latency_seconds"] += latency
+                self._latencies.append(latency)
+                self._prompt_tokens.append(prompt_tokens)
+                self._completion_tokens.append(completion_tokens)
+                document = record.get("document")
+                if document is not None:
+                    self._document_seconds[document] = self._document_seconds.get(document, 0.0) + latency
+        if self.sink:
+            self.sink.write(record, self)
+
+    def snapshot(self):
+        """Copy of the run totals."""
+        with self._lock:
+            return dict(self._totals)
+
+    def summary(self):
+        """p50/p95/p99 of latency and token counts over the uncached requests of this run."""
+        with self._lock:
+            series = {
+                "latency": sorted(self._latencies),
+                "prompt_tokens": sorted(self._prompt_tokens),
+                "completion_tokens": sorted(self._completion_tokens),
+            }
+        return {name: {quantile: percentile(values, quantile) for quantile in QUANTILES} for name, values in series.items()}
+
+    def slowest_documents(self, count=SLOWEST_DOCUMENTS):
+        with self._lock:
+            return sorted(self._document_seconds.items(), key=lambda item: item[1], reverse=True)[:count]
+
+    def log_summary(self):
+        totals = self.snapshot()
+        summary = self.summary()
+        logging.info(f"Total API requests sent: {totals['requests'] - totals['cached']} "
+                     f"({totals['cached']} served from cache, {totals['failed']} failed, {totals['retries']} retries)")
+        logging.info(f"Total tokens sent: {totals['prompt_tokens']}")
+        logging.info(f"Total tokens received: {totals['completion_tokens']}")
+        logging.info(f"Total tokens used: {totals['prompt_tokens'] + totals['completion_tokens']}")
+        for name, unit in (("latency", "s"), ("prompt_tokens", ""), ("completion_tokens", "")):
+            values = ", ".join(f"p{int(quantile * 100)} {summary[name][quantile]:.2f}{unit}" for quantile in QUANTILES)
+            logging.info(f"Request {name.replace('_', ' ')}: {values}")
+        for document, seconds in self.slowest_documents():
+            logging.info(f"Slow document: {document} ({seconds:.1f}s of request time)")
+
+    def close(self):
+        if self.sink:
+            self.sink.close(self)
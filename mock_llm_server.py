@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import uuid
+import re
+import random
+import argparse
+import tempfile
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+CHARS_PER_TOKEN = 4
+PARAGRAPHS_PER_TOPIC = 3
+PART_LINE = re.compile(r"^<<<PART \d+>>>$", re.MULTILINE)  # Packed requests, see prompts.py
+
+
+def echo_topics(text):
+    """Echo the document back as "Topic_" sections, a few paragraphs each, the way the extraction prompt asks."""
+    paragraphs = [paragraph.strip() for paragraph in text.split("\n\n") if paragraph.strip()]
+    sections = []
+    for i in range(0, len(paragraphs), PARAGRAPHS_PER_TOPIC):
+        sections.append(f"Topic_Section {i // PARAGRAPHS_PER_TOPIC + 1}\n" + "\n".join(paragraphs[i:i + PARAGRAPHS_PER_TOPIC]) + "\n")
+    return "".join(sections)
+
+
+def echo_packed_topics(text):
+    """echo_topics for each part of a packed request, each after its marker line."""
+    markers = list(PART_LINE.finditer(text))
+    if not markers:
+        return echo_topics(text)
+    parts = []
+    for marker, following in zip(markers, markers[1:] + [None]):
+        body = text[marker.end():following.start() if following else len(text)]
+        parts.append(f"{marker.group(0)}\n{echo_topics(body)}")
+    return "".join(parts)
+
+
+class MockCompletionsServer:
+    """Local stand-in for an OpenAI-compatible /chat/completions endpoint.
+
+    Each request waits `latency` seconds (plus up to `jitter`) before the
+    first byte, then delivers the completion at `tokens_per_second` (0 means
+    instantly). A fraction `error_rate` of requests, and the first
+    `fail_first`, get an `error_status` (503) with a Retry-After of
+    `retry_after` seconds, so the client's retry path is exercised too. Both
+    plain and streaming (SSE) requests are supported; the first
+    `drop_streams` streams are cut off halfway, as a dropped connection would.
+
+    /files and /batches are served from a temporary directory as a
+    stand-in for the provider's batch API. A batch finishes `batch_delay`
+    seconds after it is created.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, tokens_per_second=0.0, error_rate=0.0, seed=0, batch_delay=1.0,
+                 fail_first=0, error_status=503, retry_after="0", drop_streams=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.batch_delay = batch_delay
+        self.fail_first = fail_first
+        self.error_status = error_status
+        self.retry_after = retry_after  # None sends no Retry-After header
+        self.drop_streams = drop_streams
+        self.requests = 0
+        self.errors = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._files_directory = tempfile.TemporaryDirectory(prefix="mock-llm-files-")
+        self._batches = {}
+        self._server = ThreadingHTTPServer((host, port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def _draw(self):
+        with self._lock:
+            self.requests += 1
+            failed = self._random.random() < self.error_rate or self.requests <= self.fail_first
+            self.errors += failed
+            delay = self.latency + self._random.uniform(0, self.jitter)
+        return failed, delay
+
+    def complete(self, payload):
+        """Echo completion text and usage for a chat payload."""
+        messages = payload.get("messages", [])
+        content = echo_packed_topics(messages[-1]["content"] if messages else "")
+        prompt_tokens = sum(len(message.get("content", "")) for message in messages) // CHARS_PER_TOKEN
+        completion_tokens = len(content) // CHARS_PER_TOKEN
+        return content, {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens, "total_tokens": prompt_tokens + completion_tokens}
+
+    def _file_path(self, file_id):
+        return os.path.join(self._files_directory.name, os.path.basename(file_id))
+
+    def _store_file(self, data):
+        file_id = f"file-{uuid.uuid4().hex}"
+        with open(self._file_path(file_id), 'wb') as file:
+            file.write(data)
+        return file_id
+
+    def _create_batch(self, request):
+        batch = {
+            "id": f"batch_{uuid.uuid4().hex}",
+            "object": "batch",
+            "endpoint": request.get("endpoint"),
+            "input_file_id": request["input_file_id"],
+            "completion_window": request.get("completion_window"),
+            "status": "validating",
+            "output_file_id": None,
+            "error_file_id": None,
+            "created_at": int(time.time()),
+        }
+        with self._lock:
+            self._batches[batch["id"]] = batch
+        threading.Thread(target=self._run_batch, args=(batch,), daemon=True).start()
+        return dict(batch)
+
+    def _run_batch(self, batch):
+        batch["status"] = "in_progress"
+        time.sleep(self.batch_delay)
+        outputs, errors = [], []
+        with open(self._file_path(batch["input_file_id"]), 'r', encoding='utf-8') as file:
+            for line in file:
+                request = json.loads(line)
+                failed, _ = self._draw()
+                if failed:
+                    errors.append({"custom_id": request["custom_id"], "response": {"status_code": 503, "body": {"error": {"message": "Mock overload"}}}})
+                    continue
+                content, usage = self.complete(request["body"])
+                body = {
+                    "object": "chat.completion",
+                    "model": request["body"].get("model"),
+                    "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                    "usage": usage,
+                }
+                outputs.append({"custom_id": request["custom_id"], "response": {"status_code": 200, "body": body}, "error": None})
+        with self._lock:
+            batch["output_file_id"] = self._store_file("".join(json.dumps(output) + "\n" for output in outputs).encode("utf-8"))
+            batch["error_file_id"] = self._store_file("".join(json.dumps(error) + "\n" for error in errors).encode("utf-8")) if errors else None
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+            batch["status"] = "completed"
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send_json(self, status, body, extra_headers=()):
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in extra_headers:
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _send_chunk(self, data):
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                self.wfile.flush()
+
+            def do_GET(self):
+                parts = self.path.strip("/").split("/")
+                if len(parts) == 2 and parts[0] == "batches":
+                    with server._lock:
+                        batch = server._batches.get(parts[1])
+                        batch = dict(batch) if batch else None
+                    if batch is None:
+                        self._send_json(404, {"error": {"message": f"No batch {parts[1]}"}})
+                    else:
+                        self._send_json(200, batch)
+                elif len(parts) == 3 and parts[0] == "files" and parts[2] == "content" and os.path.exists(server._file_path(parts[1])):
+                    with open(server._file_path(parts[1]), 'rb') as file:
+                        data = file.read()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/jsonl")
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                else:
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+            def _upload(self, body):
+                message = BytesParser(policy=HTTP).parsebytes(
+                    f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode("utf-8") + body
+                )
+                for part in message.iter_parts():
+                    if part.get_param("name", header="content-disposition") == "file":
+                        file_id = server._store_file(part.get_payload(decode=True))
+                        self._send_json(200, {"id": file_id, "object": "file", "purpose": "batch"})
+                        return
+                self._send_json(400, {"error": {"message": "Missing file field"}})
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers["Content-Length"]))
+                path = self.path.rstrip("/")
+                if path == "/files":
+                    self._upload(body)
+                    return
+                if path == "/batches":
+                    self._send_json(200, server._create_batch(json.loads(body)))
+                    return
+                if path != "/chat/completions":
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+                payload = json.loads(body)
+                failed, delay = server._draw()
+                time.sleep(delay)
+                if failed:
+                    headers = [("Retry-After", server.retry_after)] if server.retry_after is not None else []
+                    self._send_json(server.error_status, {"error": {"message": "Mock overload"}}, headers)
+                    return
+
+                content, usage = server.complete(payload)
+                completion_tokens = usage["completion_tokens"]
+                generation_seconds = completion_tokens / server.tokens_per_second if server.tokens_per_second else 0.0
+
+                if not payload.get("stream"):
+                    time.sleep(generation_seconds)
+                    self._send_json(200, {
+                        "object": "chat.completion",
+                        "model": payload.get("model"),
+                        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                        "usage": usage,
+                    })
+                    return
+
+                with server._lock:
+                    dropped = server.drop_streams > 0
+                    server.drop_streams -= dropped
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                pieces = [content[i:i + 64] for i in range(0, len(content), 64)] or [""]
+                for i, piece in enumerate(pieces):
+                    if dropped and i == len(pieces) // 2:
+                        # No terminating chunk: the client sees the connection close mid-stream
+                        self.close_connection = True
+                        return
+                    time.sleep(generation_seconds / len(pieces))
+                    event = {"choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}]}
+                    self._send_chunk(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                final = {"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}], "usage": usage}
+                self._send_chunk(f"data: {json.dumps(final)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.write(b"0\r\n\r\n")
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="mock-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        self._files_directory.cleanup()
+
+
+def add_server_arguments(parser):
+    parser.add_argument("--latency", type=float, default=0.2, help="Seconds before the first byte of each response")
+    parser.add_argument("--jitter", type=float, default=0.1, help="Extra random latency of up to this many seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Completion generation speed; 0 is instant")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered with a 503")
+    parser.add_argument("--batch-delay", type=float, default=1.0, help="Seconds a submitted batch takes to complete")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a mock OpenAI-compatible /chat/completions endpoint.")
+    parser.add_argument("--port", type=int, default=8000)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+
+    server = MockCompletionsServer(port=args.port, latency=args.latency, jitter=args.jitter,
+                                   tokens_per_second=args.tokens_per_second, error_rate=args.error_rate, batch_delay=args.batch_delay)
+    print(f"Serving mock completions at {server.base_url}")
+    server.start()
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
@@ -0,0 +1,121 @@
+import os
+import json
+import time
+import zlib
+import logging
+import sqlite3
+import threading
+
+from unstructured.staging.base import elements_from_json, elements_to_json
+
+from manifest import hash_file, hash_text, partitioner_version
+
+PARTITION_CACHE_PATH = os.getenv("PARTITION_CACHE_PATH", os.path.join(".partition_cache", "elements.sqlite3"))
+PARTITION_CACHE_MAX_BYTES = int(os.getenv("PARTITION_CACHE_MAX_BYTES", str(2 * 1024 * 1024 * 1024)))  # 2 GiB
+PARTITION_CACHE_BYPASS = os.getenv("PARTITION_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
+COMPRESSION_LEVEL = 6
+
+
+def make_partition_key(file_path, partitioner, options):
+    """Hash of the file's content, the partitioner and its options, and the unstructured version."""
+    return hash_text(
+        hash_file(file_path),
+        f"{partitioner.__module__}.{partitioner.__name__}",
+        json.dumps(options, sort_keys=True, default=str),
+        partitioner_version(),
+    )
+
+
+class PartitionCache:
+    """Persistent, size-bounded LRU cache of unstructured element lists stored in SQLite.
+
+    Elements are kept as zlib-compressed element JSON, so their types and
+    metadata (page numbers, coordinates, parent ids) survive and a document
+    can be re-rendered to text without partitioning it again. Several
+    partition worker processes can share one cache file.
+    """
+
+    def __init__(self, path=PARTITION_CACHE_PATH, max_bytes=PARTITION_CACHE_MAX_BYTES, bypass=PARTITION_CACHE_BYPASS):
+        self.path = path
+        self.max_bytes = max_bytes
+        # When bypassed, lookups always miss but fresh partitions are still stored
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Worker processes write concurrently, so wait for SQLite's lock rather than failing
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS elements ("
+            "key TEXT PRIMARY KEY, source TEXT NOT NULL, data BLOB NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS elements_last_access ON elements (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Return the cached elements for key, or None on a miss."""
+        if self.bypass:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM elements WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE elements SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+        return elements_from_json(text=zlib.decompress(row[0]).decode("utf-8"))
+
+    def put(self, key, source, elements):
+        """Store elements and evict least recently used entries beyond max_bytes."""
+        data = zlib.compress(elements_to_json(elements).encode("utf-8"), COMPRESSION_LEVEL)
+        if len(data) > self.max_bytes:
+            logging.warning(f"Elements of {source} take {len(data)} bytes, over the cache limit of {self.max_bytes} bytes. Not caching.")
+            return
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO elements (key, source, data, size, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, source, data, len(data), time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM elements").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM elements ORDER BY last_access"):
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._conn.executemany("DELETE FROM elements WHERE key = ?", evicted)
+        logging.info(f"Evicted {len(evicted)} cached partitions to stay under {self.max_bytes} bytes.")
+
+    def partition(self, file_path, partitioner, **options):
+        """Elements of file_path from the cache, or from running partitioner and caching the result."""
+        key = make_partition_key(file_path, partitioner, options)
+        elements = self.get(key)
+        if elements is None:
+            elements = partitioner(filename=file_path, **options)
+            self.put(key, file_path, elements)
+        return elements
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        logging.info(f"Partition cache hits: {self.hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate)")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
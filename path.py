@@ -1,35 +1,165 @@
 import os
+import queue
+import logging
+import argparse
+import threading
+from datetime import datetime
+from fnmatch import fnmatchcase
 
-def get_files_by_type(folder_path):
-    pdf_files = []
-    html_files = []
-    docx_files = []
-
-    # Traverse through all files and subdirectories within the folder
-    for root, dirs, files in os.walk(folder_path):
-        for file in files:
-            file_path = os.path.join(root, file)
-            if file.endswith('.pdf'):
-                pdf_files.append(os.path.abspath(file_path))
-            elif file.endswith('.html') or file.endswith('.htm'):
-                html_files.append(os.path.abspath(file_path))
-            elif file.endswith('.docx'):
-                docx_files.append(os.path.abspath(file_path))
+# Lower-case extension -> key in the get_files_by_type result
+FILE_TYPES = {
+    '.pdf': 'pdf_files',
+    '.html': 'html_files',
+    '.htm': 'html_files',
+    '.docx': 'docx_files',
+}
+DISCOVERY_WORKERS = int(os.getenv("DISCOVERY_WORKERS", "8"))  # Directories scanned at the same time
 
+
+def _matches(relative_path, patterns):
+    """Case-insensitive glob match against the path relative to the scan root, or against the name alone."""
+    relative_path = relative_path.lower()
+    name = relative_path.rsplit('/', 1)[-1]
+    return any(fnmatchcase(relative_path, pattern) or fnmatchcase(name, pattern) for pattern in patterns)
+
+
+def iter_files(folder_path, extensions=FILE_TYPES, include=None, exclude=None, modified_since=None, workers=DISCOVERY_WORKERS):
+    """Yield absolute paths of matching files while the tree is still being scanned.
+
+    Subdirectories are scanned with os.scandir by `workers` threads, so a
+    slow network mount is read in parallel and the first files are ready
+    before the walk finishes. Extensions are compared case-insensitively.
+    `include`/`exclude` are globs matched against the path relative to
+    folder_path or the bare name; a directory matching `exclude` is not
+    entered. `modified_since` (datetime or timestamp) skips older files.
+    Unreadable entries are logged and skipped; any other error in a worker
+    is raised here, in the consumer.
+    """
+    root = os.path.abspath(folder_path)
+    extensions = {extension.lower() for extension in extensions}
+    include = [pattern.lower() for pattern in include or []]
+    exclude = [pattern.lower() for pattern in exclude or []]
+    if isinstance(modified_since, datetime):
+        modified_since = modified_since.timestamp()
+
+    directories = queue.Queue()
+    results = queue.Queue(maxsize=workers * 4)  # Lists of files per directory, bounded so the walk waits for the consumer
+    stop = threading.Event()
+    lock = threading.Lock()
+    pending = 1  # Directories queued or being scanned
+
+    prefix_length = len(os.path.join(root, ''))
+
+    def relative(path):
+        return path[prefix_length:].replace(os.sep, '/')
+
+    def scan(directory):
+        files, subdirectories = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            if not exclude or not _matches(relative(entry.path), exclude):
+                                subdirectories.append(entry.path)
+                            continue
+                        if os.path.splitext(entry.name)[1].lower() not in extensions or not entry.is_file():
+                            continue
+                        if include and not _matches(relative(entry.path), include):
+                            continue
+                        if exclude and _matches(relative(entry.path), exclude):
+                            continue
+                        if modified_since is not None and entry.stat().st_mtime < modified_since:
+                            continue
+                        files.append(entry.path)
+                    except OSError as e:
+                        logging.warning(f"Skipping {entry.path}: {e}")
+        except OSError as e:
+            logging.warning(f"Cannot scan {directory}: {e}")
+        return files, subdirectories
+
+    def put_result(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def work():
+        nonlocal pending
+        try:
+            while not stop.is_set():
+                directory = directories.get()
+                if directory is None:
+                    return
+                files, subdirectories = scan(directory)
+                with lock:
+                    pending += len(subdirectories)
+                for subdirectory in subdirectories:
+                    directories.put(subdirectory)
+                if files:
+                    put_result(files)
+                # Only counted done once its files are queued, so the sentinel can't overtake a put blocked on a full queue
+                with lock:
+                    pending -= 1
+                    finished = pending == 0
+                if finished:
+                    put_result(None)
+        except BaseException as e:
+            # The directory is never counted done, so the walk would never end; the consumer raises this instead
+            put_result(e)
+
+    directories.put(root)
+    threads = [threading.Thread(target=work, name=f"discover-{i}", daemon=True) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            files = results.get()
+            if files is None:
+                return
+            if isinstance(files, BaseException):
+                raise files
+            yield from files
+    finally:
+        # Also reached when the consumer stops early; idle workers are woken up to exit
+        stop.set()
+        for _ in threads:
+            directories.put(None)
+
+
+def get_files_by_type(folder_path, **options):
+    """All matching files under folder_path grouped by type. Takes the same options as iter_files."""
+    files_by_type = {key: [] for key in FILE_TYPES.values()}
+    for file_path in iter_files(folder_path, **options):
+        files_by_type[FILE_TYPES[os.path.splitext(file_path)[1].lower()]].append(file_path)
+    return files_by_type
+
+
+def add_discovery_arguments(parser):
+    """Command-line options shared by every entry point that discovers files."""
+    parser.add_argument("--include", nargs="+", default=None, help="Only files matching one of these globs, e.g. '*.pdf' 'reports/*'")
+    parser.add_argument("--exclude", nargs="+", default=None, help="Skip files and directories matching these globs")
+    parser.add_argument("--modified-since", type=datetime.fromisoformat, default=None,
+                        help="Only files modified at or after this ISO date/time, e.g. 2024-06-01")
+    parser.add_argument("--discovery-workers", type=int, default=DISCOVERY_WORKERS, help="Directories scanned in parallel")
+
+
+def discovery_options(args):
     return {
-        'pdf_files': pdf_files,
-        'html_files': html_files,
-        'docx_files': docx_files
+        "include": args.include,
+        "exclude": args.exclude,
+        "modified_since": args.modified_since,
+        "workers": args.discovery_workers,
     }
 
-folder_path = '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data'
 
-file_paths_by_type = get_files_by_type(folder_path)
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="List the PDF, Word and HTML documents under a folder as they are found.")
+    parser.add_argument("folder", nargs="?", default='/Users/asr/Desktop/UWC/unstructed-cannabis_data/data')
+    add_discovery_arguments(parser)
+    args = parser.parse_args()
 
-# Print the results
-print("PDF Files:")
-print(file_paths_by_type['pdf_files'])
-print("\nHTML Files:")
-print(file_paths_by_type['html_files'])
-print("\nDOCX Files:")
-print(file_paths_by_type['docx_files'])
+    for file_path in iter_files(args.folder, **discovery_options(args)):
+        print(file_path)
@@ -0,0 +1,238 @@
+import os
+import time
+import queue
+import logging
+import argparse
+import threading
+
+from dotenv import load_dotenv
+
+# Every stage reads its settings when imported, so .env has to be loaded first
+load_dotenv()
+
+import path
+import preprocess_files
+import extract_data_topic_chunks as extractor
+from chunking import get_chunker
+from topic_writer import TOPIC_OUTPUT_FORMATS
+
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "8"))  # Items buffered between two stages
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))  # Documents extracted at the same time
+
+# Passed down a queue once the producing stage has finished
+END_OF_STREAM = object()
+
+
+class StageQueue(queue.Queue):
+    """Bounded queue between two stages that records its depth for the end-of-run report."""
+
+    def __init__(self, name, maxsize):
+        super().__init__(maxsize)
+        self.name = name
+        self.max_depth = 0
+        self.depth_total = 0
+        self.samples = 0
+
+    def put(self, item, block=True, timeout=None):
+        super().put(item, block, timeout)
+        depth = self.qsize()
+        with self.mutex:
+            self.max_depth = max(self.max_depth, depth)
+            self.depth_total += depth
+            self.samples += 1
+
+    def mean_depth(self):
+        return self.depth_total / self.samples if self.samples else 0.0
+
+    def __iter__(self):
+        """Yield items until the producer signals the end of the stream."""
+        while True:
+            item = self.get()
+            if item is END_OF_STREAM:
+                return
+            yield item
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self.started = None
+        self.finished = None
+        self.lock = threading.Lock()
+
+    def record(self, seconds, failed=False):
+        with self.lock:
+            self.items += 1
+            self.failures += int(failed)
+            self.busy_seconds += seconds
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.monotonic()) - self.started
+
+
+def run_workers(stats, worker_count, input_queue, output_queue, handle):
+    """Run handle(item) on worker_count threads, closing output_queue when all of them finish."""
+    remaining = [worker_count]
+    lock = threading.Lock()
+
+    def work():
+        for item in input_queue:
+            start = time.monotonic()
+            try:
+                result = handle(item)
+                failed = result is False
+            except Exception as e:
+                logging.error(f"{stats.name} failed on {item if isinstance(item, str) else item[0]}: {e}")
+                failed = True
+            stats.record(time.monotonic() - start, failed)
+        # Let sibling workers see the end of the stream too
+        input_queue.put(END_OF_STREAM)
+        with lock:
+            remaining[0] -= 1
+            last = remaining[0] == 0
+        if last:
+            stats.finished = time.monotonic()
+            if output_queue is not None:
+                output_queue.put(END_OF_STREAM)
+
+    stats.started = time.monotonic()
+    threads = [threading.Thread(target=work, name=f"{stats.name}-{i}", daemon=True) for i in range(worker_count)]
+    for thread in threads:
+        thread.start()
+    return threads
+
+
+def run_pipeline(folder_path, output_directory, partition_workers, partition_timeout, extract_workers,
+                 max_concurrent_requests, chunk_strategy, queue_size, output_format=extractor.TOPIC_OUTPUT_FORMAT, discovery=None):
+    """Stream documents through discovery, partitioning, extraction and writing with bounded queues.
+
+    discovery holds path.iter_files options (include, exclude, modified_since, workers).
+    """
+    os.makedirs(output_directory, exist_ok=True)
+    manifest = extractor.manifest
+    version = preprocess_files.render_version()
+    chunker = get_chunker(chunk_strategy, **extractor.CHUNKER_OPTIONS.get(chunk_strategy, {}))
+    prompt_hash, document_version = extractor.extraction_versions(chunk_strategy)
+
+    source_queue = StageQueue("discover -> partition", queue_size)
+    text_queue = StageQueue("partition -> extract", queue_size)
+    topics_queue = StageQueue("extract -> write", queue_size)
+    stats = {name: StageStats(name) for name in ("discover", "partition", "extract", "write")}
+
+    def discover():
+        stats["discover"].started = time.monotonic()
+        try:
+            # Files reach the partition stage while the rest of the tree is still being scanned
+            for file_path in path.iter_files(folder_path, **(discovery or {})):
+                stats["discover"].record(0.0)
+                source_queue.put(file_path)
+        finally:
+            stats["discover"].finished = time.monotonic()
+            source_queue.put(END_OF_STREAM)
+
+    def text_path_for(file_path):
+        return os.path.join(preprocess_files.output_dir, preprocess_files.output_file_name_for(file_path))
+
+    source_fingerprints = {}
+
+    def changed_sources():
+        # Unchanged documents skip partitioning and go straight to extraction
+        for file_path in source_queue:
+            fingerprint = manifest.fingerprint("partition", file_path)
+            if manifest.is_current("partition", file_path, version, fingerprint):
+                stats["partition"].record(0.0)
+                text_queue.put(text_path_for(file_path))
+            else:
+                source_fingerprints[file_path] = fingerprint
+                yield file_path
+
+    def partition():
+        stats["partition"].started = time.monotonic()
+        try:
+            for result in preprocess_files.iter_partition_results(changed_sources(), partition_workers, partition_timeout):
+                ok = result["status"] == "ok"
+                stats["partition"].record(result["duration"], failed=not ok)
+                if ok:
+                    text_path = text_path_for(result["file"])
+                    manifest.record_document("partition", result["file"], version, [text_path], source_fingerprints.pop(result["file"], None))
+                    text_queue.put(text_path)
+        finally:
+            stats["partition"].finished = time.monotonic()
+            text_queue.put(END_OF_STREAM)
+
+    def extract(text_path):
+        fingerprint = manifest.fingerprint("extract", text_path)
+        if manifest.is_current("extract", text_path, document_version, fingerprint):
+            logging.info(f"Skipping unchanged file: {os.path.basename(text_path)}")
+            return None
+        all_topics, chunk_ranges, failed_chunks = extractor.extract_file_topics(text_path, chunker, prompt_hash, max_concurrent_requests)
+        if failed_chunks:
+            logging.warning(f"{failed_chunks} chunks of {text_path} failed; the file will be resumed on the next run.")
+            return False
+        topics_queue.put((text_path, all_topics, chunk_ranges, fingerprint))
+
+    def write(item):
+        text_path, all_topics, chunk_ranges, fingerprint = item
+        extractor.save_file_topics(text_path, all_topics, output_directory, document_version, chunk_ranges, output_format, fingerprint)
+
+    threads = [
+        threading.Thread(target=discover, name="discover", daemon=True),
+        threading.Thread(target=partition, name="partition", daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    threads += run_workers(stats["extract"], extract_workers, text_queue, topics_queue, extract)
+    threads += run_workers(stats["write"], 1, topics_queue, None, write)
+    for thread in threads:
+        thread.join()
+
+    return stats, [source_queue, text_queue, topics_queue]
+
+
+def print_report(stats, queues):
+    print("\nStage throughput:")
+    print(f"{'stage':<10} {'items':>7} {'failed':>7} {'busy s':>9} {'elapsed s':>10} {'items/s':>9}")
+    for stage in stats.values():
+        elapsed = stage.elapsed()
+        rate = stage.items / elapsed if elapsed else 0.0
+        print(f"{stage.name:<10} {stage.items:>7} {stage.failures:>7} {stage.busy_seconds:>9.1f} {elapsed:>10.1f} {rate:>9.2f}")
+
+    print("\nQueue depths:")
+    for stage_queue in queues:
+        print(f"{stage_queue.name:<24} max {stage_queue.max_depth:>3}/{stage_queue.maxsize}  mean {stage_queue.mean_depth():.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Discover, partition, chunk, extract and write topics in one streaming run.")
+    parser.add_argument("input", help="Folder to scan for PDF, Word and HTML documents")
+    parser.add_argument("--output", default="extracted_topics", help="Directory for extracted topic files")
+    parser.add_argument("--partition-workers", type=int, default=preprocess_files.PARTITION_WORKERS)
+    parser.add_argument("--partition-timeout", type=float, default=preprocess_files.PARTITION_TIMEOUT)
+    parser.add_argument("--extract-workers", type=int, default=EXTRACT_WORKERS, help="Documents extracted at the same time")
+    parser.add_argument("--max-concurrent-requests", type=int, default=extractor.MAX_CONCURRENT_REQUESTS, help="In-flight API requests per document")
+    parser.add_argument("--chunk-strategy", default=extractor.CHUNK_STRATEGY, choices=list(extractor.CHUNKER_OPTIONS))
+    parser.add_argument("--output-format", default=extractor.TOPIC_OUTPUT_FORMAT, choices=TOPIC_OUTPUT_FORMATS, help="One file per topic, or one JSONL/Parquet file per document")
+    parser.add_argument("--queue-size", type=int, default=PIPELINE_QUEUE_SIZE, help="Items buffered between stages")
+    path.add_discovery_arguments(parser)
+    args = parser.parse_args()
+
+    logging.info(f"Starting pipeline on {args.input}")
+    try:
+        stats, queues = run_pipeline(
+            args.input, args.output, args.partition_workers, args.partition_timeout, args.extract_workers,
+            args.max_concurrent_requests, args.chunk_strategy, args.queue_size, args.output_format,
+            path.discovery_options(args),
+        )
+        print_report(stats, queues)
+    finally:
+        extractor.log_token_usage()
+        logging.info("Processing complete.")
+
+
+if __name__ == "__main__":
+    main()
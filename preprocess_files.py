@@ -1,45 +1,234 @@
 import os
+import time
+import argparse
+import multiprocessing
+from multiprocessing.connection import wait
+from dotenv import load_dotenv
+
+# The partition cache and discovery read their settings on import
+load_dotenv()
+
 from unstructured.partition.pdf import partition_pdf
-from bs4 import BeautifulSoup
 from unstructured.partition.docx import partition_docx
+from unstructured.partition.html import partition_html
+import path
+from manifest import Manifest, hash_text, partitioner_version
+from partition_cache import PartitionCache
+from html_extract import extract_html_file
 
 # Specify the directory to save the text files
-output_dir = "output_text_files"
-os.makedirs(output_dir, exist_ok=True)
+output_dir = "output_text_files"  # Created when the first file is written
+
+PARTITION_WORKERS = int(os.getenv("PARTITION_WORKERS", str(os.cpu_count() or 1)))
+PARTITION_TIMEOUT = float(os.getenv("PARTITION_TIMEOUT", "1800"))  # Seconds allowed per file
+# Rendering settings; changing them re-renders every file from the partition cache
+ELEMENT_SEPARATOR = os.getenv("ELEMENT_SEPARATOR", "\\n\\n").encode().decode("unicode_escape")
+ELEMENT_TYPES = [name for name in os.getenv("ELEMENT_TYPES", "").split(",") if name]  # e.g. "Title,NarrativeText"; empty keeps all
+# File types converted by the streaming fast path instead of unstructured, e.g. ".html,.htm"
+FAST_PATH_EXTENSIONS = [extension.strip().lower() for extension in os.getenv("FAST_PATH_EXTENSIONS", "").split(",") if extension.strip()]
+
+# Bumped when output_file_name_for changes, so every source is written again under its new name
+OUTPUT_NAMING = "path-hash-v1"
 
-def save_to_file(file_name, elements):
+def render_version():
+    """Partition stage version: the partitioner plus the settings used to render its elements to text."""
+    return hash_text(partitioner_version(), ELEMENT_SEPARATOR, ",".join(ELEMENT_TYPES), ",".join(sorted(FAST_PATH_EXTENSIONS)), OUTPUT_NAMING)
+
+def write_replacing(output_path, write):
+    """Call write(temp_path), then move the finished file over output_path, so readers never see half a file."""
+    # One partition process per source, so the pid keeps concurrent writers apart
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    try:
+        write(temp_path)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+def save_to_file(file_name, elements, separator=ELEMENT_SEPARATOR, element_types=ELEMENT_TYPES):
     """Save the extracted content to a text file."""
-    with open(os.path.join(output_dir, file_name), 'w') as f:
-        for element in elements:
-            f.write(str(element) + "\n\n")
+    def write(temp_path):
+        with open(temp_path, 'w') as f:
+            for element in elements:
+                if element_types and getattr(element, "category", None) not in element_types:
+                    continue
+                f.write(str(element) + separator)
+    write_replacing(os.path.join(output_dir, file_name), write)
 
 def process_pdf_files(pdf_files):
     """Process multiple PDF files and save their content."""
     for pdf_file in pdf_files:
         print(f"Processing {pdf_file}...")
         elements = partition_pdf(filename=pdf_file)
-        output_file_name = os.path.basename(pdf_file).replace('.pdf', '.txt')
-        save_to_file(output_file_name, elements)
-
-def process_html_file(html_file):
-    """Process an HTML file and save its content."""
-    # print(f"Processing {html_file}...")
-    # elements = partition_html(filename=html_file)
-    # output_file_name = os.path.basename(html_file).replace('.html', '.txt')
-    # save_to_file(output_file_name, elements)
-    with open(file_path, 'r', encoding='utf-8') as f:
-        soup = BeautifulSoup(f, 'html.parser')
-    return soup.get_text()
+        save_to_file(output_file_name_for(pdf_file), elements)
+
+def process_html_file(html_file, cache=None):
+    """Process an HTML file and save its content, with the streaming extractor if FAST_PATH_EXTENSIONS lists its extension."""
+    print(f"Processing {html_file}...")
+    partition_file(html_file, cache)
 
 def process_docx_files(docx_files):
     """Process multiple Word (.docx) files and save their content."""
     for docx_file in docx_files:
         print(f"Processing {docx_file}...")
         elements = partition_docx(filename=docx_file)
-        output_file_name = os.path.basename(docx_file).replace('.docx', '.txt')
-        save_to_file(output_file_name, elements)
+        save_to_file(output_file_name_for(docx_file), elements)
+
+PARTITIONERS = {
+    '.pdf': partition_pdf,
+    '.docx': partition_docx,
+    '.html': partition_html,
+    '.htm': partition_html,
+}
+
+# Streaming converters that write text directly, selected per extension with FAST_PATH_EXTENSIONS
+FAST_PATH_EXTRACTORS = {
+    '.html': extract_html_file,
+    '.htm': extract_html_file,
+}
+
+def output_file_name_for(file_path):
+    """Text file name for a source: its name plus a short hash of its full path, so dir1/report.pdf and dir2/report.pdf stay apart."""
+    stem = os.path.splitext(os.path.basename(file_path))[0]
+    return f"{stem}_{hash_text(os.path.abspath(file_path))[:8]}.txt"
+
+def partition_file(file_path, cache=None):
+    """Partition a single PDF, Word or HTML file and save its content, reusing cached elements when given a cache."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in FAST_PATH_EXTENSIONS and extension in FAST_PATH_EXTRACTORS:
+        write_replacing(os.path.join(output_dir, output_file_name_for(file_path)),
+                        lambda temp_path: FAST_PATH_EXTRACTORS[extension](file_path, temp_path, ELEMENT_SEPARATOR))
+        return
+    partitioner = PARTITIONERS[extension]
+    elements = cache.partition(file_path, partitioner) if cache else partitioner(filename=file_path)
+    save_to_file(output_file_name_for(file_path), elements)
+
+def _partition_worker(file_path, connection):
+    """Run partition_file in a child process and report any error back to the parent."""
+    cache = None
+    try:
+        cache = PartitionCache()
+        partition_file(file_path, cache)
+        connection.send(None)
+    except Exception as e:
+        connection.send(f"{type(e).__name__}: {e}")
+    finally:
+        if cache:
+            cache.close()
+        connection.close()
+
+def _finish(process, connection):
+    """Collect the outcome of a child process that has exited."""
+    process.join()
+    try:
+        error = connection.recv()
+    except EOFError:
+        # No message means the child died without reaching its except block (e.g. a segfault or OOM kill)
+        return "failed", f"Worker exited with code {process.exitcode}"
+    finally:
+        connection.close()
+    return ("failed", error) if error else ("ok", None)
+
+def iter_partition_results(file_paths, workers=PARTITION_WORKERS, timeout=PARTITION_TIMEOUT):
+    """Partition files in up to `workers` child processes, one process per file.
+
+    A file that raises, crashes its process or runs past `timeout` seconds is
+    recorded as failed and the rest of the batch carries on. file_paths is
+    consumed lazily, and a result dict with the file's status, duration and
+    failure reason is yielded as soon as each file finishes.
+    """
+    file_paths = iter(file_paths)
+    exhausted = False
+    running = {}
+
+    while True:
+        while not exhausted and len(running) < workers:
+            file_path = next(file_paths, None)
+            if file_path is None:
+                exhausted = True
+                break
+            print(f"Processing {file_path}...")
+            receiver, sender = multiprocessing.Pipe(duplex=False)
+            process = multiprocessing.Process(target=_partition_worker, args=(file_path, sender), daemon=True)
+            process.start()
+            sender.close()
+            running[process.sentinel] = (process, receiver, file_path, time.monotonic())
+
+        if not running:
+            return
+
+        next_deadline = min(started + timeout for _, _, _, started in running.values())
+        ready = wait(list(running), timeout=max(0.0, next_deadline - time.monotonic()))
+
+        now = time.monotonic()
+        for sentinel in list(running):
+            process, receiver, file_path, started = running[sentinel]
+            if sentinel in ready:
+                status, reason = _finish(process, receiver)
+            elif now - started >= timeout:
+                process.terminate()
+                process.join()
+                receiver.close()
+                status, reason = "timeout", f"Exceeded {timeout:.0f}s"
+            else:
+                continue
+            del running[sentinel]
+            if status != "ok":
+                print(f"Failed {file_path}: {reason}")
+            yield {"file": file_path, "status": status, "duration": now - started, "reason": reason}
+
+def process_files_parallel(file_paths, workers=PARTITION_WORKERS, timeout=PARTITION_TIMEOUT):
+    """Partition a batch of files in parallel and return one result dict per file."""
+    return list(iter_partition_results(file_paths, workers=workers, timeout=timeout))
+
+def process_changed_files(file_paths, manifest, workers=PARTITION_WORKERS, timeout=PARTITION_TIMEOUT):
+    """Partition only files that are new or changed since the last successful run.
+
+    file_paths may be a lazy iterable such as path.iter_files, in which case
+    partitioning starts while discovery is still running.
+    """
+    version = render_version()
+    skipped = 0
+    fingerprints = {}  # Taken before partitioning, so a file changed meanwhile is not recorded as done
+
+    def changed_files():
+        nonlocal skipped
+        for file_path in file_paths:
+            fingerprint = manifest.fingerprint("partition", file_path)
+            if manifest.is_current("partition", file_path, version, fingerprint):
+                skipped += 1
+            else:
+                fingerprints[file_path] = fingerprint
+                yield file_path
+
+    results = []
+    for result in iter_partition_results(changed_files(), workers=workers, timeout=timeout):
+        if result["status"] == "ok":
+            output_file = os.path.join(output_dir, output_file_name_for(result["file"]))
+            manifest.record_document("partition", result["file"], version, [output_file], fingerprints.pop(result["file"], None))
+        results.append(result)
+    print(f"{skipped} unchanged files were skipped.")
+    return results
+
+def print_summary(results):
+    """Print per-file partitioning duration and failure reason, slowest first."""
+    failed = [result for result in results if result["status"] != "ok"]
+    print(f"\nPartitioned {len(results) - len(failed)}/{len(results)} files.")
+    for result in sorted(results, key=lambda result: result["duration"], reverse=True):
+        line = f"{result['duration']:8.1f}s  {result['status']:<7}  {os.path.basename(result['file'])}"
+        if result["reason"]:
+            line += f"  ({result['reason']})"
+        print(line)
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Partition PDF and Word files into text files.")
+    parser.add_argument("--workers", type=int, default=PARTITION_WORKERS, help="Number of files to partition in parallel")
+    parser.add_argument("--timeout", type=float, default=PARTITION_TIMEOUT, help="Seconds allowed per file before it is abandoned")
+    parser.add_argument("--input", default=None, help="Folder to scan for documents instead of the built-in file lists")
+    path.add_discovery_arguments(parser)
+    args = parser.parse_args()
+
     # List of PDF files to process
     pdf_files = ['/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/408880.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/370433.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/370432.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/380716.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/410799.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/370430.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/370431.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/389719.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/387650.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/389720.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/387651.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/406274.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/DS_Data_guidance_on_quality_requirements_for_medicinal_cannabis_products_conforming_with _TGO_93_V1_20240611.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/412110.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/442335.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/442334.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/333147.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/DS_Data_Introduction_to_Medicinal Cannabis_2nd_Edition_V1_20240611.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/348491.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/373214.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/403958.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/442333.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/373217.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/381258.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/417505.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/380811.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/408590.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/376189.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/417502.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/417501.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/333148.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/386353.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/381990.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/451246.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/420871.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/386355.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/386354.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/420870.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/420872.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/386356.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/399510.pdf', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/326240.pdf']
     
@@ -49,8 +238,13 @@ if __name__ == "__main__":
     docx_files = ['/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/DS_Data_TGO93_Compilation_No.3_Dec_2022_V1_20240611.docx', '/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/DS_Data_advertising_guidance_businesses_medicinal_cannabis_products_V1_20240611.docx']
     
     # Process the files
-    process_pdf_files(pdf_files)
-    process_html_file(html_file)
-    process_docx_files(docx_files)
+    manifest = Manifest()
+    if args.input:
+        # Discovered files stream straight into the partition workers
+        results = process_changed_files(path.iter_files(args.input, **path.discovery_options(args)), manifest, workers=args.workers, timeout=args.timeout)
+    else:
+        # The HTML file goes through the same manifest, partition cache and fast-path choice as the rest
+        results = process_changed_files(pdf_files + docx_files + [html_file], manifest, workers=args.workers, timeout=args.timeout)
+    print_summary(results)
 
     print(f"All files have been processed and saved in the '{output_dir}' folder.")
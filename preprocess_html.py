@@ -1,5 +1,12 @@
 import os
+from dotenv import load_dotenv
+
+# The partition cache reads its settings on import
+load_dotenv()
+
 from unstructured.partition.html import partition_html
+from manifest import Manifest, partitioner_version
+from partition_cache import PartitionCache
 
 output_dir = "output_text_files_html"
 os.makedirs(output_dir, exist_ok=True)
@@ -10,10 +17,10 @@ def save_to_file(file_name, elements):
         for element in elements:
             f.write(str(element) + "\n\n")
 
-def process_html_file(html_file):
-    """Process an HTML file and save its content."""
+def process_html_file(html_file, cache=None):
+    """Process an HTML file and save its content, reusing cached elements when given a cache."""
     print(f"Processing {html_file}...")
-    elements = partition_html(filename=html_file)
+    elements = cache.partition(html_file, partition_html) if cache else partition_html(filename=html_file)
     output_file_name = os.path.basename(html_file).replace('.html', '.txt')
     save_to_file(output_file_name, elements)
 
@@ -22,6 +29,16 @@ if __name__ == "__main__":
    
     html_file = "/Users/asr/Desktop/UWC/unstructed-cannabis_data/data/DS_Data_Australia_Legal_Cannabis_Market_Size_&_Share_Report_2030_V1_20240611.html"
     
-    process_html_file(html_file)
+    manifest = Manifest()
+    version = partitioner_version()
+    fingerprint = manifest.fingerprint("partition", html_file)
+    if manifest.is_current("partition", html_file, version, fingerprint):
+        print(f"Skipping unchanged file {html_file}")
+    else:
+        cache = PartitionCache()
+        process_html_file(html_file, cache)
+        cache.close()
+        output_file = os.path.join(output_dir, os.path.basename(html_file).replace('.html', '.txt'))
+        manifest.record_document("partition", html_file, version, [output_file], fingerprint)
 
     print(f"All files have been processed and saved in the '{output_dir}' folder.")
@@ -0,0 +1,160 @@
+import os
+import re
+
+from chunking import count_tokens
+from manifest import hash_text
+
+PROMPT_TEMPLATE = os.getenv("PROMPT_TEMPLATE", "topics-v1")  # Name of the extraction prompt in TEMPLATES; "topics-v2" is shorter but re-extracts everything
+PACK_CHUNK_CHARS = int(os.getenv("PACK_CHUNK_CHARS", "0"))  # Chunks shorter than this share a request, e.g. 1000; 0 disables packing
+PACK_MAX_CHARS = int(os.getenv("PACK_MAX_CHARS", "4000"))  # Total text per packed request
+PACK_MAX_PARTS = int(os.getenv("PACK_MAX_PARTS", "8"))
+
+# Chat formats add a few tokens per message and to prime the reply
+TOKENS_PER_MESSAGE = 3
+REPLY_PRIMING_TOKENS = 3
+
+PART_MARKER = "<<<PART {}>>>"
+PART_LINE = re.compile(r"^[ \t]*<<<PART (\d+)>>>[ \t]*$", re.MULTILINE)
+
+# The original prompt, byte for byte, including the chat-template markers it was written with
+TOPICS_V1 = """ system
+    # Objective:
+    You are an AI language model tasked with extracting topics and their related text from a given document. 
+
+    Your task is to identify distinct topics based on the content of the document. For each identified topic, extract **all** relevant information exactly as it appears in the document, without summarizing or altering the text. Each piece of information should be placed under the appropriate topic header.
+
+    # Output Format:
+    The output should be structured in the following format:
+
+    Topic_[Name of Topic_1]
+    [All information related to this topic, including any subtopics or examples, exactly as they appear in the document.]
+
+    If there are multiple topics, the output should continue with:
+
+    Topic_[Name of Another Topic_2]
+    [All information related to this second topic, exactly as it appears in the document.]
+
+    Ensure that:
+    1. **No information is summarized or omitted** during extraction.
+    2. Each topic is distinct and clearly separated.
+    3. Subtopics or examples are grouped under the relevant main topic.
+    4. The information is copied verbatim from the document, retaining the original wording, structure, and details.
+    5. Every topic starts with "Topic_"
+
+    Output only the extracted topics and their full content. Do not include any code, explanations, or implementation details. Please ensure the output is clear, well-organized, and strictly follows the specified format.
+
+    user
+    """
+
+TOPICS_V2 = """Split the document in the user message into its distinct topics and copy all of its text under them.
+
+Format:
+Topic_<Name of the topic>
+<All text about this topic, exactly as it appears in the document>
+
+Rules:
+1. Copy the text verbatim. Do not summarize, reword or omit anything.
+2. Start every topic header with "Topic_".
+3. Keep subtopics and examples under their main topic.
+4. Output only the topics and their text, with no explanations."""
+
+PACKED_RULES = """
+
+The user message holds several independent parts, each starting with a line like <<<PART 1>>>.
+Handle each part on its own. Before the topics of each part, output its marker line unchanged, in the same order."""
+
+
+class PromptTemplate:
+    """A versioned extraction prompt.
+
+    Requests are laid out so everything that never changes comes first:
+    the system message is identical across requests and holds all of the
+    instructions, and the user message holds only the text. Endpoints with
+    prefix caching can then reuse the system prompt across chunks. Packed
+    requests extend the same system message, so they share that prefix too.
+    """
+
+    def __init__(self, name, system, user_prefix=""):
+        self.name = name
+        self.system = system
+        self.user_prefix = user_prefix
+        self.packed_system = system.rstrip() + PACKED_RULES
+
+    @property
+    def version(self):
+        return hash_text(self.name, self.system, self.user_prefix)
+
+    def messages(self, text):
+        return [
+            {"role": "system", "content": self.system},
+            {"role": "user", "content": self.user_prefix + text},
+        ]
+
+    def packed_messages(self, texts):
+        parts = [f"{PART_MARKER.format(i + 1)}\n{text}" for i, text in enumerate(texts)]
+        return [
+            {"role": "system", "content": self.packed_system},
+            {"role": "user", "content": "\n\n".join(parts)},
+        ]
+
+
+TEMPLATES = {
+    # The legacy create_messages also put an empty user_url and a newline before the text
+    "topics-v1": PromptTemplate("topics-v1", TOPICS_V1, user_prefix="\n"),
+    "topics-v2": PromptTemplate("topics-v2", TOPICS_V2),
+}
+
+
+def get_template(name=PROMPT_TEMPLATE):
+    try:
+        return TEMPLATES[name]
+    except KeyError:
+        raise ValueError(f"Unknown prompt template '{name}'. Choose from: {', '.join(TEMPLATES)}")
+
+
+def can_pack(text, pack_chunk_chars=PACK_CHUNK_CHARS):
+    # Text that already contains a marker would confuse the split
+    return 0 < len(text) < pack_chunk_chars and "<<<PART" not in text
+
+
+def pack(items, max_chars=PACK_MAX_CHARS, max_parts=PACK_MAX_PARTS):
+    """Group (key, text) items into lists that each fit in one packed request, keeping their order."""
+    group, size = [], 0
+    for key, text in items:
+        if group and (size + len(text) > max_chars or len(group) >= max_parts):
+            yield group
+            group, size = [], 0
+        group.append((key, text))
+        size += len(text)
+    if group:
+        yield group
+
+
+def split_packed_completion(content, count):
+    """Split a packed completion into one string per part.
+
+    Unless the markers are exactly 1 to count, in order, there is no telling
+    which text belongs to which part, so every part is None and the caller
+    sends them again one at a time.
+    """
+    matches = list(PART_LINE.finditer(content))
+    if [int(match.group(1)) for match in matches] != list(range(1, count + 1)):
+        return [None] * count
+    return [
+        content[match.end():following.start() if following else len(content)].strip("\n")
+        for match, following in zip(matches, matches[1:] + [None])
+    ]
+
+
+def prompt_tokens(messages):
+    """Estimated prompt tokens of a chat request."""
+    return sum(count_tokens(message["content"]) + TOKENS_PER_MESSAGE for message in messages) + REPLY_PRIMING_TOKENS
+
+
+def overhead_ratio(requests):
+    """Share of prompt tokens spent on anything but the text, over (messages, texts) pairs."""
+    total = text_tokens = 0
+    for messages, texts in requests:
+        total += prompt_tokens(messages)
+        text_tokens += sum(count_tokens(text) for text in texts)
+    return (total - text_tokens) / total if total else 0.0
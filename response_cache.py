@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import sqlite3
+import threading
+
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", os.path.join(".llm_cache", "responses.sqlite3"))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))  # 1 GiB
+LLM_CACHE_BYPASS = os.getenv("LLM_CACHE_BYPASS", "0").lower() in ("1", "true", "yes")
+
+# Only these request fields affect the completion, so only they go into the key
+CACHE_KEY_FIELDS = ("model", "messages", "temperature", "top_p", "frequency_penalty", "presence_penalty")
+
+
+def make_cache_key(payload):
+    """Hash the parts of a /chat/completions payload that determine the response."""
+    key_data = {field: payload.get(field) for field in CACHE_KEY_FIELDS}
+    serialized = json.dumps(key_data, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(serialized.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """Persistent, size-bounded LRU cache of chat completion responses stored in SQLite."""
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES, bypass=LLM_CACHE_BYPASS):
+        self.path = path
+        self.max_bytes = max_bytes
+        # When bypassed, lookups always miss but fresh responses are still stored
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.tokens_saved = 0
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _connection(self):
+        """The database, opened on first use so that creating a cache touches no files. Call with self._lock held."""
+        if self._conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+            self._conn.commit()
+        return self._conn
+
+    def get(self, payload):
+        """Return the stored response for payload, or None on a miss."""
+        if self.bypass:
+            with self._lock:
+                self.misses += 1
+            return None
+
+        key = make_cache_key(payload)
+        with self._lock:
+            row = self._connection().execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            response = json.loads(row[0])
+            self.hits += 1
+            usage = response.get("usage", {})
+            self.tokens_saved += usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0)
+            return response
+
+    def put(self, payload, response):
+        """Store a response and evict least recently used entries beyond max_bytes."""
+        key = make_cache_key(payload)
+        serialized = json.dumps(response, ensure_ascii=False)
+        size = len(serialized.encode("utf-8"))
+        if size > self.max_bytes:
+            logging.warning(f"Response of {size} bytes exceeds the cache limit of {self.max_bytes} bytes. Not caching.")
+            return
+
+        with self._lock:
+            self._connection().execute(
+                "INSERT OR REPLACE INTO responses (key, response, size, last_access) VALUES (?, ?, ?, ?)",
+                (key, serialized, size, time.time()),
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        total_size = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        evicted = []
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if total_size <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total_size -= size
+        self._conn.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logging.info(f"Evicted {len(evicted)} cached responses to stay under {self.max_bytes} bytes.")
+
+    def log_stats(self):
+        lookups = self.hits + self.misses
+        hit_rate = (self.hits / lookups * 100) if lookups else 0.0
+        logging.info(f"Response cache hits: {self.hits}, misses: {self.misses} ({hit_rate:.1f}% hit rate)")
+        logging.info(f"Tokens saved by response cache: {self.tokens_saved}")
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
@@ -0,0 +1,227 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from fnmatch import fnmatchcase
+
+from prompts import PACK_MAX_CHARS, PACK_MAX_PARTS
+from topic_merge import TopicMerger
+
+SCHEDULER_POLICY = os.getenv("SCHEDULER_POLICY", "shortest")  # "shortest", "round-robin", "priority" or "fifo"
+SCHEDULER_PRIORITIES = os.getenv("SCHEDULER_PRIORITIES", "")  # e.g. "advisory*=10,*compilation*=-5"; higher goes first
+SCHEDULER_ACTIVE_DOCUMENTS = int(os.getenv("SCHEDULER_ACTIVE_DOCUMENTS", "16"))  # Documents open and interleaved at once
+
+
+def parse_priorities(spec):
+    """[(pattern, priority)] from "pattern=priority,pattern=priority"."""
+    priorities = []
+    for item in spec.split(","):
+        if not item.strip():
+            continue
+        pattern, _, value = item.rpartition("=")
+        if not pattern.strip():
+            raise ValueError(f"Invalid priority '{item}'. Expected pattern=priority")
+        priorities.append((pattern.strip().lower(), int(value)))
+    return priorities
+
+
+def priority_for(filename, priorities):
+    """Priority of the first pattern matching filename (case-insensitive), or 0."""
+    name = filename.lower()
+    for pattern, priority in priorities:
+        if fnmatchcase(name, pattern):
+            return priority
+    return 0
+
+
+class Document:
+    """One document's place in the schedule and the topics merged from its finished chunks."""
+
+    def __init__(self, filepath, order, priority=0):
+        self.filepath = filepath
+        self.filename = os.path.basename(filepath)
+        self.order = order
+        self.priority = priority
+        self.size = os.path.getsize(filepath)  # Stands in for the chunk count, which is unknown until it is chunked
+        self.chunks = None  # Chunk iterator while the document is active
+        self.dispatched = 0
+        self.exhausted = False
+        self.failed_chunks = 0
+        self.merger = TopicMerger()
+        self._results = {}
+        self._next_merge = 0
+
+    @property
+    def complete(self):
+        return self.exhausted and self._next_merge == self.dispatched
+
+    def add_result(self, chunk_index, topics, byte_range):
+        self._results[chunk_index] = (topics, byte_range)
+        # Chunks finish out of order; each is merged once every chunk before it has been, as in a serial run
+        while self._next_merge in self._results:
+            topics, byte_range = self._results.pop(self._next_merge)
+            logging.info(f"Processing chunk {self._next_merge + 1} for file: {self.filename}")
+            if topics is None:
+                logging.error(f"Failed to extract information from chunk {self._next_merge + 1} of {self.filename}.")
+                self.failed_chunks += 1
+            elif topics:
+                self.merger.add_chunk(topics, self._next_merge, byte_range)
+            else:
+                logging.warning(f"No topics found in chunk {self._next_merge + 1} of {self.filename}.")
+            self._next_merge += 1
+
+
+# The active document with the smallest key sends the next chunk
+POLICIES = {
+    "fifo": lambda document: (document.order,),
+    "shortest": lambda document: (document.size, document.order),
+    "round-robin": lambda document: (document.dispatched, document.order),
+    "priority": lambda document: (-document.priority, document.size, document.order),
+}
+
+
+class ChunkScheduler:
+    """Interleave the chunks of many documents over one pool of concurrent requests.
+
+    Up to max_active_documents documents are open at once, admitted in
+    policy order. Each free request slot goes to the active document the
+    policy ranks first:
+
+    - shortest: the smallest file, so short documents finish first
+    - round-robin: the document that has sent the fewest chunks
+    - priority: the highest priority tag, then the smallest file
+    - fifo: the first document, i.e. one after another, but without
+      draining the pool between documents
+
+    A document is handed to on_complete as soon as its last chunk lands,
+    rather than after the whole directory.
+
+    With can_pack and extract_packed, short chunks (small documents, final
+    chunks) that come up one after another are sent several to a request,
+    through the same pool. A group goes out once it is full or the next
+    chunk is not a short one, so short chunks never wait behind the rest of
+    a long document.
+    """
+
+    def __init__(self, policy=SCHEDULER_POLICY, max_concurrent_requests=4, max_active_documents=SCHEDULER_ACTIVE_DOCUMENTS,
+                 pack_max_chars=PACK_MAX_CHARS, pack_max_parts=PACK_MAX_PARTS):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown scheduling policy '{policy}'. Choose from: {', '.join(POLICIES)}")
+        self.policy = policy
+        self.max_concurrent_requests = max(1, max_concurrent_requests)
+        self.max_active_documents = max(1, max_active_documents)
+        self.pack_max_chars = pack_max_chars
+        self.pack_max_parts = max(1, pack_max_parts)
+
+    def run(self, documents, split, extract, on_complete, can_pack=None, extract_packed=None):
+        """Extract every chunk of documents.
+
+        split(filepath) yields (chunk, byte_start, byte_end). extract(document,
+        chunk_index, chunk) runs on a worker thread and returns the chunk's
+        topics, or None if it failed. on_complete(document) runs on the
+        calling thread. extract_packed([(document, chunk_index, chunk)])
+        returns one result per chunk, None for those the completion left
+        out, which are then sent on their own.
+        """
+        key = POLICIES[self.policy]
+        pending = deque(sorted(documents, key=key))
+        active = []
+        in_flight = {}
+        short = []  # (document, chunk_index, chunk, byte_range) held back for the next packed request
+        short_chars = 0
+        ready = deque()  # Chunks to send on their own before reading on, e.g. parts of a failed packed request
+
+        def take_short():
+            nonlocal short, short_chars
+            group, short, short_chars = short, [], 0
+            return group
+
+        def next_work():
+            """The next request: (document, chunk_index, chunk, byte_range), a list of them to pack, or None."""
+            nonlocal short_chars
+            if ready:
+                return ready.popleft()
+            while True:
+                while pending and len(active) < self.max_active_documents:
+                    document = pending.popleft()
+                    document.chunks = split(document.filepath)
+                    active.append(document)
+                if not active:
+                    # Nothing else to send, so a partly filled group goes as it is
+                    return take_short() or None
+                document = min(active, key=key)
+                item = next(document.chunks, None)
+                if item is None:
+                    document.exhausted = True
+                    active.remove(document)
+                    if document.complete:
+                        on_complete(document)
+                    continue
+                chunk, byte_start, byte_end = item
+                document.dispatched += 1
+                work = (document, document.dispatched - 1, chunk, (byte_start, byte_end))
+                if not (can_pack and can_pack(chunk)):
+                    if short:
+                        # The held group goes first rather than waiting for more short chunks
+                        ready.append(work)
+                        return take_short()
+                    return work
+                full = short and (short_chars + len(chunk) > self.pack_max_chars or len(short) >= self.pack_max_parts)
+                group = take_short() if full else None
+                short.append(work)
+                short_chars += len(chunk)
+                if group:
+                    return group
+
+        def submit(work):
+            if isinstance(work, list):
+                future = executor.submit(extract_packed, [(document, chunk_index, chunk) for document, chunk_index, chunk, _ in work])
+            else:
+                document, chunk_index, chunk, _ = work
+                future = executor.submit(extract, document, chunk_index, chunk)
+            in_flight[future] = work
+
+        def finish(work, topics):
+            document, chunk_index, _, byte_range = work
+            document.add_result(chunk_index, topics, byte_range)
+            if document.complete:
+                on_complete(document)
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrent_requests) as executor:
+            try:
+                while True:
+                    while len(in_flight) < self.max_concurrent_requests:
+                        work = next_work()
+                        if work is None:
+                            break
+                        submit(work)
+                    if not in_flight:
+                        break
+
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        work = in_flight.pop(future)
+                        if isinstance(work, list):
+                            try:
+                                results = future.result()
+                            except Exception as e:
+                                logging.error(f"Packed request for {len(work)} chunks raised an exception: {e}")
+                                results = [None] * len(work)
+                            for part, topics in zip(work, results):
+                                if topics is None:
+                                    ready.append(part)
+                                else:
+                                    finish(part, topics)
+                            continue
+                        try:
+                            topics = future.result()
+                        except Exception as e:
+                            # One document's failure should not stop the others; it is resumed on the next run
+                            logging.error(f"Chunk {work[1] + 1} of {work[0].filename} raised an exception: {e}")
+                            topics = None
+                        finish(work, topics)
+            finally:
+                for future in in_flight:
+                    future.cancel()
+                for document in active:
+                    document.chunks.close()
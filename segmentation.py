@@ -0,0 +1,293 @@
+import os
+import re
+
+import numpy as np
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:
+    SentenceTransformer = None
+
+from chunking import PARAGRAPH_SEPARATOR
+
+SEGMENT_EMBEDDER = os.getenv("SEGMENT_EMBEDDER", "tfidf")  # "tfidf", or a sentence-transformers model name
+SEGMENT_WINDOW = 3  # Paragraphs compared on each side of a candidate boundary
+MIN_SEGMENT_UNITS = 2  # Fewest paragraphs in a topic
+MAX_SEGMENT_CHARS = 12000  # Longer topics are split again at their weakest boundary
+BOUNDARY_STRICTNESS = -0.5  # Depth cutoff in standard deviations from the mean; TextTiling's liberal setting is -0.5
+MAX_FEATURES = 4096  # Most frequent terms kept per document
+EMBEDDING_BATCH_SIZE = 64
+HEADING_MAX_CHARS = 80  # A short first paragraph without a full stop is taken as the topic's heading
+TITLE_TERMS = 4
+
+WORD = re.compile(r"[a-z][a-z0-9]+")
+STOP_WORDS = {
+    "about", "after", "all", "also", "an", "and", "any", "are", "as", "at", "be", "been", "before", "but", "by",
+    "can", "could", "do", "does", "each", "for", "from", "had", "has", "have", "if", "in", "into", "is", "it",
+    "its", "may", "more", "must", "no", "not", "of", "on", "or", "other", "our", "shall", "should", "such",
+    "than", "that", "the", "their", "them", "then", "there", "these", "they", "this", "those", "to", "under",
+    "was", "we", "were", "what", "when", "where", "which", "who", "will", "with", "would", "you", "your",
+}
+
+
+def split_units(text, separator=PARAGRAPH_SEPARATOR):
+    """Paragraphs of text with their (start, end) offsets, so segments keep the original text verbatim."""
+    units, spans = [], []
+    position = 0
+    for part in text.split(separator):
+        if part.strip():
+            units.append(part)
+            spans.append((position, position + len(part)))
+        position += len(part) + len(separator)
+    return units, spans
+
+
+class SparseRows:
+    """Row vectors in CSR form: row i has values data[indptr[i]:indptr[i + 1]] at those positions of indices.
+
+    Only the non-zero entries are stored, so a document's TF-IDF vectors take
+    memory in proportion to its words rather than paragraphs times terms.
+    """
+
+    def __init__(self, rows, columns, data, shape):
+        # Entries sorted by row, then column
+        self.shape = shape
+        self.indices = columns
+        self.data = data
+        self.indptr = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=shape[0]))))
+        self._rows = rows
+        self._keys = rows * shape[1] + columns
+
+    def __len__(self):
+        return self.shape[0]
+
+    def row(self, i):
+        """(columns, values) of row i."""
+        start, end = self.indptr[i], self.indptr[i + 1]
+        return self.indices[start:end], self.data[start:end]
+
+    def offset_dots(self, offset):
+        """Dot product of each row i with row i + offset."""
+        count = len(self) - offset
+        if count <= 0:
+            return np.zeros(0, dtype=np.float32)
+        entries = self._rows < count
+        targets = self._keys[entries] + offset * self.shape[1]
+        positions = np.minimum(np.searchsorted(self._keys, targets), len(self._keys) - 1)
+        found = self._keys[positions] == targets
+        products = self.data[entries][found] * self.data[positions[found]]
+        return np.bincount(self._rows[entries][found], weights=products, minlength=count).astype(np.float32)
+
+
+def tfidf_matrix(units, max_features=MAX_FEATURES):
+    """Row-normalised TF-IDF vectors of units as SparseRows, and the term of each column."""
+    vocabulary = {}
+    rows, columns = [], []
+    for row, unit in enumerate(units):
+        for word in WORD.findall(unit.lower()):
+            if word not in STOP_WORDS:
+                rows.append(row)
+                columns.append(vocabulary.setdefault(word, len(vocabulary)))
+    terms = np.array(list(vocabulary), dtype=object)
+    rows = np.array(rows, dtype=np.int64)
+    columns = np.array(columns, dtype=np.int64)
+
+    if len(terms) > max_features:
+        keep = np.argsort(-np.bincount(columns, minlength=len(terms)), kind="stable")[:max_features]
+        remap = np.full(len(terms), -1, dtype=np.int64)
+        remap[keep] = np.arange(len(keep))
+        columns = remap[columns]
+        rows, columns = rows[columns >= 0], columns[columns >= 0]
+        terms = terms[keep]
+
+    # Each distinct (row, column) pair is one stored entry; its count is the term frequency
+    width = max(1, len(terms))
+    keys, counts = np.unique(rows * width + columns, return_counts=True)
+    rows, columns = keys // width, keys % width
+    document_frequency = np.bincount(columns, minlength=width)
+    idf = np.log((1 + len(units)) / (1 + document_frequency)) + 1
+    weights = (np.log1p(counts) * idf[columns]).astype(np.float32)
+    norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(units))).astype(np.float32)
+    weights /= np.where(norms > 0, norms, 1)[rows]
+    return SparseRows(rows, columns, weights, (len(units), width)), terms
+
+
+class TfidfEmbedder:
+    """Per-document TF-IDF vectors. Needs nothing beyond NumPy."""
+
+    name = "tfidf"
+
+    def embed(self, units):
+        return tfidf_matrix(units)[0]
+
+
+class SentenceEmbedder:
+    """Dense embeddings from a CPU sentence-transformers model, encoded in batches."""
+
+    def __init__(self, model_name):
+        if SentenceTransformer is None:
+            raise RuntimeError(f"Embedding model '{model_name}' requires the sentence-transformers package. Use 'tfidf' instead.")
+        self.name = model_name
+        self.model = SentenceTransformer(model_name, device="cpu")
+
+    def embed(self, units):
+        return self.model.encode(units, batch_size=EMBEDDING_BATCH_SIZE, normalize_embeddings=True, convert_to_numpy=True)
+
+
+_embedders = {}
+
+
+def get_embedder(name=SEGMENT_EMBEDDER):
+    """Shared embedder by name, so a model is loaded once per process."""
+    if name not in _embedders:
+        _embedders[name] = TfidfEmbedder() if name == "tfidf" else SentenceEmbedder(name)
+    return _embedders[name]
+
+
+def offset_dots(vectors, offset):
+    """Dot product of each vector i with vector i + offset, for SparseRows or a dense array."""
+    if isinstance(vectors, SparseRows):
+        return vectors.offset_dots(offset)
+    return np.einsum("ij,ij->i", vectors[:len(vectors) - offset], vectors[offset:])
+
+
+def gap_scores(vectors, window=SEGMENT_WINDOW):
+    """Cosine similarity between the `window` units before and after each gap between units.
+
+    The window sums are never built. Their dot products and norms are sums
+    of dot products between units less than two windows apart, which are
+    computed once per distance and combined for every gap at once.
+    """
+    count = len(vectors)
+    # dots[d][i] is the dot product of units i and i + d, zero past the end
+    dots = np.zeros((2 * window, count), dtype=np.float32)
+    for offset in range(min(2 * window, count)):
+        dots[offset, :count - offset] = offset_dots(vectors, offset)
+
+    gaps = np.arange(1, count)
+    products = np.zeros(len(gaps), dtype=np.float32)
+    left_norms = np.zeros(len(gaps), dtype=np.float32)
+    right_norms = np.zeros(len(gaps), dtype=np.float32)
+    for a in range(window):
+        for b in range(window):
+            # Unit gaps - 1 - a on the left against unit gaps + b on the right
+            left, right = gaps - 1 - a, gaps + b
+            inside = (left >= 0) & (right < count)
+            products += np.where(inside, dots[a + b + 1, np.maximum(left, 0)], 0)
+            # Pairs within one window, indexed by the earlier unit of the pair
+            distance = abs(a - b)
+            first = gaps - 1 - max(a, b)
+            left_norms += np.where(first >= 0, dots[distance, np.maximum(first, 0)], 0)
+            first = gaps + min(a, b)
+            right_norms += np.where(gaps + max(a, b) < count, dots[distance, np.minimum(first, count - 1)], 0)
+    norms = np.sqrt(np.maximum(left_norms, 0) * np.maximum(right_norms, 0))
+    return np.divide(products, norms, out=np.zeros_like(products), where=norms > 0)
+
+
+def depth_scores(scores):
+    """TextTiling depth: how far each gap's similarity lies below the peaks reached climbing out on both sides."""
+    left_peak = scores.copy()
+    for i in range(1, len(scores)):
+        if scores[i - 1] >= scores[i]:
+            left_peak[i] = left_peak[i - 1]
+    right_peak = scores.copy()
+    for i in range(len(scores) - 2, -1, -1):
+        if scores[i + 1] >= scores[i]:
+            right_peak[i] = right_peak[i + 1]
+    return (left_peak - scores) + (right_peak - scores)
+
+
+def find_boundaries(scores, min_units=MIN_SEGMENT_UNITS):
+    """Unit indices that start a new segment, chosen at the deepest similarity valleys."""
+    count = len(scores) + 1
+    if count < 2 * min_units:
+        return []
+    depths = depth_scores(scores)
+    cutoff = depths.mean() + depths.std() * BOUNDARY_STRICTNESS
+    # Only the bottom of each valley is a candidate, not its slopes
+    padded = np.concatenate(([-np.inf], depths, [-np.inf]))
+    valleys = (depths >= padded[:-2]) & (depths >= padded[2:])
+    boundaries = []
+    for gap in np.argsort(-depths, kind="stable"):
+        if depths[gap] <= cutoff or depths[gap] <= 0:
+            break
+        if not valleys[gap]:
+            continue
+        unit = int(gap) + 1
+        if unit < min_units or count - unit < min_units:
+            continue
+        if all(abs(unit - boundary) >= min_units for boundary in boundaries):
+            boundaries.append(unit)
+    return sorted(boundaries)
+
+
+def split_long_segments(boundaries, scores, spans, max_chars=MAX_SEGMENT_CHARS):
+    """Add boundaries at the weakest gap inside any segment longer than max_chars."""
+    pending = [0] + boundaries + [len(spans)]
+    segments = list(zip(pending, pending[1:]))
+    result = []
+    while segments:
+        start, end = segments.pop()
+        if end - start > 1 and spans[end - 1][1] - spans[start][0] > max_chars:
+            # Gap g lies between units g and g + 1
+            weakest = start + int(np.argmin(scores[start:end - 1])) + 1
+            segments.extend([(start, weakest), (weakest, end)])
+        else:
+            result.append(start)
+    return sorted(result)[1:]
+
+
+def segment_document(text, embedder=None, window=SEGMENT_WINDOW, min_units=MIN_SEGMENT_UNITS, max_chars=MAX_SEGMENT_CHARS):
+    """Split text into topical segments. Returns the segments' text and the paragraphs of each."""
+    embedder = embedder or get_embedder()
+    units, spans = split_units(text)
+    if not units:
+        return [], []
+    if len(units) == 1:
+        boundaries = []
+    else:
+        vectors = embedder.embed(units)
+        if not isinstance(vectors, SparseRows):
+            vectors = np.asarray(vectors, dtype=np.float32)
+        scores = gap_scores(vectors, window)
+        boundaries = split_long_segments(find_boundaries(scores, min_units), scores, spans, max_chars)
+
+    starts = [0] + boundaries
+    ends = boundaries + [len(units)]
+    segments = [text[spans[start][0]:spans[end - 1][1]] for start, end in zip(starts, ends)]
+    return segments, [units[start:end] for start, end in zip(starts, ends)]
+
+
+def local_titles(segment_units):
+    """Topic_ header per segment: its leading heading if it has one, else its highest-weighted terms."""
+    weights, terms = tfidf_matrix(["\n".join(units) for units in segment_units])
+    titles = []
+    for i, units in enumerate(segment_units):
+        heading = " ".join(units[0].split())
+        if len(heading) <= HEADING_MAX_CHARS and not heading.endswith("."):
+            titles.append(f"Topic_{heading}")
+            continue
+        columns, values = weights.row(i)
+        # Ties go to the earlier column, as with a stable sort over the full row
+        order = np.lexsort((columns, -values))[:TITLE_TERMS]
+        top = [terms[columns[j]] for j in order if values[j] > 0]
+        titles.append("Topic_" + (" ".join(term.capitalize() for term in top) or f"Section {i + 1}"))
+    return titles
+
+
+def build_topics(segments, titles):
+    """The {"Topic_...": content} dict the extractors produce, numbering repeated titles."""
+    topics = {}
+    for segment, title in zip(segments, titles):
+        key, counter = title, 2
+        while key in topics:
+            key = f"{title}_{counter}"
+            counter += 1
+        topics[key] = segment.strip() + "\n"
+    return topics
+
+
+def segment_topics(text, embedder=None):
+    """Segment and title a document locally, without any API call."""
+    segments, segment_units = segment_document(text, embedder)
+    return build_topics(segments, local_titles(segment_units))
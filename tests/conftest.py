@@ -0,0 +1,48 @@
+import os
+import sys
+
+# The modules live at the repository root rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep completions out of the test output
+os.environ.setdefault("LLM_QUIET", "1")
+
+import pytest
+
+from llm_client import CompletionsClient
+from manifest import Manifest
+from metrics import RequestMetrics
+from mock_llm_server import MockCompletionsServer
+from response_cache import ResponseCache
+
+
+@pytest.fixture
+def start_server():
+    """Start MockCompletionsServers with the given options; all are stopped after the test."""
+    servers = []
+
+    def start(**options):
+        server = MockCompletionsServer(**options).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+@pytest.fixture
+def mock_server(start_server):
+    return start_server(batch_delay=0.1)
+
+
+@pytest.fixture
+def extractor(tmp_path, monkeypatch, mock_server):
+    """extract_data_topic_chunks talking to mock_server, with its own cache, manifest and metrics."""
+    import extract_data_topic_chunks as extractor
+
+    monkeypatch.setattr(extractor, "completions_client", CompletionsClient(mock_server.base_url, extractor.headers))
+    monkeypatch.setattr(extractor, "response_cache", ResponseCache(str(tmp_path / "state" / "responses.sqlite3")))
+    monkeypatch.setattr(extractor, "manifest", Manifest(str(tmp_path / "state" / "manifest.sqlite3")))
+    monkeypatch.setattr(extractor, "metrics", RequestMetrics())
+    return extractor
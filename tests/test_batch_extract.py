@@ -0,0 +1,44 @@
+import os
+
+import batch_extract
+from manifest import Manifest
+from response_cache import ResponseCache
+
+
+def write_corpus(directory):
+    os.makedirs(directory)
+    for i in range(3):
+        paragraphs = [f"Document {i}, paragraph {j}: conditions that apply to licence holders." for j in range(20 * i + 3)]
+        with open(os.path.join(directory, f"doc_{i}.txt"), 'w', encoding='utf-8') as file:
+            file.write("\n\n".join(paragraphs))
+
+
+def read_outputs(directory):
+    outputs = {}
+    for name in os.listdir(directory):
+        with open(os.path.join(directory, name), encoding='utf-8') as file:
+            outputs[name] = file.read()
+    return outputs
+
+
+def test_batch_round_trip_matches_online_extraction(extractor, mock_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    write_corpus("input")
+
+    batch_extract.run_batch("input", "batch_output", "characters", wait=True, poll_interval=0.05)
+
+    _, document_version = extractor.extraction_versions("characters")
+    assert all(extractor.manifest.is_current("extract", os.path.join("input", name), document_version) for name in os.listdir("input"))
+    assert not batch_extract.BatchState().batches
+    batch_requests = mock_server.requests
+
+    # A second run finds nothing left to submit
+    batch_extract.run_batch("input", "batch_output", "characters", wait=True, poll_interval=0.05)
+    assert mock_server.requests == batch_requests
+
+    # An online run from scratch writes the same topics
+    monkeypatch.setattr(extractor, "manifest", Manifest(str(tmp_path / "online-manifest.sqlite3")))
+    monkeypatch.setattr(extractor, "response_cache", ResponseCache(str(tmp_path / "online-responses.sqlite3")))
+    extractor.process_text_files("input", "online_output", max_concurrent_requests=4, chunk_strategy="characters")
+    assert mock_server.requests > batch_requests
+    assert read_outputs("batch_output") == read_outputs("online_output")
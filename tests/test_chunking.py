@@ -0,0 +1,74 @@
+import io
+import random
+
+import pytest
+
+from chunking import CharacterChunker, TokenBudgetChunker, chunk_text, count_tokens, iter_chunks, split_file
+
+
+def test_budget_must_leave_room_after_the_separator():
+    with pytest.raises(ValueError):
+        TokenBudgetChunker(count_tokens("\n\n"))
+    with pytest.raises(ValueError):
+        TokenBudgetChunker(0)
+    chunks = list(TokenBudgetChunker(count_tokens("\n\n") + 1).split(io.StringIO("one two three")))
+    assert "".join(chunks).split() == ["one", "two", "three"]
+
+
+def reference_chunks(text, chunk_size, overlap_size):
+    """The original chunk_text: slices with a stride of chunk_size - overlap_size."""
+    chunks = []
+    start = 0
+    while start < len(text):
+        end = start + chunk_size
+        chunks.append(text[start:end])
+        if end >= len(text):
+            break
+        start = end - overlap_size
+    return chunks
+
+
+class ShortReads(io.StringIO):
+    """A file that returns at most a few characters per read, like a pipe or a slow mount."""
+
+    def read(self, size=-1):
+        return super().read(min(size, 7) if size and size > 0 else 7)
+
+
+def sample_text(seed, paragraphs=60):
+    rng = random.Random(seed)
+    words = ["licence", "cannabis", "Schedule", "§4.2", "café", "dosage", "—", "テスト", "requirements", "patient"]
+    return "\n\n".join(" ".join(rng.choice(words) for _ in range(rng.randint(1, 40))) + rng.choice([".", "", ";"]) for _ in range(paragraphs))
+
+
+@pytest.mark.parametrize("chunk_size, overlap_size", [(1, 0), (7, 3), (100, 20), (2000, 200), (5000, 0)])
+def test_streamed_chunks_match_slicing(chunk_size, overlap_size):
+    text = sample_text(chunk_size)
+    expected = reference_chunks(text, chunk_size, overlap_size)
+    assert list(iter_chunks(ShortReads(text), chunk_size, overlap_size)) == expected
+    assert chunk_text(text, chunk_size, overlap_size) == expected
+
+
+@pytest.mark.parametrize("chunker", [CharacterChunker(100, 20), CharacterChunker(2000, 200), TokenBudgetChunker(40), TokenBudgetChunker(200, 30)],
+                         ids=["characters-100", "characters-2000", "tokens-40", "tokens-200-overlap"])
+def test_memory_mapped_chunks_match_file_chunks(tmp_path, chunker):
+    text = sample_text(len(chunker.name))
+    path = tmp_path / "document.txt"
+    path.write_bytes(text.encode("utf-8"))
+    data = path.read_bytes()
+
+    with open(path, encoding="utf-8", newline="") as file:
+        expected = list(chunker.split(file))
+    mapped = list(split_file(chunker, str(path)))
+
+    assert [chunk for chunk, _, _ in mapped] == expected
+    for chunk, byte_start, byte_end in mapped:
+        # Byte offsets point back at the chunk's text in the file
+        assert data[byte_start:byte_end].decode("utf-8") == chunk
+
+
+def test_empty_file_has_no_chunks(tmp_path):
+    path = tmp_path / "empty.txt"
+    path.write_bytes(b"")
+    assert list(split_file(CharacterChunker(100, 10), str(path))) == []
+    assert list(split_file(TokenBudgetChunker(100), str(path))) == []
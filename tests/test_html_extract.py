@@ -0,0 +1,26 @@
+import io
+
+from html_extract import iter_html_paragraphs
+
+PAGE = """<html><head><title>Licensing</title></head><body>
+<header><p>Site menu</p></header>
+<main><article>
+<header><h1>Licensing rules</h1><p>Issued by the regulator</p></header>
+<p>Body text.</p>
+<form><p>Apply using this form</p><button>Submit application</button></form>
+<footer><p>Footnote 1: see schedule 2</p></footer>
+</article></main>
+<footer>Copyright</footer>
+<script>var x = 1;</script>
+</body></html>"""
+
+
+def test_page_chrome_is_skipped_but_article_headers_and_forms_are_kept():
+    assert list(iter_html_paragraphs(io.StringIO(PAGE), block_size=7)) == [
+        "Licensing rules",
+        "Issued by the regulator",
+        "Body text.",
+        "Apply using this form",
+        "Submit application",
+        "Footnote 1: see schedule 2",
+    ]
@@ -0,0 +1,134 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import llm_client
+from llm_client import CONTINUE_PROMPT, CompletionsClient, RateLimiter, parse_retry_after, send_completion
+from metrics import RequestMetrics
+from mock_llm_server import echo_topics
+from response_cache import ResponseCache
+
+DOCUMENT = "\n\n".join(f"Paragraph {i} of the licensing guidance, long enough to span several stream events." for i in range(12))
+
+
+def payload(text=DOCUMENT):
+    return {"model": "mock", "messages": [{"role": "system", "content": "Extract topics."}, {"role": "user", "content": text}]}
+
+
+@pytest.fixture(autouse=True)
+def fast_backoff(monkeypatch):
+    monkeypatch.setattr(llm_client, "BACKOFF_BASE", 0.01)
+
+
+def test_parse_retry_after():
+    assert parse_retry_after("2.5") == 2.5
+    assert parse_retry_after("-1") == 0.0
+    assert 8 <= parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after("soon") is None
+    assert parse_retry_after(None) is None
+
+
+def test_transient_errors_are_retried(start_server):
+    server = start_server(fail_first=2, retry_after=None)
+    client = CompletionsClient(server.base_url, {}, max_retries=3)
+    response = client.chat_completion(payload())
+    assert response.status_code == 200
+    assert response.json()["choices"][0]["message"]["content"] == echo_topics(DOCUMENT)
+    assert client.request_retries() == 2
+    assert server.requests == 3
+
+
+def test_retries_stop_at_max_retries(start_server):
+    server = start_server(fail_first=10)
+    client = CompletionsClient(server.base_url, {}, max_retries=2)
+    assert client.chat_completion(payload()).status_code == 503
+    assert server.requests == 3
+
+
+def test_retry_after_is_waited_for(start_server):
+    server = start_server(fail_first=1, retry_after="0.3")
+    client = CompletionsClient(server.base_url, {}, rate_limiter=RateLimiter(0, 0))
+    started = time.monotonic()
+    assert client.chat_completion(payload()).status_code == 200
+    assert time.monotonic() - started >= 0.3
+    # Only a 429 holds back the other workers
+    assert client.rate_limiter.paused_until == 0.0
+
+
+def test_429_pauses_every_caller(start_server):
+    server = start_server(fail_first=1, error_status=429, retry_after="0.4")
+    client = CompletionsClient(server.base_url, {}, rate_limiter=RateLimiter(0, 0))
+    started = time.monotonic()
+    assert client.chat_completion(payload()).status_code == 200
+    assert client.rate_limiter.paused_until >= started + 0.4
+    assert server.requests == 2
+
+    # A request made during the pause waits it out before it is sent
+    client.rate_limiter.pause(0.3)
+    started = time.monotonic()
+    client.chat_completion(payload())
+    assert time.monotonic() - started >= 0.3
+
+
+def test_dropped_stream_is_resumed(start_server):
+    server = start_server(drop_streams=1)
+    payloads = []
+    complete = server.complete
+    server.complete = lambda request: (payloads.append(request), complete(request))[1]
+    client = CompletionsClient(server.base_url, {})
+    estimates = []
+    client.rate_limiter.record_usage = lambda estimated_tokens, actual_tokens: estimates.append(estimated_tokens)
+    streamed = []
+
+    result = client.stream_chat_completion(payload(), on_text=streamed.append)
+
+    full = echo_topics(DOCUMENT)
+    assert client.request_retries() == 1
+    assert len(payloads) == 2
+    # The resumed request carries the whole lines received before the drop, and asks only for the rest
+    received = payloads[1]["messages"][-2]["content"]
+    assert payloads[1]["messages"][-2]["role"] == "assistant"
+    assert payloads[1]["messages"][-1]["content"] == CONTINUE_PROMPT
+    assert received and full.startswith(received) and received.endswith("\n")
+    content = result["choices"][0]["message"]["content"]
+    assert content == received + echo_topics(CONTINUE_PROMPT)
+    assert "".join(streamed) == content
+    assert result["usage"]["completion_tokens"] > 0
+    # Only the resumed attempt reported usage, and it is weighed against the request that attempt sent
+    assert estimates == [llm_client.estimate_tokens(payloads[1])]
+
+
+def test_streamed_error_response_is_closed(start_server, monkeypatch):
+    server = start_server(fail_first=10, error_status=400)
+    client = CompletionsClient(server.base_url, {}, max_retries=0)
+    responses = []
+    post = client.post
+    monkeypatch.setattr(client, "post", lambda *args, **kwargs: responses.append(post(*args, **kwargs)) or responses[-1])
+    with pytest.raises(llm_client.requests.HTTPError):
+        client.stream_chat_completion(payload())
+    assert responses and responses[0].raw.closed
+
+
+def test_send_completion_serves_repeats_from_the_cache(start_server, tmp_path):
+    server = start_server()
+    client = CompletionsClient(server.base_url, {})
+    cache = ResponseCache(str(tmp_path / "responses.sqlite3"))
+    metrics = RequestMetrics()
+    first = send_completion(client, payload(), cache, metrics, quiet=True)
+    seen = []
+    second = send_completion(client, payload(), cache, metrics, on_text=seen.append, quiet=True)
+    assert second == first and seen == [echo_topics(DOCUMENT)]
+    assert server.requests == 1
+    totals = metrics.snapshot()
+    assert totals["requests"] == 2 and totals["cached"] == 1 and totals["prompt_tokens"] > 0
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_failed_request_is_recorded_and_returns_none(start_server, tmp_path, stream):
+    server = start_server(fail_first=10)
+    client = CompletionsClient(server.base_url, {}, max_retries=1)
+    metrics = RequestMetrics()
+    assert send_completion(client, payload(), ResponseCache(str(tmp_path / "responses.sqlite3")), metrics, stream=stream, quiet=True) is None
+    assert metrics.snapshot()["failed"] == 1
+    assert metrics.snapshot()["retries"] == 1
@@ -0,0 +1,53 @@
+import os
+
+from manifest import Manifest
+
+
+def test_file_changed_during_processing_is_not_current(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    source = tmp_path / "doc.txt"
+    output = tmp_path / "doc.out"
+    source.write_text("first version", encoding="utf-8")
+    output.write_text("topics", encoding="utf-8")
+
+    fingerprint = manifest.fingerprint("extract", str(source))
+    assert not manifest.is_current("extract", str(source), "v1", fingerprint)
+    # Edited after it was read but before its outputs were recorded
+    source.write_text("second, longer version", encoding="utf-8")
+    manifest.record_document("extract", str(source), "v1", [str(output)], fingerprint)
+    assert not manifest.is_current("extract", str(source), "v1")
+
+    fingerprint = manifest.fingerprint("extract", str(source))
+    manifest.record_document("extract", str(source), "v1", [str(output)], fingerprint)
+    assert manifest.is_current("extract", str(source), "v1")
+    os.remove(output)
+    assert not manifest.is_current("extract", str(source), "v1")
+
+
+def test_outputs_another_document_lists_are_not_its_own(tmp_path):
+    manifest = Manifest(str(tmp_path / "manifest.sqlite3"))
+    first, second = tmp_path / "first.txt", tmp_path / "second.txt"
+    first.write_text("first", encoding="utf-8")
+    second.write_text("second", encoding="utf-8")
+    shared, own = str(tmp_path / "Topic_Introduction.txt"), str(tmp_path / "Topic_First.txt")
+
+    # Written by an older version that gave every document the same fixed names
+    manifest.record_document("extract", str(first), "v1", [shared, own])
+    manifest.record_document("extract", str(second), "v1", [shared])
+    assert manifest.get_own_outputs("extract", str(first)) == [own]
+    assert manifest.get_own_outputs("extract", str(second)) == []
+    assert manifest.get_own_outputs("partition", str(first)) == []
+
+
+def test_state_files_are_created_on_first_use(tmp_path):
+    from response_cache import ResponseCache
+
+    manifest = Manifest(str(tmp_path / "state" / "manifest.sqlite3"))
+    cache = ResponseCache(str(tmp_path / "cache" / "responses.sqlite3"))
+    assert os.listdir(tmp_path) == []
+
+    assert manifest.get_outputs("extract", str(tmp_path / "doc.txt")) == []
+    assert cache.get({"messages": []}) is None
+    assert sorted(os.listdir(tmp_path)) == ["cache", "state"]
+    manifest.close()
+    cache.close()
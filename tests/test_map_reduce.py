@@ -0,0 +1,53 @@
+from map_reduce import consolidate_topics, reduce_titles_locally
+
+
+def test_generic_title_does_not_absorb_others():
+    titles = [
+        "Topic_Cannabis",
+        "Topic_Labelling requirements for cannabis products",
+        "Topic_Testing requirements",
+        "Topic_Medicinal cannabis import permits",
+        "Topic_Requirements",
+    ]
+    assert reduce_titles_locally(titles) == {title: title for title in titles}
+
+
+def test_continued_and_reworded_titles_group():
+    mapping = reduce_titles_locally([
+        "Topic_Labelling requirements for medicinal cannabis",
+        "Topic_Storage",
+        "Topic_Labelling requirements for medicinal cannabis (continued)",
+        "Topic_Storage_2",
+        "Topic_Import permits and licences",
+        "Topic_Licences and import permits for cannabis",
+        "Topic_Schedule 2",
+        "Topic_Schedule 3",
+    ])
+    assert mapping["Topic_Labelling requirements for medicinal cannabis (continued)"] == "Topic_Labelling requirements for medicinal cannabis"
+    assert mapping["Topic_Storage_2"] == "Topic_Storage"
+    assert mapping["Topic_Licences and import permits for cannabis"] == "Topic_Import permits and licences"
+    assert mapping["Topic_Schedule 3"] == "Topic_Schedule 3"
+
+
+def test_groups_do_not_chain():
+    # B matches A and C matches B, but C shares too little with A, the group's first title
+    mapping = reduce_titles_locally([
+        "Topic_Alpha beta gamma delta",
+        "Topic_Beta gamma delta epsilon",
+        "Topic_Delta epsilon zeta eta",
+    ])
+    assert mapping["Topic_Beta gamma delta epsilon"] == "Topic_Alpha beta gamma delta"
+    assert mapping["Topic_Delta epsilon zeta eta"] == "Topic_Delta epsilon zeta eta"
+
+
+def test_spans_without_offsets_still_combine():
+    topics = {"Topic_Storage": "a\n", "Topic_Storage (continued)": "b\n", "Topic_Storage_2": "c\n"}
+    chunk_ranges = {
+        "Topic_Storage": [0, 0, None, None],  # From a chunker without byte offsets
+        "Topic_Storage (continued)": [1, 2, 100, 250],
+        "Topic_Storage_2": [3, 3],  # Older two-element range
+    }
+    mapping = {title: "Topic_Storage" for title in topics}
+    consolidated, ranges = consolidate_topics(topics, chunk_ranges, mapping)
+    assert consolidated == {"Topic_Storage": "a\nb\nc\n"}
+    assert ranges == {"Topic_Storage": [0, 3, 100, 250]}
@@ -0,0 +1,84 @@
+import os
+import queue
+import threading
+import time
+
+import pytest
+
+import path
+
+
+def make_tree(root, directories, files_per_directory):
+    expected = set()
+    for i in range(directories):
+        directory = os.path.join(root, f"dir_{i:03d}", "nested")
+        os.makedirs(directory)
+        for j in range(files_per_directory):
+            file_path = os.path.join(directory, f"doc_{j}.PDF" if j % 2 else f"doc_{j}.html")
+            open(file_path, 'w').close()
+            expected.add(file_path)
+    return expected
+
+
+def test_slow_consumer_gets_every_file(tmp_path):
+    # A consumer slower than the walk keeps the results queue full, which is when the end sentinel could overtake files
+    expected = make_tree(str(tmp_path), directories=120, files_per_directory=1)
+    for _ in range(3):
+        found = []
+        for file_path in path.iter_files(str(tmp_path), workers=16):
+            time.sleep(0.002)
+            found.append(file_path)
+        assert sorted(found) == sorted(expected)
+
+
+def test_delayed_put_is_not_overtaken_by_end_of_walk(tmp_path, monkeypatch):
+    # One directory's files reach the results queue late, as a put blocked on a full queue would
+    class SlowResults(queue.Queue):
+        def put(self, item, *args, **kwargs):
+            if isinstance(item, list) and "dir_000" in item[0]:
+                time.sleep(0.2)
+            super().put(item, *args, **kwargs)
+
+    expected = make_tree(str(tmp_path), directories=10, files_per_directory=1)
+    monkeypatch.setattr(path.queue, "Queue", SlowResults)
+    assert sorted(path.iter_files(str(tmp_path), workers=4)) == sorted(expected)
+
+
+def test_filters(tmp_path):
+    make_tree(str(tmp_path), directories=3, files_per_directory=2)
+    found = list(path.iter_files(str(tmp_path), include=["*.pdf"], exclude=["dir_001"]))
+    assert sorted(os.path.relpath(file_path, tmp_path) for file_path in found) == [
+        os.path.join("dir_000", "nested", "doc_1.PDF"),
+        os.path.join("dir_002", "nested", "doc_1.PDF"),
+    ]
+
+
+def discovery_threads():
+    return [thread for thread in threading.enumerate() if thread.name.startswith("discover-")]
+
+
+def test_early_close_stops_workers(tmp_path):
+    make_tree(str(tmp_path), directories=20, files_per_directory=2)
+    assert not discovery_threads()
+    files = path.iter_files(str(tmp_path), workers=4)
+    next(files)
+    assert discovery_threads()
+    files.close()
+    deadline = time.monotonic() + 5
+    while discovery_threads() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not discovery_threads()
+
+
+def test_worker_error_reaches_the_consumer(tmp_path, monkeypatch):
+    make_tree(str(tmp_path), directories=5, files_per_directory=1)
+    scandir = os.scandir
+
+    def failing_scandir(directory):
+        if os.path.basename(directory) == "dir_002":
+            raise RuntimeError("unexpected entry")
+        return scandir(directory)
+
+    monkeypatch.setattr(path.os, "scandir", failing_scandir)
+    with pytest.raises(RuntimeError, match="unexpected entry"):
+        list(path.iter_files(str(tmp_path), workers=2))
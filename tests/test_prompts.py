@@ -0,0 +1,16 @@
+from prompts import split_packed_completion
+
+
+def test_packed_completion_splits_on_markers():
+    content = "<<<PART 1>>>\n## Topic_A\na\n<<<PART 2>>>\n## Topic_B\nb\n"
+    assert split_packed_completion(content, 2) == ["## Topic_A\na", "## Topic_B\nb"]
+
+
+def test_unclear_markers_fail_every_part():
+    missing = "<<<PART 1>>>\n## Topic_A\na\n<<<PART 3>>>\n## Topic_C\nc\n"
+    out_of_order = "<<<PART 2>>>\n## Topic_B\nb\n<<<PART 1>>>\n## Topic_A\na\n"
+    repeated = "<<<PART 1>>>\na\n<<<PART 1>>>\nb\n"
+    assert split_packed_completion(missing, 3) == [None] * 3
+    assert split_packed_completion(out_of_order, 2) == [None] * 2
+    assert split_packed_completion(repeated, 2) == [None] * 2
+    assert split_packed_completion("## Topic_A\na\n", 1) == [None]
@@ -0,0 +1,190 @@
+import os
+import random
+import threading
+import time
+
+import pytest
+
+from llm_client import CompletionsClient
+from manifest import Manifest
+from response_cache import ResponseCache
+from scheduler import POLICIES, ChunkScheduler, Document
+from topic_merge import TopicMerger
+
+
+def make_documents(tmp_path, chunk_lists):
+    documents = []
+    for order, chunks in enumerate(chunk_lists):
+        filepath = tmp_path / f"doc_{order}.txt"
+        filepath.write_text("".join(chunks), encoding="utf-8")
+        documents.append(Document(str(filepath), order))
+    return documents, {str(tmp_path / f"doc_{order}.txt"): chunks for order, chunks in enumerate(chunk_lists)}
+
+
+def split_from(chunks_by_path):
+    def split(filepath):
+        offset = 0
+        for chunk in chunks_by_path[filepath]:
+            yield chunk, offset, offset + len(chunk)
+            offset += len(chunk)
+    return split
+
+
+def topics_for(document, chunk_index):
+    return {f"Topic_{document.filename} {chunk_index}": f"chunk {chunk_index}\n"}
+
+
+def test_short_chunks_are_packed_through_the_pool(tmp_path):
+    long_chunk = "x" * 200
+    documents, chunks_by_path = make_documents(tmp_path, [
+        [long_chunk, long_chunk, "tail a"],
+        ["small b"],
+        ["small c"],
+        [long_chunk, "tail d"],
+    ])
+    lock = threading.Lock()
+    single, packed = [], []
+    active = peak = 0
+
+    def track(delta):
+        nonlocal active, peak
+        with lock:
+            active += delta
+            peak = max(peak, active)
+
+    def extract(document, chunk_index, chunk):
+        track(1)
+        time.sleep(0.02)
+        track(-1)
+        single.append((document.filename, chunk_index))
+        return topics_for(document, chunk_index)
+
+    def extract_packed(items):
+        track(1)
+        time.sleep(0.02)
+        track(-1)
+        packed.append([(document.filename, chunk_index) for document, chunk_index, _ in items])
+        return [topics_for(document, chunk_index) for document, chunk_index, _ in items]
+
+    completed = {}
+    scheduler = ChunkScheduler("fifo", max_concurrent_requests=2, pack_max_parts=3)
+    scheduler.run(documents, split_from(chunks_by_path), extract, lambda document: completed.update({document.filename: document}),
+                  can_pack=lambda chunk: len(chunk) < 100, extract_packed=extract_packed)
+
+    assert sorted(single) == [("doc_0.txt", 0), ("doc_0.txt", 1), ("doc_3.txt", 0)]
+    assert sorted(item for group in packed for item in group) == [("doc_0.txt", 2), ("doc_1.txt", 0), ("doc_2.txt", 0), ("doc_3.txt", 1)]
+    assert all(len(group) <= 3 for group in packed)
+    assert peak <= 2
+    assert sorted(completed) == ["doc_0.txt", "doc_1.txt", "doc_2.txt", "doc_3.txt"]
+    assert list(completed["doc_0.txt"].merger.topics) == [f"Topic_doc_0.txt {i}" for i in range(3)]
+
+
+def test_parts_left_out_of_a_packed_completion_are_sent_alone(tmp_path):
+    documents, chunks_by_path = make_documents(tmp_path, [["a"], ["b"], ["c"]])
+    single = []
+
+    def extract(document, chunk_index, chunk):
+        single.append(document.filename)
+        return topics_for(document, chunk_index)
+
+    def extract_packed(items):
+        # The model dropped the middle part
+        return [topics_for(document, chunk_index) if i != 1 else None for i, (document, chunk_index, _) in enumerate(items)]
+
+    completed = []
+    ChunkScheduler("fifo", max_concurrent_requests=2).run(
+        documents, split_from(chunks_by_path), extract, lambda document: completed.append(document),
+        can_pack=lambda chunk: True, extract_packed=extract_packed,
+    )
+    assert single == ["doc_1.txt"]
+    assert len(completed) == 3 and not any(document.failed_chunks for document in completed)
+
+
+def test_short_documents_do_not_wait_behind_a_long_one(tmp_path):
+    documents, chunks_by_path = make_documents(tmp_path, [["x" * 200] * 20, ["small b"], ["small c"]])
+
+    long_done = []
+
+    def extract(document, chunk_index, chunk):
+        time.sleep(0.005)
+        long_done.append(chunk_index)
+        return topics_for(document, chunk_index)
+
+    def extract_packed(items):
+        return [topics_for(document, chunk_index) for document, chunk_index, _ in items]
+
+    completed = {}
+    ChunkScheduler("round-robin", max_concurrent_requests=2, max_active_documents=3).run(
+        documents, split_from(chunks_by_path), extract, lambda document: completed.update({document.filename: len(long_done)}),
+        can_pack=lambda chunk: len(chunk) < 100, extract_packed=extract_packed,
+    )
+    # The short documents finish within the first few chunks of the long one, not at its end
+    assert completed["doc_1.txt"] < 5 and completed["doc_2.txt"] < 5
+    assert completed["doc_0.txt"] == 20
+
+
+@pytest.mark.parametrize("policy", sorted(POLICIES))
+def test_out_of_order_results_merge_as_in_a_serial_run(tmp_path, policy):
+    rng = random.Random(policy)
+    chunk_lists = [[f"{name} part {i}" for i in range(rng.randint(1, 12))] for name in "abcdef"]
+    documents, chunks_by_path = make_documents(tmp_path, chunk_lists)
+    delays = {(document.filename, i): rng.uniform(0, 0.01) for document, chunks in zip(documents, chunk_lists) for i in range(len(chunks))}
+
+    def chunk_topics(filename, chunk_index):
+        # Headers repeat across chunks, so the merge order shows in the appended content
+        return {f"Topic_{filename} {chunk_index // 3}": f"{filename} chunk {chunk_index}\n", "Topic_Shared": f"{filename} {chunk_index}\n"}
+
+    def extract(document, chunk_index, chunk):
+        time.sleep(delays[document.filename, chunk_index])
+        return chunk_topics(document.filename, chunk_index)
+
+    completed = []
+    ChunkScheduler(policy, max_concurrent_requests=4, max_active_documents=3).run(
+        documents, split_from(chunks_by_path), extract, completed.append)
+
+    assert sorted(document.filename for document in completed) == sorted(document.filename for document in documents)
+    for document in completed:
+        serial = TopicMerger()
+        for chunk_index, (_, byte_start, byte_end) in enumerate(split_from(chunks_by_path)(document.filepath)):
+            serial.add_chunk(chunk_topics(document.filename, chunk_index), chunk_index, (byte_start, byte_end))
+        assert document.merger.topics == serial.topics
+        assert list(document.merger.topics) == list(serial.topics)
+        assert document.merger.chunk_ranges == serial.chunk_ranges
+
+
+def test_failed_chunk_is_reported_and_the_rest_still_merge(tmp_path):
+    documents, chunks_by_path = make_documents(tmp_path, [["a0", "a1", "a2"], ["b0"]])
+
+    def extract(document, chunk_index, chunk):
+        if chunk == "a1":
+            raise RuntimeError("connection reset")
+        return topics_for(document, chunk_index)
+
+    completed = {}
+    ChunkScheduler("fifo", max_concurrent_requests=2).run(
+        documents, split_from(chunks_by_path), extract, lambda document: completed.update({document.filename: document}))
+    assert completed["doc_0.txt"].failed_chunks == 1
+    assert list(completed["doc_0.txt"].merger.topics) == ["Topic_doc_0.txt 0", "Topic_doc_0.txt 2"]
+    assert completed["doc_1.txt"].failed_chunks == 0
+
+
+def test_scheduled_extraction_writes_what_a_serial_run_writes(extractor, start_server, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(extractor, "completions_client", CompletionsClient(start_server(latency=0.001, jitter=0.02, seed=4).base_url, {}))
+    monkeypatch.setattr(extractor, "PACK_CHUNK_CHARS", 1000)
+    os.makedirs("input")
+    rng = random.Random(5)
+    for i in range(5):
+        paragraphs = [f"Document {i} paragraph {j} " + "word " * rng.randint(5, 60) for j in range(rng.randint(1, 40))]
+        (tmp_path / "input" / f"doc_{i}.txt").write_text("\n\n".join(paragraphs), encoding="utf-8")
+
+    extractor.process_text_files("input", "scheduled", max_concurrent_requests=6, chunk_strategy="characters", policy="round-robin")
+    monkeypatch.setattr(extractor, "manifest", Manifest(str(tmp_path / "serial-manifest.sqlite3")))
+    monkeypatch.setattr(extractor, "response_cache", ResponseCache(str(tmp_path / "serial-responses.sqlite3")))
+    monkeypatch.setattr(extractor, "PACK_CHUNK_CHARS", 0)
+    extractor.process_text_files("input", "serial", max_concurrent_requests=1, chunk_strategy="characters", policy="fifo")
+
+    def outputs(directory):
+        # Documents finish in a different order, so repeated topic names may get different numbers
+        return sorted((tmp_path / directory / name).read_text(encoding="utf-8") for name in os.listdir(tmp_path / directory))
+    assert outputs("scheduled") == outputs("serial")
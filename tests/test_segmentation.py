@@ -0,0 +1,47 @@
+import random
+
+import numpy as np
+
+from segmentation import gap_scores, segment_document, tfidf_matrix
+
+
+def dense(vectors):
+    matrix = np.zeros(vectors.shape, dtype=np.float32)
+    for i in range(len(vectors)):
+        columns, values = vectors.row(i)
+        matrix[i, columns] = values
+    return matrix
+
+
+def window_scores(matrix, window):
+    """Cosine similarity of the summed windows around each gap, built densely."""
+    scores = []
+    for gap in range(1, len(matrix)):
+        left = matrix[max(0, gap - window):gap].sum(axis=0)
+        right = matrix[gap:gap + window].sum(axis=0)
+        norm = np.linalg.norm(left) * np.linalg.norm(right)
+        scores.append(left @ right / norm if norm else 0.0)
+    return np.array(scores)
+
+
+def test_sparse_gap_scores_match_dense_windows():
+    rng = random.Random(3)
+    vocabulary = [f"term{i}" for i in range(600)]
+    for count in (2, 3, 5, 8, 60):
+        units = [" ".join(rng.choice(vocabulary[(i // 6) * 50:(i // 6) * 50 + 80]) for _ in range(rng.randint(0, 25))) for i in range(count)]
+        vectors, _ = tfidf_matrix(units)
+        rows = np.linalg.norm(dense(vectors), axis=1)
+        assert np.allclose(rows[rows > 0], 1, atol=1e-5)
+        for window in (1, 2, 3):
+            expected = window_scores(dense(vectors), window)
+            assert np.allclose(gap_scores(vectors, window), expected, atol=1e-5)
+            assert np.allclose(gap_scores(dense(vectors), window), expected, atol=1e-5)
+
+
+def test_segments_split_where_the_vocabulary_changes():
+    first = ["Licence applications require a licence fee and licence forms."] * 6
+    second = ["Laboratory testing measures potency, pesticides and microbial contamination."] * 6
+    text = "\n\n".join(first + second)
+    segments, segment_units = segment_document(text)
+    assert len(segments) == 2
+    assert segment_units == [first, second]
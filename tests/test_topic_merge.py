@@ -0,0 +1,52 @@
+from chunking import chunk_text
+from mock_llm_server import echo_topics
+from topic_merge import TopicMerger, longest_suffix_prefix
+from topic_parser import parse_extracted_content
+
+
+def test_longest_suffix_prefix():
+    assert longest_suffix_prefix("abcdef", "defgh") == 3
+    assert longest_suffix_prefix("abc", "xyz") == 0
+    assert longest_suffix_prefix("aaaa", "aaab") == 3
+
+
+def test_overlap_window_is_dropped_from_verbatim_outputs():
+    paragraphs = [f"Clause {i} sets out the storage and labelling conditions that apply to product batch {i}." for i in range(120)]
+    text = "\n\n".join(paragraphs)
+    chunks = chunk_text(text, 2000, 200)
+
+    merger = TopicMerger()
+    for i, chunk in enumerate(chunks):
+        merger.add_chunk(parse_extracted_content(echo_topics(chunk)), i)
+    # The window starts and ends mid-line, so only span matching can find it
+    assert merger.bytes_deduplicated >= 190 * (len(chunks) - 1)
+
+
+def test_merged_output_keeps_every_paragraph_once():
+    paragraphs = [f"Clause {i} sets out the storage and labelling conditions that apply to product batch {i}." for i in range(120)]
+    text = "\n\n".join(paragraphs)
+
+    merger = TopicMerger()
+    for i, chunk in enumerate(chunk_text(text, 2000, 200)):
+        # One differently named topic per chunk keeps document order in the merged output
+        merger.add_chunk({f"Topic_Part {chr(65 + i)}": chunk}, i)
+
+    merged = "".join(merger.topics.values())
+    assert " ".join(merged.split()) == " ".join(text.split())
+
+
+def test_unrelated_chunks_are_kept():
+    merger = TopicMerger()
+    merger.add_chunk({"Topic_Storage": "Store below 25 degrees in the original container.\n"}, 0)
+    merger.add_chunk({"Topic_Import": "Import permits are issued by the Office of Drug Control.\n"}, 1)
+    assert merger.bytes_deduplicated == 0
+    assert len(merger.topics) == 2
+
+
+def test_line_repeated_outside_the_overlap_is_kept():
+    line = "Patients must carry a copy of the prescription when travelling.\n"
+    merger = TopicMerger()
+    merger.add_chunk({"Topic_Travel": "Domestic travel is permitted.\n" + line}, 0)
+    merger.add_chunk({"Topic_Interstate": "Each state sets its own conditions.\n" + line}, 1)
+    assert merger.bytes_deduplicated == 0
+    assert merger.topics["Topic_Interstate"].endswith(line)
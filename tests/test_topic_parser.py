@@ -0,0 +1,60 @@
+import json
+import random
+
+import pytest
+
+from topic_parser import TopicStreamParser, iter_streamed_topics, parse_extracted_content
+
+COMPLETIONS = [
+    "Topic_Scope\nThis guidance applies to\n  licence holders.\n\nTopic_Fees\nFees are payable yearly.\n",
+    "Preamble before any topic\nTopic_A\r\nline one\r\nline two\r\nTopic_B\rline three\n",
+    "Topic_Repeated\nfirst\nTopic_Other\nx\nTopic_Repeated\nsecond",
+    "Topic_Unicode\nline separated\x0cpage\nTopic_\nempty name",
+    "",
+    "no topics at all",
+]
+
+
+def reference_parse(content):
+    """The original parser: a repeated header starts its section over."""
+    topics = {}
+    current_topic = None
+    for line in content.splitlines():
+        line = line.strip()
+        if line.startswith("Topic_"):
+            current_topic = line
+            topics[current_topic] = ""
+        elif current_topic:
+            topics[current_topic] += line + "\n"
+    return topics
+
+
+def feed_in_pieces(content, rng):
+    parser = TopicStreamParser()
+    topics = {}
+    position = 0
+    while position < len(content):
+        size = rng.randint(1, 9)
+        topics.update(parser.feed(content[position:position + size]))
+        position += size
+    topics.update(parser.close())
+    return topics
+
+
+@pytest.mark.parametrize("content", COMPLETIONS)
+def test_parsers_match_the_original(content):
+    expected = reference_parse(content)
+    assert parse_extracted_content(content) == expected
+    rng = random.Random(len(content))
+    for _ in range(20):
+        assert feed_in_pieces(content, rng) == expected
+
+
+def test_streamed_topics_from_sse_lines():
+    content = COMPLETIONS[0]
+    lines = []
+    for i in range(0, len(content), 5):
+        lines.append("data: " + json.dumps({"choices": [{"delta": {"content": content[i:i + 5]}}]}))
+        lines.append("")
+    lines += ["data: [DONE]", ""]
+    assert dict(iter_streamed_topics(lines)) == reference_parse(content)
@@ -0,0 +1,48 @@
+import os
+
+import pytest
+
+import topic_writer
+from topic_writer import TopicWriter
+
+
+@pytest.mark.parametrize("hard_links", [True, False])
+def test_file_created_by_another_process_is_not_overwritten(tmp_path, monkeypatch, hard_links):
+    if not hard_links:
+        def no_link(source, target):
+            raise PermissionError("hard links not supported")
+        monkeypatch.setattr(topic_writer.os, "link", no_link)
+
+    writer = TopicWriter(str(tmp_path))
+    filename = writer.unique_filename("Topic_Introduction.txt")
+    # Another process takes the name after the directory was listed
+    (tmp_path / "Topic_Introduction.txt").write_text("theirs", encoding="utf-8")
+    (tmp_path / "Topic_Introduction_1.txt").write_text("theirs too", encoding="utf-8")
+
+    filepath = writer.write_text(filename, "ours")
+
+    assert os.path.basename(filepath) == "Topic_Introduction_2.txt"
+    assert (tmp_path / "Topic_Introduction.txt").read_text(encoding="utf-8") == "theirs"
+    assert (tmp_path / "Topic_Introduction_1.txt").read_text(encoding="utf-8") == "theirs too"
+    assert (tmp_path / "Topic_Introduction_2.txt").read_text(encoding="utf-8") == "ours"
+    assert not [name for name in os.listdir(tmp_path) if name.startswith(".tmp-")]
+    assert writer.unique_filename("Topic_Introduction.txt") == "Topic_Introduction_3.txt"
+
+
+def test_repeated_headers_get_numbered_names(tmp_path):
+    writer = TopicWriter(str(tmp_path))
+    paths = [writer.write_text(writer.unique_filename("Topic_Scope.txt"), str(i)) for i in range(3)]
+    assert [os.path.basename(path) for path in paths] == ["Topic_Scope.txt", "Topic_Scope_1.txt", "Topic_Scope_2.txt"]
+    # Same permissions as a file opened the ordinary way
+    (tmp_path / "plain.txt").write_text("plain", encoding="utf-8")
+    assert oct(os.stat(paths[0]).st_mode & 0o777) == oct(os.stat(tmp_path / "plain.txt").st_mode & 0o777)
+
+
+def test_whole_document_extractor_does_not_overwrite_another_documents_topics(tmp_path):
+    import extract_data_topic
+
+    topics = {f"Topic_{name}": "text " * 200 for name in ("Introduction", "Dosage")}
+    first = extract_data_topic.save_topics_to_files(topics, str(tmp_path), "first")
+    second = extract_data_topic.save_topics_to_files(topics, str(tmp_path), "second")
+    assert len(set(first + second)) == 4
+    assert all(os.path.exists(filepath) for filepath in first + second)
@@ -0,0 +1,175 @@
+import re
+import hashlib
+
+MINHASH_PERMUTATIONS = 32
+MINHASH_BANDS = 8  # 8 bands of 4 rows: pairs above ~0.7 Jaccard almost always share a bucket
+TITLE_SIMILARITY = 0.8  # Estimated Jaccard over title shingles needed to treat two headers as the same topic
+SHINGLE_SIZE = 3
+MIN_OVERLAP_CHARS = 30  # Shortest span shared by consecutive chunk outputs that counts as overlap
+MAX_OVERLAP_CHARS = 4000  # How far into each output to look; well above the chunk overlap window
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_PERMUTATIONS = [
+    (
+        int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME | 1,
+        int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME,
+    )
+    for i in range(MINHASH_PERMUTATIONS)
+]
+
+CONTINUATION_MARKERS = re.compile(r"\b(continued|contd|cont)\b")
+NON_ALPHANUMERIC = re.compile(r"[^a-z0-9]+")
+NUMBERS = re.compile(r"\d+")
+# The prompt's "Topic_[Name of Topic_1]" template makes models number headers per chunk
+TEMPLATE_NUMBER = re.compile(r"_\d+$")
+
+
+def normalize_title(topic):
+    """Reduce a "Topic_" header to a comparable key: no prefix, case, punctuation, template numbering or "(continued)"."""
+    title = topic[len("Topic_"):] if topic.startswith("Topic_") else topic
+    title = TEMPLATE_NUMBER.sub("", title.strip())
+    title = NON_ALPHANUMERIC.sub(" ", title.lower().replace("_", " "))
+    title = CONTINUATION_MARKERS.sub(" ", title)
+    return " ".join(title.split())
+
+
+def _stable_hash(text):
+    return int.from_bytes(hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def minhash_signature(text):
+    """MinHash of the character shingles of text."""
+    shingles = {text[i:i + SHINGLE_SIZE] for i in range(max(1, len(text) - SHINGLE_SIZE + 1))}
+    hashes = [_stable_hash(shingle) for shingle in shingles]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def estimated_similarity(signature, other):
+    return sum(x == y for x, y in zip(signature, other)) / len(signature)
+
+
+def _collapse_whitespace(text):
+    """text with leading whitespace dropped and other whitespace runs turned into one space, plus each kept character's index in text."""
+    chars, positions = [], []
+    previous_space = True
+    for i, char in enumerate(text):
+        if char.isspace():
+            if previous_space:
+                continue
+            char = " "
+            previous_space = True
+        else:
+            previous_space = False
+        chars.append(char)
+        positions.append(i)
+    return "".join(chars), positions
+
+
+def longest_suffix_prefix(tail, head):
+    """Length of the longest suffix of tail that is also a prefix of head (KMP failure function, linear time)."""
+    text = head + "\x00" + tail
+    failure = [0] * len(text)
+    for i in range(1, len(text)):
+        k = failure[i - 1]
+        while k and text[i] != text[k]:
+            k = failure[k - 1]
+        if text[i] == text[k]:
+            k += 1
+        failure[i] = k
+    return failure[-1]
+
+
+class TopicMerger:
+    """Merge per-chunk topic dicts into one document-level dict.
+
+    Topics whose normalised titles match, or whose titles are near-duplicates
+    by MinHash, are appended to the first topic seen instead of overwriting
+    it. Text the chunk overlap window repeats is dropped: the longest span
+    that ends the previous chunk's output and starts this one's (ignoring
+    whitespace, since the window starts and ends mid-line). Lines that
+    repeat elsewhere in the document are real content and are kept. Each
+    chunk costs time proportional to its own size, so a document merges in
+    near-linear time.
+    """
+
+    def __init__(self, similarity=TITLE_SIMILARITY):
+        self.similarity = similarity
+        self._parts = {}  # header -> content pieces, joined once in topics
+        self.chunk_ranges = {}  # header -> [first chunk, last chunk, first byte, last byte] it has content from
+        self.bytes_deduplicated = 0
+        self._titles = {}  # normalised title -> header in self.topics
+        self._signatures = {}  # header -> MinHash signature
+        self._buckets = {}  # (band, band hash) -> headers
+        self._previous_tail = ""  # End of the previous chunk's output, whitespace-collapsed
+        self._rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+
+    @property
+    def topics(self):
+        return {topic: "".join(parts) for topic, parts in self._parts.items()}
+
+    def _bands(self, signature):
+        for band in range(MINHASH_BANDS):
+            yield band, signature[band * self._rows:(band + 1) * self._rows]
+
+    def _find_topic(self, topic):
+        """Existing header that topic should merge into, or None."""
+        title = normalize_title(topic)
+        if title in self._titles:
+            return self._titles[title], title, None
+
+        signature = minhash_signature(title)
+        numbers = NUMBERS.findall(title)
+        best, best_similarity = None, self.similarity
+        for key in self._bands(signature):
+            for candidate in self._buckets.get(key, ()):
+                # "Schedule 2" and "Schedule 3" look alike but are different sections
+                if NUMBERS.findall(normalize_title(candidate)) != numbers:
+                    continue
+                similarity = estimated_similarity(signature, self._signatures[candidate])
+                if similarity >= best_similarity:
+                    best, best_similarity = candidate, similarity
+        return best, title, signature
+
+    def _register(self, topic, title, signature):
+        self._titles[title] = topic
+        self._signatures[topic] = signature
+        for key in self._bands(signature):
+            self._buckets.setdefault(key, []).append(topic)
+
+    def _drop_overlap_span(self, contents):
+        """Cut the start of this chunk's output that repeats the end of the previous chunk's, across topics if need be."""
+        joined = "\n".join(contents)
+        tail, self._previous_tail = self._previous_tail, _collapse_whitespace(joined[-MAX_OVERLAP_CHARS:])[0].rstrip()
+        head, positions = _collapse_whitespace(joined[:MAX_OVERLAP_CHARS])
+        overlap = longest_suffix_prefix(tail, head) if tail else 0
+        if overlap < MIN_OVERLAP_CHARS:
+            return contents
+
+        cut = positions[overlap - 1] + 1  # End of the repeated span in joined
+        trimmed = []
+        start = 0
+        for content in contents:
+            drop = min(max(cut - start, 0), len(content))
+            self.bytes_deduplicated += len(content[:drop].encode("utf-8"))
+            trimmed.append(content[drop:])
+            start += len(content) + 1
+        return trimmed
+
+    def add_chunk(self, topics, chunk_index=None, byte_range=(None, None)):
+        """Merge the topics extracted from the next chunk, in chunk order; byte_range is the chunk's span in the source."""
+        trimmed = self._drop_overlap_span(list(topics.values()))
+        for (topic, original), content in zip(topics.items(), trimmed):
+            existing, title, signature = self._find_topic(topic)
+            if existing is None:
+                if original.strip() and not content.strip():
+                    # Everything under this header was overlap already kept under another header
+                    continue
+                self._parts[topic] = [content]
+                self._register(topic, title, signature or minhash_signature(title))
+                self.chunk_ranges[topic] = [chunk_index, chunk_index, byte_range[0], byte_range[1]]
+            else:
+                self._titles.setdefault(title, existing)
+                self._parts[existing].append(content)
+                self.chunk_ranges[existing][1] = chunk_index
+                self.chunk_ranges[existing][3] = byte_range[1]
+
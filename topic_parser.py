@@ -0,0 +1,86 @@
+import logging
+
+from llm_client import iter_sse_events
+
+TOPIC_PREFIX = "Topic_"
+
+# Characters str.splitlines treats as line boundaries
+LINE_BREAKS = "\n\r\x0b\x0c\x1c\x1d\x1e\x85\u2028\u2029"
+
+
+class TopicStreamParser:
+    """Incremental parser for "Topic_" formatted completions.
+
+    Text can be fed in arbitrary fragments. Each finished section is returned
+    as a (topic, content) pair as soon as the next header arrives, and the
+    last one by close(). Body lines are collected in a list and joined once
+    per section, so parsing is linear in the size of the completion.
+    """
+
+    def __init__(self):
+        self._partial_line = ""
+        self._topic = None
+        self._lines = []
+
+    def _section(self):
+        return self._topic, "".join(line + "\n" for line in self._lines)
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if line.startswith(TOPIC_PREFIX):
+            finished = self._section() if self._topic is not None else None
+            self._topic = line
+            self._lines = []
+            return finished
+        if self._topic is not None:
+            self._lines.append(line)
+        return None
+
+    def feed(self, text):
+        """Consume a fragment of the completion and return the sections it finished."""
+        lines = (self._partial_line + text).splitlines(keepends=True)
+        self._partial_line = ""
+        # Hold back an unterminated line, and a trailing "\r" that may be the first half of "\r\n"
+        if lines and (lines[-1][-1] not in LINE_BREAKS or lines[-1].endswith("\r")):
+            self._partial_line = lines.pop()
+
+        finished = []
+        for line in lines:
+            section = self._parse_line(line)
+            if section:
+                finished.append(section)
+        return finished
+
+    def close(self):
+        """Flush the remaining text and return the final sections."""
+        finished = []
+        if self._partial_line:
+            section = self._parse_line(self._partial_line)
+            self._partial_line = ""
+            if section:
+                finished.append(section)
+        if self._topic is not None:
+            finished.append(self._section())
+            self._topic = None
+            self._lines = []
+        return finished
+
+
+def parse_extracted_content(content):
+    logging.info("Parsing extracted content into topics.")
+    parser = TopicStreamParser()
+    # A repeated header replaces the earlier section, as the dict assignment did before
+    topics = dict(parser.feed(content))
+    topics.update(parser.close())
+    return topics
+
+
+def iter_streamed_topics(lines):
+    """Yield (topic, content) pairs from the SSE lines of a streaming completion as each section finishes."""
+    parser = TopicStreamParser()
+    for event in iter_sse_events(lines):
+        for choice in event.get("choices", []):
+            delta = choice.get("delta", {}).get("content")
+            if delta:
+                yield from parser.feed(delta)
+    yield from parser.close()
@@ -0,0 +1,143 @@
+import os
+import json
+import uuid
+import logging
+import threading
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+TOPIC_OUTPUT_FORMATS = ("files", "jsonl", "parquet")
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+def get_writer(output_directory):
+    """Shared TopicWriter for a directory, so every caller sees the same index of used names."""
+    output_directory = os.path.abspath(output_directory)
+    with _writers_lock:
+        if output_directory not in _writers:
+            _writers[output_directory] = TopicWriter(output_directory)
+        return _writers[output_directory]
+
+
+class TopicWriter:
+    """Writes topic output into one directory atomically and with an in-memory index of used names.
+
+    The directory is listed once up front. After that, picking a unique
+    name for a repeated header such as Topic_Introduction costs a dict
+    lookup instead of one os.path.exists call per existing copy. A file
+    another process created since then is never overwritten; the output
+    moves on to the next free name instead.
+    """
+
+    def __init__(self, output_directory):
+        self.output_directory = output_directory
+        os.makedirs(output_directory, exist_ok=True)
+        self._lock = threading.Lock()
+        with os.scandir(output_directory) as entries:
+            self._used = {entry.name for entry in entries}
+        self._next_counter = {}  # base filename -> first counter not yet known to be taken
+        self._base_filenames = {}  # reserved filename -> the base filename it was derived from
+
+    def unique_filename(self, base_filename):
+        """Reserve base_filename, or base_N with the next free N, following the old get_unique_filename naming."""
+        with self._lock:
+            filename = base_filename
+            if filename in self._used:
+                stem, extension = os.path.splitext(base_filename)
+                counter = self._next_counter.get(base_filename, 1)
+                filename = f"{stem}_{counter}{extension}"
+                while filename in self._used:
+                    counter += 1
+                    filename = f"{stem}_{counter}{extension}"
+                self._next_counter[base_filename] = counter + 1
+            self._used.add(filename)
+            self._base_filenames[filename] = base_filename
+            return filename
+
+    def _link_no_clobber(self, temp_path, filepath):
+        """Give temp_path the name filepath, raising FileExistsError rather than replacing an existing file."""
+        try:
+            os.link(temp_path, filepath)
+            return
+        except FileExistsError:
+            raise
+        except OSError:
+            pass
+        # No hard links on this filesystem. Renaming leaves no empty placeholder visible under the final
+        # name, at the cost of a short window in which a file created after this check would be replaced.
+        if os.path.lexists(filepath):
+            raise FileExistsError(filepath)
+        os.replace(temp_path, filepath)
+
+    def _write_atomic(self, filename, write):
+        # Readers never see a half-written file: write a hidden temp file, then link it under the target name.
+        # Created with mode 0666 so the kernel applies the process umask, as for a plain open().
+        temp_path = os.path.join(self.output_directory, f".tmp-{uuid.uuid4().hex}")
+        descriptor = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(descriptor, 'wb') as file:
+                write(file)
+            while True:
+                filepath = os.path.join(self.output_directory, filename)
+                try:
+                    self._link_no_clobber(temp_path, filepath)
+                    break
+                except FileExistsError:
+                    # Created by another process after the directory was listed
+                    logging.info(f"{filename} already exists; writing to the next free name instead.")
+                    with self._lock:
+                        base_filename = self._base_filenames.get(filename, filename)
+                    filename = self.unique_filename(base_filename)
+        finally:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+        return filepath
+
+    def write_text(self, filename, text):
+        return self._write_atomic(filename, lambda file: file.write(text.encode('utf-8')))
+
+    def write_document(self, original_filename, topics, chunk_ranges=None, output_format="jsonl"):
+        """Write every topic of a document to one JSONL or Parquet file and return its path."""
+        chunk_ranges = chunk_ranges or {}
+        records = []
+        for topic, content in topics.items():
+            # Older two-element ranges have no byte offsets
+            chunk_start, chunk_end, byte_start, byte_end = (list(chunk_ranges.get(topic, ())) + [None] * 4)[:4]
+            records.append({
+                "topic": topic,
+                "source_file": original_filename,
+                "chunk_start": chunk_start,
+                "chunk_end": chunk_end,
+                "byte_start": byte_start,
+                "byte_end": byte_end,
+                "content": content,
+            })
+
+        if output_format == "jsonl":
+            def write(file):
+                for record in records:
+                    file.write(json.dumps(record, ensure_ascii=False).encode('utf-8') + b"\n")
+            return self._write_atomic(self.unique_filename(f"{original_filename}.topics.jsonl"), write)
+
+        if output_format == "parquet":
+            if pyarrow is None:
+                raise RuntimeError("Parquet output requires the pyarrow package.")
+            table = pyarrow.Table.from_pylist(records)
+            filename = self.unique_filename(f"{original_filename}.topics.parquet")
+            return self._write_atomic(filename, lambda file: pyarrow.parquet.write_table(table, file))
+
+        raise ValueError(f"Unknown topic output format '{output_format}'. Choose from: {', '.join(TOPIC_OUTPUT_FORMATS)}")
+
+    def remove(self, filepath):
+        """Delete a previous output and free its name."""
+        if os.path.exists(filepath):
+            os.remove(filepath)
+        with self._lock:
+            self._used.discard(os.path.basename(filepath))
+        logging.info(f"Removed stale output {filepath}")